@@ -22,6 +22,21 @@ struct BoneWeight {
 	float weight;
 };
 
+struct GeometryBuf {
+	/* Caller-allocated arrays filled by getShapeGeometry. Any pointer may be null, in
+	   which case that part of the geometry is skipped. */
+	uint16_t bufSize = sizeof(GeometryBuf);
+	int vertexCount = 0; // Elements in verts, normals, uvs, colors; 4x this in weights
+	int triangleCount = 0; // Elements in tris
+	nifly::Vector3* verts = nullptr;
+	nifly::Vector3* normals = nullptr;
+	nifly::Vector2* uvs = nullptr;
+	nifly::Triangle* tris = nullptr;
+	nifly::Color4* colors = nullptr;
+	uint16_t* weightBones = nullptr; // 4 per vertex, index into the shape's bone list
+	float* weights = nullptr; // 4 per vertex, 1:1 with weightBones
+};
+
 /* ********************* STRUCTURES ***************** */
 
 enum BUFFER_TYPES : uint16_t {
@@ -385,6 +385,32 @@ NIFLY_API int getBlockname(void* nifref, int blockID, char* buf, int buflen)
     return int(namelen);
 }
 
+NIFLY_API int getBlockNames(void* nifref, char* buf, int buflen)
+/*
+    Return the blocknames of all blocks in the nif, in block ID order, separated by \n.
+    Missing blocks are returned as empty names so positions match block IDs.
+    buf = buffer to receive the list. May be null to get the required length.
+    Returns the length of the full list.
+*/
+{
+    NifFile* nif = static_cast<NifFile*>(nifref);
+    NiHeader* hdr = &nif->GetHeader();
+
+    std::string s = "";
+    for (uint32_t i = 0; i < hdr->GetNumBlocks(); i++) {
+        if (i > 0) s += "\n";
+        NiObject* theNode = hdr->GetBlock<NiObject>(i);
+        if (theNode) s += theNode->GetBlockName();
+    }
+    if (buf && buflen > 0) {
+        int copylen = std::min((int)buflen - 1, (int)s.length());
+        s.copy(buf, copylen, 0);
+        buf[copylen] = '\0';
+    };
+
+    return(int(s.length()));
+}
+
 NIFLY_API int getNodeBlockname(void* node, char* buf, int buflen) 
 /* Return the blockname of the given NiObject. */
 {
@@ -907,6 +933,91 @@ NIFLY_API int getUVs(void* theNif, void* theShape, Vector2* buf, int len, int st
     return int(uv->size());
 }
 
+NIFLY_API int getShapeGeometry(void* theNif, void* theShape, GeometryBuf* buf)
+/*
+    Get a shape's geometry in one call, rather than one call per element.
+    buf = GeometryBuf holding caller-allocated arrays. Null arrays are skipped.
+        verts, normals, uvs, colors hold vertexCount elements.
+        tris holds triangleCount elements.
+        weightBones, weights hold 4 * vertexCount elements. Each vertex gets its 4 
+        heaviest bone weights; unused slots are 0.
+    Returns number of verts in the shape, or -1 if the buffer is bad.
+    */
+{
+    NifFile* nif = static_cast<NifFile*>(theNif);
+    nifly::NiShape* shape = static_cast<nifly::NiShape*>(theShape);
+
+    if (buf->bufSize != sizeof(GeometryBuf)) {
+        niflydll::LogWriteEf("%s called with bad buffer: size=%d.", __FUNCTION__, buf->bufSize);
+        return -1;
+    }
+
+    std::vector<nifly::Vector3> verts;
+    nif->GetVertsForShape(shape, verts);
+    int vertCount = std::min(buf->vertexCount, int(verts.size()));
+
+    if (buf->verts)
+        std::copy(verts.begin(), verts.begin() + vertCount, buf->verts);
+
+    if (buf->normals) {
+        const std::vector<nifly::Vector3>* norms = nif->GetNormalsForShape(shape);
+        if (norms)
+            std::copy(norms->begin(),
+                norms->begin() + std::min(vertCount, int(norms->size())),
+                buf->normals);
+    }
+
+    if (buf->uvs) {
+        const std::vector<nifly::Vector2>* uv = nif->GetUvsForShape(shape);
+        if (uv)
+            std::copy(uv->begin(),
+                uv->begin() + std::min(vertCount, int(uv->size())),
+                buf->uvs);
+    }
+
+    if (buf->tris) {
+        std::vector<nifly::Triangle> shapeTris;
+        shape->GetTriangles(shapeTris);
+        std::copy(shapeTris.begin(),
+            shapeTris.begin() + std::min(buf->triangleCount, int(shapeTris.size())),
+            buf->tris);
+    }
+
+    if (buf->colors) {
+        const std::vector<Color4>* theColors = nif->GetColorsForShape(shape->name.get());
+        if (theColors)
+            std::copy(theColors->begin(),
+                theColors->begin() + std::min(vertCount, int(theColors->size())),
+                buf->colors);
+    }
+
+    if (buf->weightBones && buf->weights) {
+        std::fill(buf->weightBones, buf->weightBones + 4 * buf->vertexCount, uint16_t(0));
+        std::fill(buf->weights, buf->weights + 4 * buf->vertexCount, 0.0f);
+
+        std::vector<int> boneIDs;
+        int boneCount = nif->GetShapeBoneIDList(shape, boneIDs);
+        for (int boneIndex = 0; boneIndex < boneCount; boneIndex++) {
+            std::unordered_map<uint16_t, float> boneWeights;
+            nif->GetShapeBoneWeights(shape, boneIndex, boneWeights);
+            for (const auto& [vert, weight] : boneWeights) {
+                if (vert >= vertCount) continue;
+                // Replace the lightest slot if this weight is heavier
+                float* vw = buf->weights + 4 * vert;
+                int minIndex = 0;
+                for (int j = 1; j < 4; j++)
+                    if (vw[j] < vw[minIndex]) minIndex = j;
+                if (weight > vw[minIndex]) {
+                    vw[minIndex] = weight;
+                    buf->weightBones[4 * vert + minIndex] = uint16_t(boneIndex);
+                }
+            }
+        }
+    }
+
+    return int(verts.size());
+}
+
 int setShapeFromBuf(NifFile* nif, NiShape* theShape, NiShapeBuf* buf)
 /* Set the properties of the NiShape (or subclass) according to the given buffer. */
 {
@@ -1349,6 +1460,53 @@ NIFLY_API void setShapeBoneWeights(void* nifref, void* shaperef, const char* bon
     }
 }
 
+NIFLY_API void setShapeWeightsBulk(void* nifref, void* shaperef, int vertCount,
+    const uint16_t* weightBones, const float* weights)
+/*
+    Set the bone weights for every vertex of a shape in one call.
+    weightBones = 4 per vertex, index into the shape's bone list.
+    weights = 4 per vertex, 1:1 with weightBones. Slots with 0 weight are ignored.
+    All bones must have been added to the shape already.
+*/
+{
+    NifFile* nif = static_cast<NifFile*>(nifref);
+    NiShape* shape = static_cast<NiShape*>(shaperef);
+    std::vector<int> boneIDs;
+    int boneCount = nif->GetShapeBoneIDList(shape, boneIDs);
+
+    auto bsTriShape = dynamic_cast<BSTriShape*>(shape);
+    if (bsTriShape) {
+        for (int i = 0; i < std::min(vertCount, int(bsTriShape->vertData.size())); i++) {
+            auto& vertex = bsTriShape->vertData[i];
+            for (int j = 0; j < 4; j++) {
+                uint16_t bone = weightBones[4 * i + j];
+                float weight = weights[4 * i + j];
+                if (weight > 0 && bone < boneCount) {
+                    vertex.weightBones[j] = uint8_t(bone);
+                    vertex.weights[j] = weight;
+                }
+                else {
+                    vertex.weightBones[j] = 0;
+                    vertex.weights[j] = 0.0f;
+                }
+            }
+        }
+    }
+    else {
+        std::vector<std::unordered_map<uint16_t, float>> boneWeights(boneCount);
+        for (int i = 0; i < vertCount; i++) {
+            for (int j = 0; j < 4; j++) {
+                uint16_t bone = weightBones[4 * i + j];
+                float weight = weights[4 * i + j];
+                if (weight > 0 && bone < boneCount) 
+                    boneWeights[bone][uint16_t(i)] = weight;
+            }
+        }
+        for (int bone = 0; bone < boneCount; bone++)
+            nif->SetShapeBoneWeights(shape->name.get(), bone, boneWeights[bone]);
+    }
+}
+
 NIFLY_API void setShapeBoneIDList(void* theFile, void* shapeRef, int* boneIDList, int listLen)
 {
     NifFile* nif = static_cast<NifFile*>(theFile);
@@ -4250,6 +4408,249 @@ NIFLY_API void addAnimKeyQuadTrans(void* nifref, int tdID, NiAnimKeyQuadTransBuf
     }
 }
 
+/* Bulk key reads. Each copies up to 'count' keys starting at 'start' into buf and
+   returns the number copied, or -1 if the block isn't the right type. Reading a whole
+   track this way avoids one call--and one header lookup--per key. */
+
+NiAnimationKeyGroup<float>* xyzKeyGroup(nifly::NiTransformData* td, char dimension) {
+    if (dimension == 'X') return &td->xRotations;
+    if (dimension == 'Y') return &td->yRotations;
+    if (dimension == 'Z') return &td->zRotations;
+    if (dimension == 'S') return &td->scales;
+    return nullptr;
+}
+
+NIFLY_API int getAnimKeysQuadXYZ(void* nifref, int tdID, char dimension, int start, int count, NiAnimKeyQuadXYZBuf* buf)
+{
+    NifFile* nif = static_cast<NifFile*>(nifref);
+    NiHeader* hdr = &nif->GetHeader();
+    nifly::NiTransformData* td = hdr->GetBlock<NiTransformData>(tdID);
+    if (!td) {
+        niflydll::LogWriteEf("getAnimKeysQuadXYZ called on invalid node %d", tdID);
+        return -1;
+    }
+    NiAnimationKeyGroup<float>* keys = xyzKeyGroup(td, dimension);
+    if (!keys) return -1;
+
+    int n = 0;
+    for (uint32_t i = start; i < keys->GetNumKeys() && n < count; i++, n++)
+        readKey(buf[n], keys->GetKey(i));
+    return n;
+}
+
+NIFLY_API int getAnimKeysLinearXYZ(void* nifref, int tdID, char dimension, int start, int count, NiAnimKeyLinearXYZBuf* buf)
+{
+    NifFile* nif = static_cast<NifFile*>(nifref);
+    NiHeader* hdr = &nif->GetHeader();
+    nifly::NiTransformData* td = hdr->GetBlock<NiTransformData>(tdID);
+    if (!td) {
+        niflydll::LogWriteEf("getAnimKeysLinearXYZ called on invalid node %d", tdID);
+        return -1;
+    }
+    NiAnimationKeyGroup<float>* keys = xyzKeyGroup(td, dimension);
+    if (!keys) return -1;
+
+    int n = 0;
+    for (uint32_t i = start; i < keys->GetNumKeys() && n < count; i++, n++) {
+        auto k = keys->GetKey(i);
+        buf[n].time = k.time;
+        buf[n].value = k.value;
+    }
+    return n;
+}
+
+NIFLY_API int getAnimKeysQuadFloat(void* nifref, int tdID, int start, int count, NiAnimKeyQuadXYZBuf* buf)
+{
+    NifFile* nif = static_cast<NifFile*>(nifref);
+    NiHeader* hdr = &nif->GetHeader();
+    nifly::NiFloatData* fd = hdr->GetBlock<NiFloatData>(tdID);
+    if (!fd) {
+        niflydll::LogWriteEf("getAnimKeysQuadFloat called on invalid node %d", tdID);
+        return -1;
+    }
+
+    int n = 0;
+    for (uint32_t i = start; i < fd->data.GetNumKeys() && n < count; i++, n++)
+        readKey(buf[n], fd->data.GetKey(i));
+    return n;
+}
+
+NIFLY_API int getAnimKeysLinearQuat(void* nifref, int tdID, int start, int count, NiAnimKeyLinearQuatBuf* buf)
+{
+    NifFile* nif = static_cast<NifFile*>(nifref);
+    NiHeader* hdr = &nif->GetHeader();
+    nifly::NiTransformData* td = hdr->GetBlock<NiTransformData>(tdID);
+    if (!td) {
+        niflydll::LogWriteEf("getAnimKeysLinearQuat called on invalid node %d", tdID);
+        return -1;
+    }
+
+    int n = 0;
+    for (size_t i = start; i < td->quaternionKeys.size() && n < count; i++, n++) {
+        auto& k = td->quaternionKeys[i];
+        buf[n].time = k.time;
+        buf[n].value[0] = k.value.w;
+        buf[n].value[1] = k.value.x;
+        buf[n].value[2] = k.value.y;
+        buf[n].value[3] = k.value.z;
+    }
+    return n;
+}
+
+NIFLY_API int getAnimKeysLinearTrans(void* nifref, int tdID, int start, int count, NiAnimKeyLinearTransBuf* buf)
+{
+    NifFile* nif = static_cast<NifFile*>(nifref);
+    NiHeader* hdr = &nif->GetHeader();
+    nifly::NiTransformData* td = hdr->GetBlock<NiTransformData>(tdID);
+    if (!td) {
+        niflydll::LogWriteEf("getAnimKeysLinearTrans called on invalid node %d", tdID);
+        return -1;
+    }
+
+    int n = 0;
+    for (uint32_t i = start; i < td->translations.GetNumKeys() && n < count; i++, n++) {
+        auto k = td->translations.GetKey(i);
+        buf[n].time = k.time;
+        for (int j = 0; j < 3; j++) buf[n].value[j] = k.value[j];
+    }
+    return n;
+}
+
+NIFLY_API int getAnimKeysQuadTrans(void* nifref, int tdID, int start, int count, NiAnimKeyQuadTransBuf* buf)
+/* Works on NiTransformData translations and NiPosData. */
+{
+    NifFile* nif = static_cast<NifFile*>(nifref);
+    NiHeader* hdr = &nif->GetHeader();
+    NiAnimationKeyGroup<Vector3>* keys = nullptr;
+    nifly::NiTransformData* td = hdr->GetBlock<NiTransformData>(tdID);
+    if (td) keys = &td->translations;
+    nifly::NiPosData* pd = hdr->GetBlock<NiPosData>(tdID);
+    if (pd) keys = &pd->data;
+    if (!keys) {
+        niflydll::LogWriteEf("getAnimKeysQuadTrans called on invalid node %d", tdID);
+        return -1;
+    }
+
+    int n = 0;
+    for (uint32_t i = start; i < keys->GetNumKeys() && n < count; i++, n++) {
+        auto k = keys->GetKey(i);
+        buf[n].time = k.time;
+        for (int j = 0; j < 3; j++) buf[n].value[j] = k.value[j];
+        for (int j = 0; j < 3; j++) buf[n].forward[j] = k.forward[j];
+        for (int j = 0; j < 3; j++) buf[n].backward[j] = k.backward[j];
+    }
+    return n;
+}
+
+/* Bulk key writes. Each appends 'count' keys from buf to the block and returns the
+   number added, or -1 if the block isn't the right type. Keys must be in time order. */
+
+NIFLY_API int addAnimKeysQuadXYZ(void* nifref, int tdID, char dimension, int count, NiAnimKeyQuadXYZBuf* buf)
+{
+    NifFile* nif = static_cast<NifFile*>(nifref);
+    NiHeader* hdr = &nif->GetHeader();
+    nifly::NiTransformData* td = hdr->GetBlock<NiTransformData>(tdID);
+    if (!td) {
+        niflydll::LogWriteEf("addAnimKeysQuadXYZ called on invalid node %d", tdID);
+        return -1;
+    }
+    NiAnimationKeyGroup<float>* keys = xyzKeyGroup(td, dimension);
+    if (!keys) return -1;
+
+    for (int i = 0; i < count; i++) {
+        NiAnimationKey<float> k;
+        setKey(k, buf[i]);
+        keys->AddKey(k);
+    }
+    return count;
+}
+
+NIFLY_API int addAnimKeysQuadFloat(void* nifref, int dataBlockID, int count, NiAnimKeyQuadXYZBuf* buf)
+{
+    NifFile* nif = static_cast<NifFile*>(nifref);
+    NiHeader* hdr = &nif->GetHeader();
+    nifly::NiFloatData* fd = hdr->GetBlock<NiFloatData>(dataBlockID);
+    if (!fd) {
+        niflydll::LogWriteEf("addAnimKeysQuadFloat called on invalid node %d", dataBlockID);
+        return -1;
+    }
+
+    for (int i = 0; i < count; i++) {
+        NiAnimationKey<float> k;
+        setKey(k, buf[i]);
+        fd->data.AddKey(k);
+    }
+    return count;
+}
+
+NIFLY_API int addAnimKeysLinearQuat(void* nifref, int tdID, int count, NiAnimKeyLinearQuatBuf* buf)
+{
+    NifFile* nif = static_cast<NifFile*>(nifref);
+    NiHeader* hdr = &nif->GetHeader();
+    nifly::NiTransformData* td = hdr->GetBlock<NiTransformData>(tdID);
+    if (!td) {
+        niflydll::LogWriteEf("addAnimKeysLinearQuat called on invalid node %d", tdID);
+        return -1;
+    }
+
+    td->quaternionKeys.reserve(td->quaternionKeys.size() + count);
+    for (int i = 0; i < count; i++) {
+        NiAnimationKey<Quaternion> k;
+        k.time = buf[i].time;
+        k.value.w = buf[i].value[0];
+        k.value.x = buf[i].value[1];
+        k.value.y = buf[i].value[2];
+        k.value.z = buf[i].value[3];
+        td->quaternionKeys.push_back(k);
+    }
+    return count;
+}
+
+NIFLY_API int addAnimKeysLinearTrans(void* nifref, int tdID, int count, NiAnimKeyLinearTransBuf* buf)
+{
+    NifFile* nif = static_cast<NifFile*>(nifref);
+    NiHeader* hdr = &nif->GetHeader();
+    nifly::NiTransformData* td = hdr->GetBlock<NiTransformData>(tdID);
+    if (!td) {
+        niflydll::LogWriteEf("addAnimKeysLinearTrans called on invalid node %d", tdID);
+        return -1;
+    }
+
+    for (int i = 0; i < count; i++) {
+        nifly::NiAnimationKey<Vector3> k;
+        k.time = buf[i].time;
+        for (int j = 0; j < 3; j++) k.value[j] = buf[i].value[j];
+        td->translations.AddKey(k);
+    }
+    return count;
+}
+
+NIFLY_API int addAnimKeysQuadTrans(void* nifref, int tdID, int count, NiAnimKeyQuadTransBuf* buf)
+/* Works on NiTransformData translations and NiPosData. */
+{
+    NifFile* nif = static_cast<NifFile*>(nifref);
+    NiHeader* hdr = &nif->GetHeader();
+    NiAnimationKeyGroup<Vector3>* keys = nullptr;
+    nifly::NiTransformData* td = hdr->GetBlock<NiTransformData>(tdID);
+    if (td) keys = &td->translations;
+    nifly::NiPosData* pd = hdr->GetBlock<NiPosData>(tdID);
+    if (pd) keys = &pd->data;
+    if (!keys) {
+        niflydll::LogWriteEf("addAnimKeysQuadTrans called on invalid node %d", tdID);
+        return -1;
+    }
+
+    for (int i = 0; i < count; i++) {
+        nifly::NiAnimationKey<Vector3> k;
+        k.time = buf[i].time;
+        for (int j = 0; j < 3; j++) k.value[j] = buf[i].value[j];
+        for (int j = 0; j < 3; j++) k.forward[j] = buf[i].forward[j];
+        for (int j = 0; j < 3; j++) k.backward[j] = buf[i].backward[j];
+        keys->AddKey(k);
+    }
+    return count;
+}
+
 
 NIFLY_API int getTransformDataValues(void* nifref, int nodeIndex, 
     NiAnimationKeyQuatBuf* qBuf, 
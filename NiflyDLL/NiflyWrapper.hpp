@@ -43,9 +43,11 @@ extern "C" NIFLY_API void getTransform(void* theShape, float* buf);
 extern "C" NIFLY_API void getNodeTransform(void* theNode, nifly::MatTransform* buf);
 extern "C" NIFLY_API int getNodeTransformToGlobal(void* nifref, const char* nodeName, nifly::MatTransform* buf);
 extern "C" NIFLY_API int getUVs(void* theNif, void* theShape, nifly::Vector2* buf, int len, int start);
+extern "C" NIFLY_API int getShapeGeometry(void* theNif, void* theShape, GeometryBuf* buf);
 extern "C" NIFLY_API int getNodeCount(void* theNif);
 extern "C" NIFLY_API void getNodes(void* theNif, void** buf);
 extern "C" NIFLY_API int getBlockname(void* nifref, int blockID, char* buf, int buflen);
+extern "C" NIFLY_API int getBlockNames(void* nifref, char* buf, int buflen);
 extern "C" NIFLY_API int getNodeBlockname(void* node, char* buf, int buflen);
 extern "C" NIFLY_API int getNodeFlags(void* node);
 extern "C" NIFLY_API void setNodeFlags(void* node, int theFlags);
@@ -79,6 +81,7 @@ extern "C" NIFLY_API void skinShape(void* f, void* shapeRef);
 extern "C" NIFLY_API void setShapeVertWeights(void* theFile, void* theShape, int vertIdx, const uint8_t * vertex_bones, const float* vertex_weights);
 extern "C" NIFLY_API void setShapeBoneWeightsFlex(void* nifref, void* shaperef, const char* boneName, VertexWeightPair * vertWeightsIn, int vertWeightLen);
 extern "C" NIFLY_API void setShapeBoneWeights(void* theFile, void* theShape, const char* boneName, VertexWeightPair * weights, int weightsLen);
+extern "C" NIFLY_API void setShapeWeightsBulk(void* nifref, void* shaperef, int vertCount, const uint16_t* weightBones, const float* weights);
 extern "C" NIFLY_API void setShapeBoneIDList(void* f, void* shapeRef, int* boneIDList, int listLen);
 extern "C" NIFLY_API int saveNif(void* the_nif, const char8_t* filename);
 extern "C" NIFLY_API int segmentCount(void* nifref, void* shaperef);
@@ -156,6 +159,17 @@ extern "C" NIFLY_API void getAnimKeyLinearTrans(void* nifref, int tdID, int fram
 extern "C" NIFLY_API void getAnimKeyQuadTrans(void* nifref, int tdID, int frame, NiAnimKeyQuadTransBuf * buf);
 extern "C" NIFLY_API void addAnimKeyQuadTrans(void* nifref, int tdID, NiAnimKeyQuadTransBuf* buf);
 extern "C" NIFLY_API void addAnimKeyLinearTrans(void* nifref, int tdID, NiAnimKeyLinearTransBuf * buf);
+extern "C" NIFLY_API int getAnimKeysQuadXYZ(void* nifref, int tdID, char dimension, int start, int count, NiAnimKeyQuadXYZBuf * buf);
+extern "C" NIFLY_API int getAnimKeysLinearXYZ(void* nifref, int tdID, char dimension, int start, int count, NiAnimKeyLinearXYZBuf * buf);
+extern "C" NIFLY_API int getAnimKeysQuadFloat(void* nifref, int tdID, int start, int count, NiAnimKeyQuadXYZBuf * buf);
+extern "C" NIFLY_API int getAnimKeysLinearQuat(void* nifref, int tdID, int start, int count, NiAnimKeyLinearQuatBuf * buf);
+extern "C" NIFLY_API int getAnimKeysLinearTrans(void* nifref, int tdID, int start, int count, NiAnimKeyLinearTransBuf * buf);
+extern "C" NIFLY_API int getAnimKeysQuadTrans(void* nifref, int tdID, int start, int count, NiAnimKeyQuadTransBuf * buf);
+extern "C" NIFLY_API int addAnimKeysQuadXYZ(void* nifref, int tdID, char dimension, int count, NiAnimKeyQuadXYZBuf * buf);
+extern "C" NIFLY_API int addAnimKeysQuadFloat(void* nifref, int dataBlockID, int count, NiAnimKeyQuadXYZBuf * buf);
+extern "C" NIFLY_API int addAnimKeysLinearQuat(void* nifref, int tdID, int count, NiAnimKeyLinearQuatBuf * buf);
+extern "C" NIFLY_API int addAnimKeysLinearTrans(void* nifref, int tdID, int count, NiAnimKeyLinearTransBuf * buf);
+extern "C" NIFLY_API int addAnimKeysQuadTrans(void* nifref, int tdID, int count, NiAnimKeyQuadTransBuf * buf);
 extern "C" NIFLY_API int getTransformDataValues(void* nifref, int nodeIndex,
 	NiAnimationKeyQuatBuf * qBuf,
 	NiAnimationKeyFloatBuf * xRotBuf,
@@ -1686,6 +1686,49 @@ namespace NiflyDLLTests
 
 			Assert::IsTrue(colors3[561].r == 0);
 		};
+		TEST_METHOD(shapeGeometry) {
+			/* Can get all of a shape's geometry in one call */
+			std::filesystem::path testfile = testRoot / "FO4/HeadGear1.nif";
+
+			void* nif;
+			void* shapes[10];
+			nif = load(testfile.u8string().c_str());
+			getShapes(nif, shapes, 10, 0);
+
+			int shapeID = getBlockID(nif, shapes[0]);
+			NiShapeBuf shapeBuf;
+			getBlock(nif, shapeID, &shapeBuf);
+
+			GeometryBuf geom;
+			geom.vertexCount = shapeBuf.vertexCount;
+			geom.triangleCount = shapeBuf.triangleCount;
+			geom.verts = new Vector3[shapeBuf.vertexCount];
+			geom.normals = new Vector3[shapeBuf.vertexCount];
+			geom.uvs = new Vector2[shapeBuf.vertexCount];
+			geom.tris = new Triangle[shapeBuf.triangleCount];
+			geom.colors = new Color4[shapeBuf.vertexCount];
+			geom.weightBones = new uint16_t[shapeBuf.vertexCount * 4];
+			geom.weights = new float[shapeBuf.vertexCount * 4];
+			int vertLen = getShapeGeometry(nif, shapes[0], &geom);
+			Assert::AreEqual(int(shapeBuf.vertexCount), vertLen);
+
+			// Results match the separate calls
+			Vector3* verts = new Vector3[shapeBuf.vertexCount];
+			Color4* colors = new Color4[shapeBuf.vertexCount];
+			Triangle* tris = new Triangle[shapeBuf.triangleCount];
+			getVertsForShape(nif, shapes[0], verts, shapeBuf.vertexCount * 3, 0);
+			getColorsForShape(nif, shapes[0], colors, shapeBuf.vertexCount * 4);
+			getTriangles(nif, shapes[0], tris, shapeBuf.triangleCount * 3, 0);
+
+			Assert::IsTrue(TApproxEqual(verts[10], geom.verts[10]));
+			Assert::IsTrue(colors[561].r == geom.colors[561].r);
+			Assert::IsTrue(tris[5].p2 == geom.tris[5].p2);
+
+			// Weights for each vertex sum to 1
+			float wsum = 0;
+			for (int i = 0; i < 4; i++) wsum += geom.weights[4 * 10 + i];
+			Assert::IsTrue(TApproxEqual(1.0, wsum));
+		};
 		struct GunBuf {
 			void* handle;
 			int id;
@@ -9,6 +9,7 @@ import logging
 from ctypes import Structure, c_bool, c_char, c_float, c_uint8, c_uint32
 from pathlib import Path
 import pynifly
+import nifbatch
 from nifdefs import ShaderFlags1, ShaderFlags2
 
 # targetFolder = r"C:\Modding\SkyrimLE\mods\00 Vanilla Assets\meshes"
@@ -36,13 +37,7 @@ def TestNif(nif:pynifly.NifFile):
 
 def WalkTree(folder_path):
     """Return all nif files in a directory tree, recursively."""
-    for root, directories, files in os.walk(folder_path):
-        excl = [x for x in targetExcludes if root.startswith(x)]
-        if not excl:
-            for filename in files:
-                if os.path.splitext(filename)[1].upper() == '.NIF':
-                    file_path = os.path.join(root, filename)
-                    yield file_path
+    return nifbatch.walk_nifs(folder_path, targetExcludes)
 
 def FileExistsInPaths(fn, rootlist):
     """Determine whether the given file exists in any of the given mod roots."""
@@ -66,43 +61,41 @@ def FileExistsInPaths(fn, rootlist):
 
 
 def PrintNifs(fp):
-    """Find all nifs that match criteria."""
-    targ = Path(fp)
+    """Find all nifs that match criteria. Nifs are checked in parallel."""
     counter = 0
     foundcount = 0
-    foundlist = []
-    for f in WalkTree(fp):
+    for r in nifbatch.scan(fp, TestNif, excludes=targetExcludes):
         if counter % 1000 == 0 and counter > 0:
-            print(f"...Checking [{counter}] {os.path.split(f)[0]}")
-        try:
-            b, n = TestNif(pynifly.NifFile(f))
+            print(f"...Checking [{counter}] {os.path.split(r.filepath)[0]}")
+        if r.error:
+            pynlog.debug(r.filepath + ": " + r.error)
+        else:
+            b, n = r.value
             if b:
-                # foundlist.append((f, n, ))
-                print(f, n)
+                print(r.filepath, n)
                 foundcount += 1
-        except Exception as e:
-            pynlog.debug(f + ": " + str(e))
         counter += 1
     print(f"Done. Found {foundcount} in {counter} files")
     # for f, n in foundlist:
     #     print(f, n)
 
 
-pynlog = logging.getLogger("pynifly")
-pynlog.addHandler(logging.FileHandler('findnifs.log'))
-
+# Worker processes import this module too, so only scan from the main process.
+if __name__ == "__main__":
+    pynlog = logging.getLogger("pynifly")
+    pynlog.addHandler(logging.FileHandler('findnifs.log'))
 
-# Load from install location
-py_addon_path = os.path.dirname(os.path.realpath(__file__))
-if py_addon_path not in sys.path:
-    sys.path.append(py_addon_path)
-dev_path = os.path.join(py_addon_path, "NiflyDLL.dll")
+    # Load from install location
+    py_addon_path = os.path.dirname(os.path.realpath(__file__))
+    if py_addon_path not in sys.path:
+        sys.path.append(py_addon_path)
+    dev_path = os.path.join(py_addon_path, "NiflyDLL.dll")
 
-dev_path = r"PyNifly\NiflyDLL\x64\Debug\NiflyDLL.dll"
-pynifly.NifFile.Load(os.path.join(os.environ['PYNIFLY_DEV_ROOT'], dev_path))
+    dev_path = r"PyNifly\NiflyDLL\x64\Debug\NiflyDLL.dll"
+    pynifly.NifFile.Load(os.path.join(os.environ['PYNIFLY_DEV_ROOT'], dev_path))
 
-# pynlog.addHandler(LoggerListHandler)
+    # pynlog.addHandler(LoggerListHandler)
 
-PrintNifs(targetFolder)
+    PrintNifs(targetFolder)
 
-print("Done")
\ No newline at end of file
+    print("Done")
\ No newline at end of file
@@ -1,6 +1,17 @@
 import os
+import logging
 
 from pynifly import *
+import nifbatch
+
+pynlog = logging.getLogger("pynifly")
+
+walkExcludes = [r'\facegendata', r'\precombined', r'\architecture', r'\interiors',
+                r'\landscape', r'\scol']
+
+def ShapeMaterials(nif):
+    """Return (shape name, shader name) for every shape in the nif that has a shader name."""
+    return [(s.name, s.shader_name) for s in nif.shapes if s.shader_name]
 
 if __name__ == "__main__":
     import codecs
@@ -13,17 +24,10 @@ if __name__ == "__main__":
     walkroot = r"C:\Modding\Fallout4\mods\00 FO4 Assets\Meshes"
     with open('bgsm.csv', 'w') as outfile:
         print("Filepath,Shape,BGSM,", file=outfile)
-        for root, dirlist, flist in os.walk(walkroot):
-            if not r'\facegendata' in root.lower() \
-               and not r'\precombined' in root.lower() \
-               and not r'\architecture' in root.lower() \
-               and not r'\interiors' in root.lower() \
-               and not r'\landscape' in root.lower() \
-               and not r'\scol' in root.lower():
-                for f in filter(lambda x: x.lower().endswith('.nif'), flist):
-                    fp = os.path.join(root, f)
-                    n = NifFile(fp)
-                    for s in n.shapes:
-                        if s.shader_name:
-                            print(fp[len(walkroot)+1:] + "," + s.name + "," + s.shader_name, file=outfile)
-                    i += 1
+        for r in nifbatch.scan(walkroot, ShapeMaterials, excludes=walkExcludes):
+            if r.error:
+                pynlog.error(r.filepath + ": " + r.error)
+            elif r.value:
+                for shape_name, shader_name in r.value:
+                    print(r.filepath[len(walkroot)+1:] + "," + shape_name + "," + shader_name, file=outfile)
+            i += 1
@@ -58,6 +58,12 @@ import xmltools
 
 # Blender libraries
 import bpy
+try:
+    import numpy as np
+except ImportError:
+    # numpy ships with Blender but may be missing in a bare python install. Meshes are
+    # read element by element without it.
+    np = None
 import bpy_types
 from bpy.props import (
         BoolProperty,
@@ -1909,8 +1915,6 @@ def create_shape_keys(obj, tri: TriFile):
         newsk.name = "Basis"
         mesh.update()
 
-    base_verts = tri.vertices
-
     dict = None
     obj_arma = [m.object for m in obj.modifiers if m.type == 'ARMATURE']
     if obj_arma:
@@ -1918,7 +1922,7 @@ def create_shape_keys(obj, tri: TriFile):
         if g != "":
             dict = gameSkeletons[g]
 
-    for game_morph_name, morph_verts in sorted(tri.morphs.items()):
+    for game_morph_name in sorted(tri.morphs.keys()):
         if dict and game_morph_name in dict.morph_dic_blender:
             morph_name = dict.morph_dic_blender[game_morph_name]
         else:
@@ -1931,13 +1935,12 @@ def create_shape_keys(obj, tri: TriFile):
             #This is a pointer, not a copy
             mesh_key_verts = mesh.shape_keys.key_blocks[obj.active_shape_key_index].data
             # We may be applying the morphs to a different shape than the one stored in 
-            # the tri file. But the morphs in the tri file are absolute locations, as are 
-            # shape key locations. So we need to calculate the offset in the tri and apply that 
-            # to our shape keys.
-            for key_vert, morph_vert, base_vert in zip(mesh_key_verts, morph_verts, base_verts):
-                key_vert.co[0] += morph_vert[0] - base_vert[0]
-                key_vert.co[1] += morph_vert[1] - base_vert[1]
-                key_vert.co[2] += morph_vert[2] - base_vert[2]
+            # the tri file. So apply the morph's offsets from the tri's base shape to our
+            # shape keys.
+            for key_vert, offsets in zip(mesh_key_verts, tri.morphs.offsets(game_morph_name)):
+                key_vert.co[0] += offsets[0]
+                key_vert.co[1] += offsets[1]
+                key_vert.co[2] += offsets[2]
         
             mesh.update()
 
@@ -2449,12 +2452,42 @@ def has_uniform_scale(obj):
     return NearEqual(obj.scale[0], obj.scale[1]) and NearEqual(obj.scale[1], obj.scale[2])
 
 
+def vert_locations(data, sf):
+    """Return the locations of a collection of vertices or shape key points, multiplied
+    by the scale vector sf. Returns an (n, 3) array if numpy is available.
+    """
+    if np is not None:
+        co = np.empty(len(data) * 3, dtype=np.float32)
+        data.foreach_get('co', co)
+        return co.reshape(-1, 3) * np.array(sf[:], dtype=np.float32)
+    return [(v.co * sf)[:] for v in data]
+
+
+def vertex_weight_table(obj, mesh):
+    """Return the mesh's vertex group weights as a VertexWeights table."""
+    counts = np.zeros(len(mesh.vertices), dtype=np.int64)
+    groups = []
+    weights = []
+    # Vertex groups can't be read with foreach_get, so walk them once into flat lists.
+    for i, v in enumerate(mesh.vertices):
+        vgs = v.groups
+        counts[i] = len(vgs)
+        for vg in vgs:
+            groups.append(vg.group)
+            weights.append(vg.weight)
+    return VertexWeights.from_counts(counts, groups, weights, 
+                                     [g.name for g in obj.vertex_groups])
+
+
 def extract_vert_info(obj, mesh, arma, target_key='', scale_factor=1.0):
     """Returns 3 lists of equal length with one entry each for each vertex
     *   verts = [(x, y, z)... ] - base or as modified by target-key if provided
     *   weights = [{group-name: weight}... ] - 1:1 with verts list
     *   dict = {shape-key: [verts...], ...} - verts list for each shape which is valid for export.
             shape-key is the blender name.
+    If numpy is available the vert lists are (n, 3) arrays and weights is a VertexWeights
+    table holding all the vertex's groups. The 4 heaviest bones are picked when the skin
+    is written.
         """
     weights = []
     morphdict = {}
@@ -2466,24 +2499,27 @@ def extract_vert_info(obj, mesh, arma, target_key='', scale_factor=1.0):
         sf = obj.scale
 
     if target_key != '' and msk and target_key in msk.key_blocks.keys():
-        verts = [(v.co * sf / scale_factor)[:] for v in msk.key_blocks[target_key].data]
+        verts = vert_locations(msk.key_blocks[target_key].data, sf / scale_factor)
     else:
-        verts = [(v.co * sf / scale_factor)[:] for v in mesh.vertices]
+        verts = vert_locations(mesh.vertices, sf / scale_factor)
 
-    for i, v in enumerate(mesh.vertices):
-        vert_weights = []
-        for vg in v.groups:
-            try:
-                vgn = obj.vertex_groups[vg.group].name
-                vert_weights.append([vgn, vg.weight])
-            except:
-                log.error(f"ERROR: Vertex #{v.index} references invalid group #{vg.group}")
-        
-        weights.append(trim_to_four(vert_weights, arma))
+    if np is not None:
+        weights = vertex_weight_table(obj, mesh)
+    else:
+        for i, v in enumerate(mesh.vertices):
+            vert_weights = []
+            for vg in v.groups:
+                try:
+                    vgn = obj.vertex_groups[vg.group].name
+                    vert_weights.append([vgn, vg.weight])
+                except:
+                    log.error(f"ERROR: Vertex #{v.index} references invalid group #{vg.group}")
+            
+            weights.append(trim_to_four(vert_weights, arma))
     
     if msk: # and target_key == '' 
         for sk in msk.key_blocks:
-            morphdict[sk.name] = [(v.co * sf)[:] for v in sk.data]
+            morphdict[sk.name] = vert_locations(sk.data, sf)
 
     return verts, weights, morphdict
 
@@ -2537,17 +2573,7 @@ def expected_game(nif, bonelist):
 
 def is_partition(name):
     """ Check whether <name> is a valid partition or segment name """
-    if SkyPartition.name_match(name) >= 0:
-        return True
-
-    if FO4Segment.name_match(name) >= 0:
-        return True
-
-    parent_name, subseg_id, material = FO4Subsegment.name_match(name)
-    if parent_name:
-        return True
-
-    return False
+    return partition_name_info(name).kind is not None
 
 
 def partitions_from_vert_groups(obj):
@@ -2558,24 +2584,19 @@ def partitions_from_vert_groups(obj):
     if obj.vertex_groups:
         vg_sorted = sorted([g.name for g in obj.vertex_groups])
         for nm in vg_sorted:
-            vg = obj.vertex_groups[nm]
-            skyid = SkyPartition.name_match(vg.name)
-            if skyid >= 0:
-                val[vg.name] = SkyPartition(part_id=skyid, flags=0, name=vg.name)
-            else:
-                segid = FO4Segment.name_match(vg.name)
-                if segid >= 0:
-                    val[vg.name] = FO4Segment(part_id=len(val), index=segid, name=vg.name)
-                else:
-                    # Check if this is a subsegment. All segs sort before their subsegs, 
-                    # so it will already have been created if it exists separately
-                    parent_name, subseg_id, material = FO4Subsegment.name_match(vg.name)
-                    if parent_name:
-                        if not parent_name in val:
-                            # Create parent segments if not there
-                            val[parent_name] = FO4Segment(len(val), 0, parent_name)
-                        p = val[parent_name]
-                        val[vg.name] = FO4Subsegment(len(val), subseg_id, material, p, name=vg.name)
+            info = partition_name_info(nm)
+            if info.kind == 'SkyPartition':
+                val[nm] = SkyPartition(part_id=info.id, flags=0, name=nm)
+            elif info.kind == 'FO4Segment':
+                val[nm] = FO4Segment(part_id=len(val), index=info.id, name=nm)
+            elif info.kind == 'FO4Subsegment':
+                # All segs sort before their subsegs, so the parent will already have 
+                # been created if it exists separately
+                if not info.parent in val:
+                    # Create parent segments if not there
+                    val[info.parent] = FO4Segment(len(val), 0, info.parent)
+                p = val[info.parent]
+                val[nm] = FO4Subsegment(len(val), info.id, info.material, p, name=nm)
     
     return val
 
@@ -2589,6 +2610,39 @@ def all_vertex_groups(weightdict):
     return val
 
 
+def partition_masks(weights, partition_names, min_weight=None):
+    """Return a bitmask for each vertex of the partitions it belongs to, as an (n, bytes)
+    array of packed bits. Bit i is partition_names[i].
+        weights = VertexWeights table or [{group-name: weight}, ...] 1:1 with verts
+        min_weight = weights must be greater than this to count. If None, any vertex 
+            assigned to the group counts.
+    """
+    index = {nm: i for i, nm in enumerate(partition_names)}
+    member = np.zeros((len(weights), len(partition_names)), dtype=bool)
+    if isinstance(weights, VertexWeights):
+        group_part = np.array([index.get(nm, -1) for nm in weights.names] + [-1])
+        part = group_part[weights.groups]
+        keep = part >= 0
+        if min_weight is not None:
+            keep &= weights.weights > min_weight
+        rows = np.repeat(np.arange(len(weights)), np.diff(weights.indptr))
+        member[rows[keep], part[keep]] = True
+    else:
+        for i, vert_weights in enumerate(weights):
+            for nm, w in vert_weights.items():
+                if nm in index and (min_weight is None or w > min_weight):
+                    member[i, index[nm]] = True
+    return np.packbits(member, axis=1)
+
+
+def shared_partitions(masks, partition_count):
+    """Given the ANDed bitmasks of a set of faces, return (count, first): the number of
+    partitions each face is in, and the index of the first one.
+    """
+    bits = np.unpackbits(masks, axis=1, count=partition_count).astype(bool)
+    return bits.sum(axis=1), bits.argmax(axis=1)
+
+
 def get_loop_color(mesh, loopindex, cm, am):
     """ Return the color of the vertex-in-loop at given loop index using
         cm = color map to use
@@ -2606,9 +2660,19 @@ def get_loop_color(mesh, loopindex, cm, am):
     
 
 def mesh_from_key(editmesh, verts, target_key):
-    faces = []
-    for p in editmesh.polygons:
-        faces.append([editmesh.loops[lpi].vertex_index for lpi in p.loop_indices])
+    if np is not None:
+        loop_verts = np.empty(len(editmesh.loops), dtype=np.int32)
+        editmesh.loops.foreach_get('vertex_index', loop_verts)
+        loop_verts = loop_verts.tolist()
+        starts = np.empty(len(editmesh.polygons), dtype=np.int32)
+        editmesh.polygons.foreach_get('loop_start', starts)
+        totals = np.empty(len(editmesh.polygons), dtype=np.int32)
+        editmesh.polygons.foreach_get('loop_total', totals)
+        faces = [loop_verts[s:s+n] for s, n in zip(starts.tolist(), totals.tolist())]
+    else:
+        faces = []
+        for p in editmesh.polygons:
+            faces.append([editmesh.loops[lpi].vertex_index for lpi in p.loop_indices])
     newverts = [v.co[:] for v in editmesh.shape_keys.key_blocks[target_key].data]
     newmesh = bpy.data.meshes.new(editmesh.name)
     newmesh.from_pydata(newverts, [], faces)
@@ -3020,6 +3084,10 @@ class NifExporter:
             partition_map = [n, ...] list of partition IDs, 1:1 with tris 
 
         """
+        if np is not None:
+            return self.extract_face_arrays(mesh, uvlayer, loopcolors, weights, 
+                                            obj_partitions, use_loop_normals)
+
         loops = []
         uvs = []
         orig_uvs = []
@@ -3094,6 +3162,117 @@ class NifExporter:
         return loops, uvs, norms, colors, partition_map
 
 
+    def extract_face_arrays(self, mesh, uvlayer, loopcolors, weights, obj_partitions, use_loop_normals=False):
+        """ Extract triangularized face info from the mesh as arrays. Mesh data is read
+            with foreach_get and the mesh's loop triangles give the triangulation.
+            Returns the same values as extract_face_info:
+            loops = (n*3,) array of vert indices, read in triples
+            uvs = (n*3, 2) array 1:1 with loops
+            norms = (n*3, 3) array 1:1 with loops
+            colors = (n*3, 4) array 1:1 with loops, or empty if there are no loopcolors
+            partition_map = [n, ...] list of partition IDs, 1:1 with tris 
+        """
+        # Calculating normals messes up the passed-in UV, so get the data out of it first
+        loop_uvs = np.empty(len(mesh.loops) * 2, dtype=np.float32)
+        uvlayer.foreach_get('uv', loop_uvs)
+
+        bpy.ops.object.mode_set(mode='OBJECT') #required to get accurate normals
+
+        # Before Blender 4.0 have to calculate normals. 4.0 doesn't need it and throws
+        # an error.
+        try:
+            mesh.calc_normals_split()
+        except:
+            pass
+        try:
+            mesh.calc_normals()
+        except:
+            pass
+        mesh.calc_loop_triangles()
+
+        poly_sizes = np.empty(len(mesh.polygons), dtype=np.int32)
+        mesh.polygons.foreach_get('loop_total', poly_sizes)
+        if (poly_sizes < 3).any():
+            log.warning(f"Degenerate polygons on {mesh.name}")
+
+        tri_loops = np.empty(len(mesh.loop_triangles) * 3, dtype=np.int32)
+        mesh.loop_triangles.foreach_get('loops', tri_loops)
+        loop_verts = np.empty(len(mesh.loops), dtype=np.int32)
+        mesh.loops.foreach_get('vertex_index', loop_verts)
+
+        loops = loop_verts[tri_loops]
+        uvs = loop_uvs.reshape(-1, 2)[tri_loops]
+
+        # Use the vertex normal except when there are custom split normals. See
+        # extract_face_info.
+        if use_loop_normals:
+            loop_norms = np.empty(len(mesh.loops) * 3, dtype=np.float32)
+            mesh.loops.foreach_get('normal', loop_norms)
+            norms = loop_norms.reshape(-1, 3)[tri_loops]
+        else:
+            vert_norms = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+            mesh.vertices.foreach_get('normal', vert_norms)
+            norms = vert_norms.reshape(-1, 3)[loops]
+
+        colors = []
+        if loopcolors:
+            colors = np.asarray(loopcolors, dtype=np.float32).reshape(-1, 4)[tri_loops]
+
+        # Partitions are assigned by polygon, so every tri of a polygon gets the same one
+        partition_map = []
+        if obj_partitions and len(obj_partitions) > 0:
+            tri_polys = np.empty(len(mesh.loop_triangles), dtype=np.int32)
+            mesh.loop_triangles.foreach_get('polygon_index', tri_polys)
+            poly_ids = self.get_poly_partitions(mesh, loop_verts, poly_sizes, weights, 
+                                                obj_partitions)
+            partition_map = poly_ids[tri_polys].tolist()
+
+        return loops, uvs, norms, colors, partition_map
+
+
+    def get_poly_partitions(self, mesh, loop_verts, poly_sizes, weights, obj_partitions):
+        """ Return the partition ID of every polygon, as an array. A polygon is in a 
+            partition if all its verts are. Array version of get_loop_partitions: each 
+            vert's partitions are a bitmask, and a polygon's partitions are the AND of 
+            its verts' masks.
+        """
+        names = list(obj_partitions.keys())
+        ids = np.array([p.id for p in obj_partitions.values()], dtype=np.int32)
+        masks = partition_masks(weights, names)
+
+        # Polygon loops are contiguous, so AND the masks over each polygon's run of loops
+        starts = np.empty(len(mesh.polygons), dtype=np.int32)
+        mesh.polygons.foreach_get('loop_start', starts)
+        order = np.argsort(starts, kind='stable')
+        poly_masks = np.zeros((len(starts), masks.shape[1]), dtype=np.uint8)
+        if len(starts) > 0:
+            poly_masks[order] = np.bitwise_and.reduceat(masks[loop_verts], starts[order], axis=0)
+        count, first = shared_partitions(poly_masks, len(names))
+
+        # Faces with no partition get the first one, so something is written
+        poly_ids = np.where(count > 0, ids[first], ids[0])
+        real_polys = poly_sizes >= 3
+        none = np.flatnonzero(real_polys & (count == 0))
+        many = np.flatnonzero(real_polys & (count > 1))
+        for polys, warning, objset, group in [
+                (none, 'NO_PARTITION', self.objs_no_part, NO_PARTITION_GROUP),
+                (many, 'MANY_PARITITON', self.objs_mult_part, MULTIPLE_PARTITION_GROUP)]:
+            if len(polys) > 0:
+                self.warnings.add(warning)
+                objset.add(self.active_obj)
+                face_loops = np.concatenate([np.arange(starts[i], starts[i] + poly_sizes[i]) 
+                                             for i in polys.tolist()])
+                create_group_from_verts(self.active_obj, group, 
+                                        np.unique(loop_verts[face_loops]).tolist())
+
+        if len(none) > 0:
+            log.warning(f"Wrote faces without partitions on {mesh}")
+        if len(none) > 0 or len(many) > 0:
+            log.warning(f"Some faces are in multiple partitions, or no partition")
+
+        return poly_ids
+
+
     def export_partitions(self, obj, weights_by_vert, tris):
         """ Export partitions described by vertex groups
             weights = [dict[group-name: weight], ...] vertex weights, 1:1 with verts. For 
@@ -3108,6 +3287,9 @@ class NifExporter:
         if len(partitions) == 0:
             return [], []
 
+        if np is not None:
+            return self.export_partition_masks(obj, weights_by_vert, tris, partitions)
+
         partition_set = set(list(partitions.keys()))
 
         tri_indices = [0] * len(tris)
@@ -3137,6 +3319,37 @@ class NifExporter:
         return list(partitions.values()), tri_indices
 
 
+    def export_partition_masks(self, obj, weights_by_vert, tris, partitions):
+        """ Array version of export_partitions. Each vert's partitions are a bitmask, and
+            a tri's partitions are the AND of its 3 verts' masks.
+        """
+        names = list(partitions.keys())
+        ids = np.array([p.id for p in partitions.values()], dtype=np.int32)
+        tris = np.asarray(tris, dtype=np.int64).reshape(-1, 3)
+        masks = partition_masks(weights_by_vert, names, min_weight=0.0001)
+        count, first = shared_partitions(
+            masks[tris[:,0]] & masks[tris[:,1]] & masks[tris[:,2]], len(names))
+
+        # Triangulation may put some tris in two partitions. Just choose one--
+        # exact division doesn't matter (if it did user should have put in an edge)
+        tri_indices = np.where(count > 0, ids[first], 0)
+
+        many = count > 1
+        if many.any():
+            log.warning(f"Found multiple partitions for {many.sum()} tris in object {obj.name}")
+            self.warnings.add('MANY_PARITITON')
+            self.objs_mult_part.add(obj)
+            create_group_from_verts(obj, MULTIPLE_PARTITION_GROUP, np.unique(tris[many]).tolist())
+        none = count == 0
+        if none.any():
+            log.warning(f"{none.sum()} tris are not assigned any partition in object {obj.name}")
+            self.warnings.add('NO_PARTITION')
+            self.objs_no_part.add(obj)
+            create_group_from_verts(obj, NO_PARTITION_GROUP, np.unique(tris[none]).tolist())
+
+        return list(partitions.values()), tri_indices.tolist()
+
+
     def find_colormaps(self, mesh):
         """
         Find the color maps for the given mesh. Use the VERTEX_ALPHA color map for alpha
@@ -3275,6 +3488,11 @@ class NifExporter:
                 editmesh, uvlayer, loopcolors, weights_by_vert, partitions,
                 use_loop_normals=editmesh.has_custom_normals)
     
+        if np is not None:
+            return self.mesh_arrays_by_vert(obj, saved_sk, verts, loops, uvs, norms, 
+                                            loopcolors, weights_by_vert, morphdict, 
+                                            partitions, partition_map)
+
         mesh_split_by_uv(verts, loops, norms, uvs, weights_by_vert, morphdict)
 
         # Make uv and norm lists 1:1 with verts (rather than with loops)
@@ -3303,6 +3521,41 @@ class NifExporter:
             morphdict, partitions, partition_map
 
 
+    def mesh_arrays_by_vert(self, obj, saved_sk, verts, loops, uvs, norms, loopcolors,
+                            weights_by_vert, morphdict, partitions, partition_map):
+        """ 
+        Finish extract_mesh_data with the arrays from extract_vert_info and 
+        extract_face_arrays: split verts on UV seams and make the per-loop values 1:1 
+        with verts. Returns what extract_mesh_data returns, with verts, normals, UVs,
+        colors, tris, and morphs as arrays.
+        """
+        loops, gather = uv_split_indices(loops, uvs, len(verts))
+        if len(gather) > 0:
+            weights_by_vert = weights_by_vert.take(
+                np.concatenate((np.arange(len(verts)), gather)))
+            verts = np.concatenate((verts, verts[gather]))
+            for k, v in morphdict.items():
+                morphdict[k] = np.concatenate((v, v[gather]))
+
+        # Make uv and norm lists 1:1 with verts (rather than with loops)
+        uvmap_new = np.zeros((len(verts), 2), dtype=np.float32)
+        uvmap_new[loops] = uvs
+        norms_new = np.zeros((len(verts), 3), dtype=np.float32)
+        norms_new[loops] = norms
+
+        tris = loops.reshape(-1, 3)
+
+        colors_new = None
+        if len(loopcolors) > 0:
+            colors_new = np.zeros((len(verts), 4), dtype=np.float32)
+            colors_new[loops] = loopcolors
+
+        obj.active_shape_key_index = saved_sk
+
+        return verts, norms_new, uvmap_new, colors_new, tris, weights_by_vert, \
+            morphdict, partitions, partition_map
+
+
     def export_node(self, obj:bpy_types.Object, parent:ReprObject=None) -> NiNode:
         """Export a NiNode for the given Blender object."""
         xf = make_transformbuf(apply_scale_xf(obj.matrix_local, 1))
@@ -3438,12 +3691,17 @@ class NifExporter:
         newxfi.invert()
         new_shape.set_global_to_skin(make_transformbuf(newxfi))
     
-        weights_by_bone = get_weights_by_bone(weights_by_vert, arma.data.bones.keys())
+        if isinstance(weights_by_vert, VertexWeights):
+            vert_groups, vert_weights = weights_by_vert.top_four(arma.data.bones.keys())
+            used_bones = weights_by_vert.group_names(vert_groups[vert_weights > 0])
+        else:
+            weights_by_bone = get_weights_by_bone(weights_by_vert, arma.data.bones.keys())
+            used_bones = list(weights_by_bone.keys())
 
-        for bone_name in  weights_by_bone.keys():
-            self.write_bone(new_shape, arma, bone_name, weights_by_bone.keys())
+        for bone_name in used_bones:
+            self.write_bone(new_shape, arma, bone_name, used_bones)
 
-        for bone_name, bone_weights in weights_by_bone.items():
+        for bone_name in used_bones:
             nifname = self.nif_name(bone_name)
             if self.export_pose:
                 # Bind location is different from pose location
@@ -3462,7 +3720,18 @@ class NifExporter:
                 new_shape.set_skin_to_bone_xform(nifname, tb)
 
             self.writtenbones[bone_name] = nifname
-            new_shape.setShapeWeights(nifname, bone_weights)
+            if not isinstance(weights_by_vert, VertexWeights):
+                new_shape.setShapeWeights(nifname, weights_by_bone[bone_name])
+
+        if isinstance(weights_by_vert, VertexWeights):
+            # Map group indices to the shape's bone order. Groups that aren't bones only
+            # appear in slots with 0 weight.
+            bone_index = {n: i for i, n in enumerate(new_shape.bone_names)}
+            group_bone = np.array([bone_index.get(self.nif_name(n), 0) 
+                                     if n in used_bones else 0
+                                   for n in weights_by_vert.names] or [0], 
+                                  dtype=np.uint16)
+            new_shape.set_weight_matrix(group_bone[vert_groups], vert_weights)
 
 
     def apply_shape_key(self, key_name):
@@ -3543,7 +3812,7 @@ class NifExporter:
         robj = ReprObject(obj, new_shape)
         self.objs_written.add(robj)
 
-        if colors_new:
+        if colors_new is not None and len(colors_new) > 0:
             new_shape.set_colors(colors_new)
 
         self.export_shape_data(robj)
@@ -1569,6 +1569,80 @@ def TEST_EXP_SEG_ORDER():
     assert len(body.partitions[3].subsegments) == 0, "Torso has no subsegments"
 
 
+def TEST_EXP_SEG_FACES():
+    """Faces export in the segment all their verts are in"""
+    outfile = TT.test_file(r"tests/Out/TEST_EXP_SEG_FACES.nif")
+
+    bpy.ops.mesh.primitive_cube_add()
+    cube = bpy.context.object
+    cube.name = "SegCube"
+
+    # Bottom face is in segment 0, top face in a subsegment of segment 1, the +X side
+    # in segment 1 itself. The other sides mix verts from different segments so they
+    # aren't in any.
+    bottom = [v.index for v in cube.data.vertices if v.co.z < 0]
+    top = [v.index for v in cube.data.vertices if v.co.z > 0]
+    side = [v.index for v in cube.data.vertices if v.co.x > 0]
+    cube.vertex_groups.new(name="FO4 Seg 000").add(bottom, 1.0, 'ADD')
+    cube.vertex_groups.new(name="FO4 Seg 001").add(side, 1.0, 'ADD')
+    cube.vertex_groups.new(name="FO4 Seg 001 | 000 | Up Arm.L").add(top, 1.0, 'ADD')
+
+    bpy.ops.export_scene.pynifly(filepath=outfile, target_game='FO4')
+
+    assert BD.NO_PARTITION_GROUP in cube.vertex_groups, \
+        f"Created group for faces in no partition: {cube.vertex_groups.keys()}"
+    assert BD.MULTIPLE_PARTITION_GROUP not in cube.vertex_groups, \
+        f"No faces in multiple partitions"
+
+    nif = pyn.NifFile(outfile)
+    shape = nif.shapes[0]
+    assert len(shape.partitions) == 2, f"Have both segments: {[p.name for p in shape.partitions]}"
+    assert len(shape.partitions[1].subsegments) == 1, f"Segment 1 has its subsegment"
+    seg0 = shape.partitions[0].id
+    seg1 = shape.partitions[1].id
+    subseg = shape.partitions[1].subsegments[0].id
+
+    assert len(shape.partition_tris) == len(shape.tris) == 12, \
+        f"Have a partition for every tri: {len(shape.partition_tris)}"
+    for t, part_id in zip(shape.tris, shape.partition_tris):
+        tri_verts = [shape.verts[i] for i in t]
+        if all(v[2] < 0 for v in tri_verts):
+            expected = seg0
+        elif all(v[2] > 0 for v in tri_verts):
+            expected = subseg
+        elif all(v[0] > 0 for v in tri_verts):
+            expected = seg1
+        else:
+            # Faces in no partition are written to the first one
+            expected = seg0
+        assert part_id == expected, f"Tri {t} in partition {expected}, found {part_id}"
+
+    # Partitions can also be assigned from the tri list directly. Faces in no
+    # partition get 0.
+    addon = next(m for m in sys.modules.values() if hasattr(m, 'NifExporter'))
+    cube.vertex_groups.remove(cube.vertex_groups[BD.NO_PARTITION_GROUP])
+    partitions = addon.partitions_from_vert_groups(cube)
+    weights = [{cube.vertex_groups[g.group].name: g.weight for g in v.groups}
+               for v in cube.data.vertices]
+    cube.data.calc_loop_triangles()
+    tris = [tuple(t.vertices) for t in cube.data.loop_triangles]
+    exporter = addon.NifExporter(outfile, 'FO4')
+    parts, tri_indices = exporter.export_partitions(cube, weights, tris)
+    assert len(parts) == 3, f"Have segments and subsegment: {[p.name for p in parts]}"
+    assert BD.NO_PARTITION_GROUP in cube.vertex_groups, f"Created group for faces in no partition"
+    for t, part_id in zip(tris, tri_indices):
+        tri_verts = [cube.data.vertices[i].co for i in t]
+        if all(v.z < 0 for v in tri_verts):
+            expected = partitions["FO4 Seg 000"].id
+        elif all(v.z > 0 for v in tri_verts):
+            expected = partitions["FO4 Seg 001 | 000 | Up Arm.L"].id
+        elif all(v.x > 0 for v in tri_verts):
+            expected = partitions["FO4 Seg 001"].id
+        else:
+            expected = 0
+        assert part_id == expected, f"Tri {t} in partition {expected}, found {part_id}"
+
+
 def TEST_PARTITIONS():
     """Can read Skyrim partions"""
     testfile = TT.test_file(r"tests/Skyrim/MaleHead.nif")
@@ -2183,6 +2257,35 @@ def TEST_SHADER_EFFECT_GLOWINGONE():
     TT.assert_equiv(dat1.backward[0], -0.151786, "Key 1 backward", e=0.1)
 
 
+def TEST_ANIM_SHADER_COLOR():
+    """Keyed shader color controllers export their keys"""
+    testfile = TT.test_file(r"tests\FO4\glowingoneTEST.nif")
+    outfile = TT.test_file(r"tests/Out/TEST_ANIM_SHADER_COLOR.nif")
+
+    bpy.ops.import_scene.pynifly(filepath=testfile, use_blender_xf=False)
+    bpy.ops.export_scene.pynifly(filepath=outfile)
+
+    def color_data(nif):
+        seq = nif.rootNode.controller.sequences["partA"]
+        cb = [b for b in seq.controlled_blocks 
+              if b.node_name == "GlowingOneGlowFXstreak:0"
+                and b.controller_type == "BSEffectShaderPropertyColorController"][0]
+        return cb.interpolator.data
+
+    datin = color_data(pyn.NifFile(testfile))
+    datout = color_data(pyn.NifFile(outfile))
+
+    # Color fcurves are exported as a NiPosData with a quadratic key per keyframe.
+    assert datout.properties.keys.interpolation == pyn.NiKeyType.QUADRATIC_KEY, \
+        f"Have quadratic keys: {datout.properties.keys.interpolation}"
+    TT.assert_eq(len(datout.keys), len(datin.keys), "Key count")
+    for i, (kin, kout) in enumerate(zip(datin.keys, datout.keys)):
+        TT.assert_equiv(kout.time, kin.time, f"Key {i} time", e=0.01)
+        TT.assert_equiv(kout.value, kin.value, f"Key {i} value", e=0.01)
+        TT.assert_eq(len(kout.forward), 3, f"Key {i} forward is a color")
+        TT.assert_eq(len(kout.backward), 3, f"Key {i} backward is a color")
+
+
 
     
 
@@ -7,9 +7,16 @@ import os
 from pathlib import Path
 import logging
 import traceback
+from collections import namedtuple
 import bpy
 import bpy.props 
 from mathutils import Matrix, Vector, Quaternion, Euler, geometry
+try:
+    import numpy as np
+except ImportError:
+    # numpy ships with Blender but may be missing in a bare python install. Keyframes
+    # are built with plain lists without it.
+    np = None
 from pynifly import *
 import blender_defs as BD
 from nifdefs import *
@@ -20,6 +27,10 @@ ANIMATION_NAME_MARKER = "ANIM"
 ANIMATION_NAME_SEP = "|"
 KFP_HANDLE_OFFSET = 10
 
+# Keyframe enum values, for foreach_set.
+KFP_INTERPOLATION = {'CONSTANT': 0, 'LINEAR': 1, 'BEZIER': 2}
+KFP_HANDLE_FREE = 0
+
 
 shader_nodes = {    
     "Fallout 4 MTS": "Lighting", 
@@ -246,6 +257,105 @@ def curve_bone_target(curve):
         return ''
 
 
+# Keyframes of one fcurve, as parallel lists. Times are nif times (seconds); handles
+# are flat [x0, y0, x1, y1, ...] lists as foreach_get returns them; interpolation holds
+# the keyframe interpolation enum values.
+CurveKeys = namedtuple("CurveKeys", ["times", "frames", "values", 
+                                     "handle_left", "handle_right", "interpolation"])
+
+
+def _read_curve_keys(curve, fps):
+    """Read all keyframes of an fcurve with foreach_get."""
+    points = curve.keyframe_points
+    n = len(points)
+    co = [0.0] * (2*n)
+    hl = [0.0] * (2*n)
+    hr = [0.0] * (2*n)
+    interp = [0] * n
+    points.foreach_get('co', co)
+    points.foreach_get('handle_left', hl)
+    points.foreach_get('handle_right', hr)
+    points.foreach_get('interpolation', interp)
+
+    frames = co[0::2]
+    return CurveKeys([(f-1)/fps for f in frames], frames, co[1::2], hl, hr, interp)
+
+
+def _handle_slope(handle, x, y):
+    """Slope from a key to its handle. A vertical handle has no usable slope, so it
+    counts as flat."""
+    dx = handle[0] - x
+    if dx == 0:
+        return 0.0
+    return (handle[1] - y) / dx
+
+
+def _curve_tangents(keys:CurveKeys):
+    """
+    Return the nif (forward, backward) tangents for each key of the curve. Same
+    conversion as ControllerHandler._key_blender_to_nif.
+    """
+    frames, values = keys.frames, keys.values
+    hl, hr = keys.handle_left, keys.handle_right
+    n = len(frames)
+    forward = []
+    backward = []
+    for i in range(n):
+        x, y = frames[i], values[i]
+        slope_left = _handle_slope(hl[2*i:2*i+2], x, y)
+        slope_right = _handle_slope(hr[2*i:2*i+2], x, y)
+        forward.append(slope_left * (x - frames[i-1]) if i > 0 else slope_left)
+        backward.append(slope_right * (frames[i+1] - x) if i < n-1 else slope_right)
+    return forward, backward
+
+
+class ActionCurves():
+    """
+    Keyframe data for all the fcurves of an action, gathered in one pass before export
+    so the export stages never walk keyframe points one at a time. Curves sampled at
+    every frame are evaluated once each and kept.
+    """
+    def __init__(self, action, fps, start_time, stop_time):
+        self.fps = fps
+        self.keys = {}
+        self.tangents = {}
+        self.samples = {}
+        for fc in action.fcurves:
+            self.keys[(fc.data_path, fc.array_index)] = _read_curve_keys(fc, fps)
+
+        # Export times when exporting every frame.
+        self.sample_times = []
+        timesig = start_time
+        timestep = 1/fps
+        while timesig < stop_time + 0.0001:
+            self.sample_times.append(timesig)
+            timesig += timestep
+
+    def curve_keys(self, curve):
+        k = (curve.data_path, curve.array_index)
+        if k not in self.keys:
+            self.keys[k] = _read_curve_keys(curve, self.fps)
+        return self.keys[k]
+
+    def curve_tangents(self, curve):
+        """Nif (forward, backward) tangents for the curve's keys, computed on first use."""
+        k = (curve.data_path, curve.array_index)
+        if k not in self.tangents:
+            self.tangents[k] = _curve_tangents(self.curve_keys(curve))
+        return self.tangents[k]
+
+    def is_bezier(self, curve):
+        """Determine whether any of the curve's keyframes use bezier interpolation."""
+        return KFP_INTERPOLATION['BEZIER'] in self.curve_keys(curve).interpolation
+
+    def curve_samples(self, curve):
+        """Values of the curve at each of the sample times."""
+        k = (curve.data_path, curve.array_index)
+        if k not in self.samples:
+            self.samples[k] = [curve.evaluate(t * self.fps + 1) for t in self.sample_times]
+        return self.samples[k]
+
+
 class ControllerHandler():
     def __init__(self, parent_handler):
         self.action = None
@@ -291,6 +401,7 @@ class ControllerHandler():
             self.objects_created:BD.ReprObjectCollection = parent_handler.objs_written
 
         self.export_each_frame = False
+        self._action_curves = {}
 
 
     def warn(self, msg):
@@ -690,35 +801,36 @@ class ControllerHandler():
         return forward, backward
 
 
+    @property
+    def action_curves(self):
+        """
+        Keyframe data for the current action and export time range, gathered on first
+        use and kept for the rest of the export.
+        """
+        k = (self.action, self.start_time, self.stop_time)
+        if k not in self._action_curves:
+            self._action_curves[k] = ActionCurves(
+                self.action, self.fps, self.start_time, self.stop_time)
+        return self._action_curves[k]
+
+
     def _get_curve_linear_values(self, curve):
         """
         Transform a blender curve into nif keys. 
-        Returns [[time, value]...] for each keyframe in the curve.
+        Returns an array of NiAnimKeyLinearXYZBuf for each keyframe in the curve.
         """
-        keys = []
-        for k in curve.keyframe_points:
-            k = NiAnimKeyLinearXYZBuf()
-            k.time = (k.co.x-1) / self.fps
-            k.value = k.co.y
-            keys.append(k)
-        return keys
+        k = self.action_curves.curve_keys(curve)
+        return anim_key_buffers(NiAnimKeyLinearXYZBuf, k.times, k.values)
 
 
     def _get_curve_quad_values(self, curve):
         """
         Transform a blender curve into nif keys. 
-        Returns [NiAnimKeyFloatBuf, ...] for each keyframe in the curve.
+        Returns an array of NiAnimKeyFloatBuf for each keyframe in the curve.
         """
-        keys = []
-        points = [None] + list(curve.keyframe_points) + [None]
-        while points[1]:
-            k = NiAnimKeyFloatBuf()
-            k.time = (points[1].co.x-1) / self.fps
-            k.value = points[1].co.y
-            k.forward, k.backward = self._key_blender_to_nif(points[0], points[1], points[2])
-            keys.append(k)
-            points.pop(0)
-        return keys
+        k = self.action_curves.curve_keys(curve)
+        forward, backward = self.action_curves.curve_tangents(curve)
+        return anim_key_buffers(NiAnimKeyFloatBuf, k.times, k.values, forward, backward)
 
 
     def _get_curve_quad_vector(self, curvexyz, basexf=Matrix.Identity(4)):
@@ -726,29 +838,23 @@ class ControllerHandler():
         Transform a blender curve into nif keys. 
 
         curvexyz = List of 3 fcurves, holding the x, y, & z curves.
-        Returns [NiAnimKeyQuadTransBuf, ...] for each keyframe in the curve.
+        Returns an array of NiAnimKeyQuadTransBuf for each keyframe in the curve.
         """
-        kx = self._get_curve_quad_values(curvexyz[0])
-        ky = self._get_curve_quad_values(curvexyz[1])
-        kz = self._get_curve_quad_values(curvexyz[2])
-
-        out_list = []
-        for x, y, z in zip(kx, ky, kz):
-            k = NiAnimKeyQuadTransBuf()
-            if not all_NearEqual([x.time, y.time, z.time]):
+        kx, ky, kz = [self.action_curves.curve_keys(c) for c in curvexyz]
+        (fx, bx), (fy, by), (fz, bz) = [self.action_curves.curve_tangents(c) for c in curvexyz]
+        for tx, ty, tz in zip(kx.times, ky.times, kz.times):
+            if not all_NearEqual([tx, ty, tz]):
                 raise Exception(f"Time values do not match")
-            k.time = x.time
-            k.value[0] = x.value + basexf.translation.x
-            k.value[1] = y.value + basexf.translation.y
-            k.value[2] = z.value + basexf.translation.z
-            k.forward[0] = x.forward
-            k.forward[1] = y.forward
-            k.forward[2] = z.forward
-            k.backward[0] = x.backward
-            k.backward[1] = y.backward
-            k.backward[2] = z.backward
-            out_list.append(k)
-        return out_list
+
+        n = min(len(kx.times), len(ky.times), len(kz.times))
+        base = basexf.translation
+        return anim_key_buffers(
+            NiAnimKeyQuadTransBuf,
+            kx.times[:n],
+            [(x + base.x, y + base.y, z + base.z) 
+             for x, y, z in zip(kx.values, ky.values, kz.values)],
+            list(zip(fx, fy, fz)),
+            list(zip(bx, by, bz)))
 
 
     def _add_controlled_object(self, obj:BD.ReprObject):
@@ -1162,6 +1268,95 @@ class ControllerHandler():
 
 ### Handlers for importing different types of blocks
 
+def _interleave(*columns):
+    """Return the columns interleaved into one flat sequence, as foreach_set wants."""
+    if np is not None:
+        return np.column_stack(columns).astype(np.float32).ravel()
+    return [v for row in zip(*columns) for v in row]
+
+
+def _add_keyframes(curve, frames, values, interpolation=None, handles=None):
+    """
+    Add keyframes to an fcurve all at once, rather than inserting them one at a time.
+
+    * frames, values = sequences of frame numbers and values, 1-1
+    * interpolation = interpolation for the new keyframes, e.g. 'LINEAR'. If omitted
+      they get Blender's default.
+    * handles = (left, right) sequences of handle positions. If given, the handles are
+      FREE.
+
+    If the curve already has keyframes, the new ones are inserted one at a time so they
+    replace any existing keyframes at the same frames.
+    """
+    n = len(frames)
+    if n == 0: return
+    points = curve.keyframe_points
+
+    if len(points) > 0:
+        # Adding to an existing curve. insert() replaces any keyframe already at the
+        # same frame, where points.add() would leave duplicates.
+        for i, (f, v) in enumerate(zip(frames, values)):
+            kfp = points.insert(float(f), float(v))
+            if interpolation:
+                kfp.interpolation = interpolation
+            if handles:
+                kfp.handle_left_type = "FREE"
+                kfp.handle_right_type = "FREE"
+                kfp.handle_left = handles[0][i]
+                kfp.handle_right = handles[1][i]
+        curve.update()
+        return
+
+    points.add(n)
+    points.foreach_set('co', _interleave(frames, values))
+    if interpolation:
+        points.foreach_set('interpolation', [KFP_INTERPOLATION[interpolation]] * n)
+    if handles:
+        points.foreach_set('handle_left_type', [KFP_HANDLE_FREE] * n)
+        points.foreach_set('handle_right_type', [KFP_HANDLE_FREE] * n)
+        points.foreach_set('handle_left', _interleave([h[0] for h in handles[0]], [h[1] for h in handles[0]]))
+        points.foreach_set('handle_right', _interleave([h[0] for h in handles[1]], [h[1] for h in handles[1]]))
+    curve.update()
+
+
+def _rotate_quaternions(q, quats):
+    """
+    Return q @ k for each quaternion k in quats, as four sequences of w, x, y, and z
+    values.
+    """
+    if np is not None:
+        a = np.asarray(quats, dtype=np.float64).reshape(-1, 4)
+        w1, x1, y1, z1 = q
+        w2, x2, y2, z2 = a.T
+        return (w1*w2 - x1*x2 - y1*y2 - z1*z2,
+                w1*x2 + x1*w2 + y1*z2 - z1*y2,
+                w1*y2 - x1*z2 + y1*w2 + z1*x2,
+                w1*z2 + x1*y2 - y1*x2 + z1*w2)
+    rots = [q @ Quaternion(k) for k in quats]
+    return tuple([r[i] for r in rots] for i in range(4))
+
+
+def _columns(vectors, width):
+    """Split a sequence of vectors into 'width' sequences of values."""
+    if np is not None:
+        a = np.asarray(vectors, dtype=np.float64).reshape(-1, width)
+        return tuple(a[:, i] for i in range(width))
+    return tuple([v[i] for v in vectors] for i in range(width))
+
+
+def _frames(times, fps):
+    """Convert nif key times to Blender frame numbers."""
+    if np is not None:
+        return np.asarray(times, dtype=np.float64) * fps + 1
+    return [t * fps + 1 for t in times]
+
+
+def _update_time_range(importer, times):
+    if len(times) > 0:
+        importer.start_time = min(importer.start_time, min(times))
+        importer.end_time = max(importer.end_time, max(times))
+
+
 def _import_float_data(td, importer:ControllerHandler):
     if not importer.path_name: return
 
@@ -1175,18 +1370,15 @@ def _import_float_data(td, importer:ControllerHandler):
     if exists: return
 
     if td.properties.keys.interpolation == NiKeyType.QUADRATIC_KEY:
-        keys = [None]
-        keys.extend(td.keys)
-        keys.append(None)
-        while keys[1]:
-            frame = keys[1].time*importer.fps+1
-            kfp = curve.keyframe_points.insert(frame, keys[1].value)
-            kfp.handle_left_type = "FREE"
-            kfp.handle_right_type = "FREE"
-            kfp.handle_left, kfp.handle_right = importer._key_nif_to_blender(keys[0], keys[1], keys[2])
-            importer.start_time = min(importer.start_time, keys[1].time)
-            importer.end_time = max(importer.end_time, keys[1].time)
-            keys.pop(0)
+        keys = [None] + td.keys + [None]
+        handles = [importer._key_nif_to_blender(keys[i-1], keys[i], keys[i+1])
+                   for i in range(1, len(keys)-1)]
+        times = [k.time for k in keys[1:-1]]
+        _add_keyframes(curve, 
+                       _frames(times, importer.fps), 
+                       [k.value for k in keys[1:-1]],
+                       handles=([h[0] for h in handles], [h[1] for h in handles]))
+        _update_time_range(importer, times)
 
 NiFloatData.import_node = _import_float_data
 
@@ -1195,6 +1387,9 @@ def _import_pos_data(td:NiPosData, importer:ControllerHandler):
     if not importer.path_name: return
 
     if td.properties.keys.interpolation == NiKeyType.QUADRATIC_KEY:
+        keys = [None] + td.keys + [None]
+        times = [k.time for k in keys[1:-1]]
+        frames = _frames(times, importer.fps)
         for i in range(0, 3):
             try:
                 curve = importer.action.fcurves.new(
@@ -1203,19 +1398,11 @@ def _import_pos_data(td:NiPosData, importer:ControllerHandler):
                     action_group=importer.action_group)
             except:
                 break
-            keys = [None]
-            keys.extend(td.keys)
-            keys.append(None)
-            while keys[1]:
-                frame = keys[1].time*importer.fps+1
-                kfp = curve.keyframe_points.insert(frame, keys[1].value[i])
-                kfp.handle_left_type = "FREE"
-                kfp.handle_right_type = "FREE"
-                kfp.handle_left, kfp.handle_right \
-                    = importer._point3key_nif_to_blender(keys[0], keys[1], keys[2], i)
-                importer.start_time = min(importer.start_time, keys[1].time)
-                importer.end_time = max(importer.end_time, keys[1].time)
-                keys.pop(0)
+            handles = [importer._point3key_nif_to_blender(keys[j-1], keys[j], keys[j+1], i)
+                       for j in range(1, len(keys)-1)]
+            _add_keyframes(curve, frames, [k.value[i] for k in keys[1:-1]],
+                           handles=([h[0] for h in handles], [h[1] for h in handles]))
+        _update_time_range(importer, times)
     else:
         importer.warn(f"NYI: NiPosData type {td.properties.keys.interpolation}")
 
@@ -1244,66 +1431,61 @@ def _import_transform_data(td:NiTransformData,
     targ.rotation_mode = "QUATERNION"
     if td.properties.rotationType == NiKeyType.XYZ_ROTATION_KEY:
         targ.rotation_mode = "XYZ"
-        if td.xrotations or td.yrotations or td.zrotations:
+        nx, ny, nz = [len(td.key_buffers(d)) for d in 'XYZ']
+        if nx or ny or nz:
             curveX = importer.action.fcurves.new(path_prefix + "rotation_euler", index=0, action_group=importer.action_group)
             curveY = importer.action.fcurves.new(path_prefix + "rotation_euler", index=1, action_group=importer.action_group)
             curveZ = importer.action.fcurves.new(path_prefix + "rotation_euler", index=2, action_group=importer.action_group)
 
-            if all_equal([len(td.xrotations), len(td.yrotations), len(td.zrotations)]):
+            if all_equal([nx, ny, nz]):
                 x_rot = ('LINEAR' if td.properties.xRotations.interpolation == NiKeyType.LINEAR_KEY
                             else 'BEZIER')
                 y_rot = ('LINEAR' if td.properties.yRotations.interpolation == NiKeyType.LINEAR_KEY
                             else 'BEZIER')
                 z_rot = ('LINEAR' if td.properties.zRotations.interpolation == NiKeyType.LINEAR_KEY
                             else 'BEZIER')
-                for x, y, z in zip(td.xrotations, td.yrotations, td.zrotations):
-                    # In theory the X/Y/Z dimensions do not have to have key frames at
-                    # the same time signatures. But an Euler rotation needs all 3.
-                    # Probably they will all line up because generating them any other
-                    # way is surely hard. So hope for that and post a warning if not.
-                    if not all_NearEqual([x.time, y.time, z.time]):
+                xtimes, xvals = td.key_arrays('X')
+                ytimes, yvals = td.key_arrays('Y')
+                ztimes, zvals = td.key_arrays('Z')
+
+                # In theory the X/Y/Z dimensions do not have to have key frames at
+                # the same time signatures. But an Euler rotation needs all 3.
+                # Probably they will all line up because generating them any other
+                # way is surely hard. So hope for that and post a warning if not.
+                for x, y, z in zip(xtimes, ytimes, ztimes):
+                    if not all_NearEqual([x, y, z]):
                         importer.warn(f"Keyframes do not align for '{importer.path_name}. Animations may be incorrect.")
-
-                    # Need to apply the parent rotation. If we stay in Eulers, we may
-                    # have gimbal lock. If we convert to quaternions, we may lose the
-                    # distinction between +180 and -180, which are different things
-                    # for animations. So only apply the parent rotation if there is
-                    # one; in those cases we're just hoping it comes out right.
-                    ve = Euler(Vector((x.value, y.value, z.value)), 'XYZ')
-                    if have_parent_rotation:
-                        ke = ve.copy()
-                        kq = ke.to_quaternion()
-                        vq = qinv @ kq
-                        ve = vq.to_euler()
-                    kx = curveX.keyframe_points.insert(x.time * importer.fps + 1, ve[0])
-                    kx.interpolation = x_rot
-                    ky = curveY.keyframe_points.insert(y.time * importer.fps + 1, ve[1])
-                    ky.interpolation = y_rot
-                    kz = curveZ.keyframe_points.insert(z.time * importer.fps + 1, ve[2])
-                    kz.interpolation = z_rot
-                    importer.start_time = min(importer.start_time, x.time, y.time, z.time)
-                    importer.end_time = max(importer.end_time, x.time, y.time, z.time)
+                        break
+
+                # Need to apply the parent rotation. If we stay in Eulers, we may
+                # have gimbal lock. If we convert to quaternions, we may lose the
+                # distinction between +180 and -180, which are different things
+                # for animations. So only apply the parent rotation if there is
+                # one; in those cases we're just hoping it comes out right.
+                if have_parent_rotation:
+                    eulers = [(qinv @ Euler((x, y, z), 'XYZ').to_quaternion()).to_euler()
+                              for x, y, z in zip(xvals, yvals, zvals)]
+                    xvals, yvals, zvals = _columns(eulers, 3)
+
+                _add_keyframes(curveX, _frames(xtimes, importer.fps), xvals, x_rot)
+                _add_keyframes(curveY, _frames(ytimes, importer.fps), yvals, y_rot)
+                _add_keyframes(curveZ, _frames(ztimes, importer.fps), zvals, z_rot)
+                for times in (xtimes, ytimes, ztimes):
+                    _update_time_range(importer, times)
                     
             else:
                 # This method of getting the inverse of the Euler doesn't always
                 # work, maybe because of gimbal lock.
                 ve = tiq.to_euler()
 
-                for i, k in enumerate(td.xrotations):
-                    val = k.value - ve[0]
-                    curveX.keyframe_points.insert(k.time * importer.fps + 1, val)
-                    importer.start_time = min(importer.start_time, k.time)
-                    importer.end_time = max(importer.end_time, k.time)
-                for i, k in enumerate(td.yrotations):
-                    val = k.value - ve[1]
-                    curveY.keyframe_points.insert(k.time * importer.fps + 1, val)
-                    importer.start_time = min(importer.start_time, k.time)
-                    importer.end_time = max(importer.end_time, k.time)
-                for i, k in enumerate(td.zrotations):
-                    val = k.value - ve[2]
-                    curveZ.keyframe_points.insert(k.time * importer.fps + 1, val)
-                    importer.start_time = min(importer.start_time, k.time)
-                    importer.end_time = max(importer.end_time, k.time)
+                for track, curve, offset in [('X', curveX, ve[0]), 
+                                             ('Y', curveY, ve[1]), 
+                                             ('Z', curveZ, ve[2])]:
+                    times, vals = td.key_arrays(track)
+                    _add_keyframes(curve, 
+                                   _frames(times, importer.fps), 
+                                   [v - offset for v in vals])
+                    _update_time_range(importer, times)
     
     elif td.properties.rotationType in [NiKeyType.LINEAR_KEY, NiKeyType.QUADRATIC_KEY]:
         if td.properties.rotationType == NiKeyType.LINEAR_KEY:
@@ -1319,25 +1501,18 @@ def _import_transform_data(td:NiTransformData,
         except:
             curveW = importer.action.fcurves[path_prefix + "rotation_quaternion"]
 
-        for i, k in enumerate(td.qrotations):
-            kq = Quaternion(k.value)
-            # Auxbones animations are not correct yet, but they seem to need something
-            # different from animations on the full skeleton.
-            if importer.auxbones:
-                vq = kq 
-            else:
-                vq = qinv @ kq 
-
-            kw = curveW.keyframe_points.insert(k.time * importer.fps + 1, vq[0])
-            kw.interpolation = key_type
-            kx = curveX.keyframe_points.insert(k.time * importer.fps + 1, vq[1])
-            kx.interpolation = key_type
-            ky = curveY.keyframe_points.insert(k.time * importer.fps + 1, vq[2])
-            ky.interpolation = key_type
-            kz = curveZ.keyframe_points.insert(k.time * importer.fps + 1, vq[3])
-            kz.interpolation = key_type
-            importer.start_time = min(importer.start_time, k.time)
-            importer.end_time = max(importer.end_time, k.time)
+        times, quats = td.key_arrays('Q')
+        # Auxbones animations are not correct yet, but they seem to need something
+        # different from animations on the full skeleton.
+        if importer.auxbones:
+            channels = _columns(quats, 4)
+        else:
+            channels = _rotate_quaternions(qinv, quats)
+
+        frames = _frames(times, importer.fps)
+        for curve, vals in zip([curveW, curveX, curveY, curveZ], channels):
+            _add_keyframes(curve, frames, vals, key_type)
+        _update_time_range(importer, times)
 
     elif td.properties.rotationType == NiKeyType.NO_INTERP:
         pass
@@ -1345,28 +1520,23 @@ def _import_transform_data(td:NiTransformData,
         importer.warn(f"Not Yet Implemented: Rotation type {td.properties.rotationType} at {importer.path_name}")
 
     # Seems like a value of + or - infinity in the Transform
-    if len(td.translations) > 0:
+    if len(td.key_buffers('T')) > 0:
         xlate_interp = (
             'LINEAR' if td.properties.translations.interpolation == NiKeyType.LINEAR_KEY
                 else 'BEZIER')
         curveLocX = importer.action.fcurves.new(path_prefix + "location", index=0, action_group=importer.action_group)
         curveLocY = importer.action.fcurves.new(path_prefix + "location", index=1, action_group=importer.action_group)
         curveLocZ = importer.action.fcurves.new(path_prefix + "location", index=2, action_group=importer.action_group)
-        for k in td.translations:
-            v = Vector(k.value)
+        times, locs = td.key_arrays('T')
+        channels = _columns(locs, 3)
+        if not importer.auxbones:
+            channels = [[v - tiv[i] for v in c] if np is None else c - tiv[i]
+                        for i, c in enumerate(channels)]
 
-            if importer.auxbones:
-                pass 
-            else:
-                v = v - tiv
-            k1 = curveLocX.keyframe_points.insert(k.time * importer.fps + 1, v[0])
-            k1.interpolation = xlate_interp
-            k2 = curveLocY.keyframe_points.insert(k.time * importer.fps + 1, v[1])
-            k2.interpolation = xlate_interp
-            k3 = curveLocZ.keyframe_points.insert(k.time * importer.fps + 1, v[2])
-            k3.interpolation = xlate_interp
-            importer.start_time = min(importer.start_time, k.time)
-            importer.end_time = max(importer.end_time, k.time)
+        frames = _frames(times, importer.fps)
+        for curve, vals in zip([curveLocX, curveLocY, curveLocZ], channels):
+            _add_keyframes(curve, frames, vals, xlate_interp)
+        _update_time_range(importer, times)
 
 NiTransformData.import_node = _import_transform_data
 
@@ -1775,15 +1945,14 @@ NiControllerManager.import_node = _import_controller_manager
 #             _export_transform_loc(loc_channel, c)
 
 
-def _get_interpolation_type(curvelist):
+def _get_interpolation_type(curves:ActionCurves, curvelist):
     """
     Return the interpolation type needed to represet a set of fcurves. If any curve has
     bezier handles, the interpolation will be QUADRATIC. 
     """
     for c in curvelist:
-        for k in c.keyframe_points:
-            if k.interpolation == 'BEZIER':
-                return NiKeyType.QUADRATIC_KEY
+        if curves.is_bezier(c):
+            return NiKeyType.QUADRATIC_KEY
     return NiKeyType.LINEAR_KEY
 
 
@@ -1829,17 +1998,18 @@ def _parse_transform_curves(exporter:ControllerHandler, curve_list):
     if len(loc) != 3 and len(eu) != 3 and len(quat) != 4:
         raise Exception(f"No useable transforms in fcurves for {dp}")
 
+    curves = exporter.action_curves
     if loc: 
-        props.translations.interpolation = _get_interpolation_type(loc)
+        props.translations.interpolation = _get_interpolation_type(curves, loc)
     if quat: 
-        props.rotationType = _get_interpolation_type(quat)
+        props.rotationType = _get_interpolation_type(curves, quat)
     if eu:
         props.rotationType = NiKeyType.XYZ_ROTATION_KEY
-        props.xRotations.interpolation = _get_interpolation_type([eu[0]])
-        props.yRotations.interpolation = _get_interpolation_type([eu[1]])
-        props.zRotations.interpolation = _get_interpolation_type([eu[2]])
+        props.xRotations.interpolation = _get_interpolation_type(curves, [eu[0]])
+        props.yRotations.interpolation = _get_interpolation_type(curves, [eu[1]])
+        props.zRotations.interpolation = _get_interpolation_type(curves, [eu[2]])
     if scale:
-        props.scales.interpolation = _get_interpolation_type(scale)
+        props.scales.interpolation = _get_interpolation_type(curves, scale)
 
     return props, loc, eu, quat, scale
 
@@ -1855,37 +2025,26 @@ def _export_quaterion_curves(exporter, td, quat, rot_type, targ_q):
     """
     # Can't do quadratic interpolation with quaternions, so if the rot_type is QUADRATIC
     # export keys using the current fps.
+    curves = exporter.action_curves
     if rot_type == NiKeyType.QUADRATIC_KEY:
-        timesig = exporter.start_time
-        timestep = 1/exporter.fps
-
-        while timesig < exporter.stop_time + 0.0001:
-            fr = timesig * exporter.fps + 1
-            tdq = Quaternion([quat[0].evaluate(fr), 
-                                quat[1].evaluate(fr), 
-                                quat[2].evaluate(fr), 
-                                quat[3].evaluate(fr)])
-            kq = targ_q  @ tdq
-            td.add_qrotation_key(timesig, kq)
-            timesig += timestep
+        times = curves.sample_times
+        quats = list(zip(*[curves.curve_samples(c) for c in quat]))
 
     else:
         # The curve uses linear interpolation, so it's fine to export just keyframes. Each
         # fcurve of the quaternion could have different keyframes but it's not likely and
         # nifs don't support it, so don't allow it.
-        if not all_equal([len(quat[0].keyframe_points), len(quat[1].keyframe_points), 
-                          len(quat[2].keyframe_points), len(quat[3].keyframe_points)]):
+        keys = [curves.curve_keys(c) for c in quat]
+        if not all_equal([len(k.frames) for k in keys]):
             raise Exception(f"Different number of quaternion keyframes")
         
-        for k1, k2, k3, k4 in zip(quat[0].keyframe_points, quat[1].keyframe_points, 
-                                quat[2].keyframe_points, quat[3].keyframe_points):
-            if not all_NearEqual([k1.co[0], k2.co[0], k3.co[0], k4.co[0]]):
+        for frames in zip(*[k.frames for k in keys]):
+            if not all_NearEqual(list(frames)):
                 raise Exception (f"Quaternion keyframes not at matching times")
-            
-            tdq = Quaternion([k1.co[1], k2.co[1], k3.co[1], k4.co[1]])
-            timesig = (k1.co[0]-1)/exporter.fps
-            kq = targ_q  @ tdq
-            td.add_qrotation_key(timesig, kq)
+        times = keys[0].times
+        quats = list(zip(*[k.values for k in keys]))
+
+    td.add_qrotation_keys(times, list(zip(*_rotate_quaternions(targ_q, quats))))
 
 
 def _export_euler_curves(exporter, td, eu, targ_q):
@@ -1937,8 +2096,9 @@ def _get_keyframe_indices(curve_list):
     """
     frameset = set()
     for c in curve_list:
-        for k in c.keyframe_points:
-            frameset.add(round(k.co[0], 2))
+        frames = [0.0] * (2*len(c.keyframe_points))
+        c.keyframe_points.foreach_get('co', frames)
+        frameset.update(round(f, 2) for f in frames[0::2])
     frames = list(frameset)
     frames.sort()
     return frames
@@ -1951,11 +2111,14 @@ def _next_keyframe_index(curve_list):
     for c in curve_list:
         keyframes.append(list(c.keyframe_points))
     
+    # Walk each curve's keyframes with an index rather than popping them off the front.
+    nextkey = [0] * len(keyframes)
     for kfindex in findices:
         matches = []
         for i, klist in enumerate(keyframes):
-            if klist[0].co.x == kfindex:
-                matches.append(klist.pop(0))
+            if nextkey[i] < len(klist) and klist[nextkey[i]].co.x == kfindex:
+                matches.append(klist[nextkey[i]])
+                nextkey[i] += 1
             else:
                 matches.append(None)
         yield kfindex, matches
@@ -1968,32 +2131,29 @@ def _export_loc_curves(exporter, td, loc, targ_xf):
     td = NiTransformData object
     loc = list of 3 fcurves containing location x/y/z values
     """
+    curves = exporter.action_curves
+    base = targ_xf.translation
     if exporter.export_each_frame:
-        timesig = exporter.start_time
-        timestep = 1/exporter.fps
-        while timesig < exporter.stop_time + 0.0001:
-            fr = timesig * exporter.fps + 1
-            kv =Vector([loc[0].evaluate(fr), 
-                            loc[1].evaluate(fr), 
-                            loc[2].evaluate(fr)])
-            rv = kv + targ_xf.translation
-            td.add_translation_key(timesig, rv)
-            timesig += timestep
+        td.add_translation_keys(
+            curves.sample_times, 
+            [(x + base.x, y + base.y, z + base.z) 
+             for x, y, z in zip(*[curves.curve_samples(c) for c in loc])])
 
     else:
         if td.properties.translations.interpolation == NiKeyType.QUADRATIC_KEY:
             td.add_quad_translation_keys(exporter._get_curve_quad_vector(loc, targ_xf))
         else:
-            if not (len(loc[0].keyframe_points) == len(loc[1].keyframe_points) == len(loc[2].keyframe_points)):
+            k0, k1, k2 = [curves.curve_keys(c) for c in loc]
+            if not (len(k0.frames) == len(k1.frames) == len(k2.frames)):
                 raise Exception("NYI: Euler bone rotations when different number of fcurve keyframes")
-            for k0, k1, k2 in zip(loc[0].keyframe_points, loc[1].keyframe_points, loc[2].keyframe_points):
-                if not all_NearEqual([k0.co.x, k1.co.x, k2.co.x]):
+            for f0, f1, f2 in zip(k0.frames, k1.frames, k2.frames):
+                if not all_NearEqual([f0, f1, f2]):
                     raise Exception (f"Translation keys not at matching frames for {exporter.action_target.name}")
                     
-                timesig = (k0.co.x-1)/exporter.fps
-                kv = Vector([k0.co.y, k1.co.y, k2.co.y])
-                rv = kv + targ_xf.translation
-                td.add_translation_key(timesig, rv)
+            td.add_translation_keys(
+                k0.times, 
+                [(x + base.x, y + base.y, z + base.z) 
+                 for x, y, z in zip(k0.values, k1.values, k2.values)])
 
 
 def _export_transform_curves(exporter:ControllerHandler, curve_list, targetobj=None):
@@ -2107,36 +2267,17 @@ def _export_color_curves(exporter, curve_list, target_obj=None):
     fcv = (curve_list.pop(0), curve_list.pop(0), curve_list.pop(0), )
 
     # Have to assume all channels have the same keyframes.
-    keyframes = [(None, None, None, )]
-    for k1, k2, k3 in zip(fcv[0].keyframe_points, fcv[1].keyframe_points, fcv[2].keyframe_points):
-        if k1.co[0] != k2.co[0] or k1.co[0] != k3.co[0]:
+    kr, kg, kb = [exporter.action_curves.curve_keys(c) for c in fcv]
+    (fr, br), (fg, bg), (fb, bb) = [exporter.action_curves.curve_tangents(c) for c in fcv]
+    for r, g, b in zip(kr.frames, kg.frames, kb.frames):
+        if r != g or r != b:
             raise Exception(f"Cannot handle color fcurves with mismatched keyframes")
-        keyframes.append((k1, k2, k3,))
-    keyframes.append((None, None, None, ))
-
-    for i in range(1, len(keyframes)-1):
-        kfr, kfg, kfb = keyframes[i]
-        kfbuf = NiAnimKeyQuadTransBuf()
-        kfbuf.time = (kfr.co.x-1)/exporter.fps
-        kfbuf.value[0] = kfr.co.y
-        kfbuf.forward[0], kfbuf.backward[0] = exporter._key_blender_to_nif(
-            kfp0=keyframes[i-1][0],
-            kfp1=keyframes[i][0],
-            kfp2=keyframes[i+1][0]
-        )
-        kfbuf.value[1] = kfg.co.y
-        kfbuf.forward[1], kfbuf.backward[1] = exporter._key_blender_to_nif(
-            kfp0=keyframes[i-1][1],
-            kfp1=keyframes[i][1],
-            kfp2=keyframes[i+1][1]
-        )
-        kfbuf.value[2] = kfb.co.y
-        kfbuf.forward[2], kfbuf.backward[2] = exporter._key_blender_to_nif(
-            kfp0=keyframes[i-1][2],
-            kfp1=keyframes[i][2],
-            kfp2=keyframes[i+1][2]
-        )
-        dat.add_key(kfbuf)
+
+    n = min(len(kr.times), len(kg.times), len(kb.times))
+    dat.add_keys(kr.times[:n], 
+                 list(zip(kr.values, kg.values, kb.values)),
+                 list(zip(fr, fg, fb)),
+                 list(zip(br, bg, bb)))
 
     interp = NiPoint3Interpolator.New(exporter.nif, data=dat)
     return "", interp
@@ -0,0 +1,182 @@
+"""
+Scan a tree of nif files in parallel.
+
+Opening every nif in a game's meshes folder takes hours in a single thread. scan()
+spreads the work over a pool of processes. Each worker loads the nifly DLL once and then
+opens nifs and runs the caller's function on them. Results come back as they are
+finished, not in walk order.
+
+The function passed to scan() must be picklable--a function defined at the top level of
+a module. It is called with a NifFile and whatever it returns is passed back in the
+result. Exceptions are caught and passed back as errors so one bad nif doesn't stop the
+scan. If a nif crashes its worker outright, the pool is restarted and the crash is
+reported as that file's error.
+
+    def has_sphere(nif):
+        return any(n.collision_object for n in nif.nodes.values())
+
+    if __name__ == "__main__":
+        for r in nifbatch.scan(meshes_folder, has_sphere, nifly_path=dll_path):
+            if r.value: print(r.filepath)
+
+Note the scan must be started from inside an "if __name__ == '__main__'" block, because
+on Windows every worker imports the main module.
+"""
+import os
+import logging
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+import pynifly
+
+log = logging.getLogger("pynifly")
+
+ScanResult = namedtuple("ScanResult", ["filepath", "value", "error"])
+
+
+def is_excluded(folder, excludes):
+    """Determine whether the folder is excluded by any of the exclusion rules. A rule is a
+    path or path fragment; it excludes any folder whose path contains it, along with
+    everything under that folder. So a full path excludes one subtree, and a fragment
+    like r'\\facegendata' excludes every folder of that name. Case doesn't matter.
+    """
+    f = os.path.normcase(folder).lower().rstrip(os.sep) + os.sep
+    for x in excludes:
+        xn = os.path.normcase(x).lower().rstrip(os.sep) + os.sep
+        if xn in f:
+            return True
+    return False
+
+
+def walk_nifs(folder_path, excludes=(), extensions=('.NIF',)):
+    """Return all nif files in a directory tree, recursively, skipping excluded folders."""
+    for root, directories, files in os.walk(folder_path):
+        # Prune excluded folders so os.walk doesn't descend into them.
+        directories[:] = [d for d in directories
+                          if not is_excluded(os.path.join(root, d), excludes)]
+        if is_excluded(root, excludes):
+            continue
+        for filename in files:
+            if os.path.splitext(filename)[1].upper() in extensions:
+                yield os.path.join(root, filename)
+
+
+def _init_worker(nifly_path):
+    """Load the nifly DLL once for each worker process."""
+    if pynifly.NifFile.nifly is None:
+        pynifly.NifFile.Load(nifly_path)
+
+
+def _scan_file(filepath, func, lazy):
+    """Open one nif and run func on it. Runs in the worker process."""
+    try:
+        return ScanResult(filepath, func(pynifly.NifFile(filepath, lazy=lazy)), None)
+    except Exception as e:
+        return _error_result(filepath, e)
+
+
+def _error_result(filepath, e):
+    return ScanResult(filepath, None, f"{type(e).__name__}: {e}")
+
+
+def _new_pool(max_workers, nifly_path):
+    return ProcessPoolExecutor(max_workers=max_workers,
+                               initializer=_init_worker,
+                               initargs=(nifly_path,))
+
+
+def scan(folder_path, func, excludes=(), **kwargs):
+    """
+    Run func on every nif in the directory tree. Yields a ScanResult for each file as it
+    completes.
+
+    * func = picklable function called with each NifFile. Its return value is returned as
+      the result's value.
+    * excludes = list of folder exclusion rules, see is_excluded().
+    * Other arguments are passed to scan_files().
+    """
+    return scan_files(walk_nifs(folder_path, excludes), func, **kwargs)
+
+
+def scan_files(files, func, nifly_path=None, max_workers=None, lazy=True, max_pending=None):
+    """
+    Run func on every nif in the list of files. Yields a ScanResult for each file as it
+    completes.
+
+    * nifly_path = path to the nifly DLL. Defaults to the DLL already loaded in this
+      process.
+    * max_workers = number of worker processes. Defaults to the number of cores. If 0,
+      the files are scanned in this process, which is handy for debugging.
+    * lazy = open the nifs lazily, so shapes are only read if func uses them.
+    * max_pending = number of files handed to the pool at once. Keeps memory bounded on
+      huge trees.
+    """
+    if nifly_path is None:
+        nifly_path = getattr(pynifly.NifFile, "nifly_path", None)
+    if nifly_path is None:
+        raise Exception("No nifly DLL path given and none loaded")
+
+    if max_workers == 0:
+        _init_worker(nifly_path)
+        for f in files:
+            yield _scan_file(f, func, lazy)
+        return
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    if max_pending is None:
+        max_pending = max_workers * 8
+
+    # When a worker dies the whole pool breaks, and every file in it comes back
+    # broken. Those files are suspects: they are rerun one at a time in a fresh pool, so
+    # only the file that actually kills its worker is reported as an error.
+    files = iter(files)
+    pending = {}
+    suspects = []
+    executor = _new_pool(max_workers, nifly_path)
+    try:
+        while True:
+            while suspects:
+                f = suspects.pop(0)
+                try:
+                    yield executor.submit(_scan_file, f, func, lazy).result()
+                except BrokenProcessPool as e:
+                    yield _error_result(f, e)
+                    executor.shutdown()
+                    executor = _new_pool(max_workers, nifly_path)
+                except Exception as e:
+                    yield _error_result(f, e)
+
+            broken = False
+            while len(pending) < max_pending:
+                f = next(files, None)
+                if f is None:
+                    break
+                try:
+                    pending[executor.submit(_scan_file, f, func, lazy)] = f
+                except BrokenProcessPool:
+                    suspects.append(f)
+                    broken = True
+                    break
+            if not pending and not suspects:
+                break
+
+            if pending and not broken:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    f = pending.pop(fut)
+                    try:
+                        yield fut.result()
+                    except BrokenProcessPool:
+                        suspects.append(f)
+                        broken = True
+                    except Exception as e:
+                        yield _error_result(f, e)
+
+            if broken:
+                suspects.extend(pending.values())
+                pending = {}
+                executor.shutdown()
+                executor = _new_pool(max_workers, nifly_path)
+    finally:
+        executor.shutdown()
@@ -0,0 +1,252 @@
+"""
+Persistent catalog of nif metadata.
+
+Questions like "which nifs use bhkSphereShape" or "which shapes reference this BGSM" mean
+opening every nif in a game's meshes tree. NifCatalog opens them once and records what
+it finds in a SQLite file. Later updates only rescan files whose modification time or
+size changed, and queries are answered from the database without opening any nifs.
+
+    cat = NifCatalog("skyrimse.db")
+    cat.update(meshes_folder, excludes=[r'\\facegendata'], nifly_path=dll_path)
+    for f in cat.files_with_block("bhkSphereShape"):
+        print(f)
+
+update() scans in parallel with nifbatch, so like nifbatch.scan it must be called from
+inside an "if __name__ == '__main__'" block.
+"""
+import os
+import sqlite3
+import logging
+import nifbatch
+
+log = logging.getLogger("pynifly")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    game TEXT,
+    error TEXT);
+CREATE TABLE IF NOT EXISTS blocks (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    block_type TEXT NOT NULL,
+    count INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS shapes (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    name TEXT,
+    block_type TEXT,
+    shader_name TEXT);
+CREATE TABLE IF NOT EXISTS textures (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    shape TEXT,
+    slot TEXT,
+    path TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS bones (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    shape TEXT,
+    bone TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS blocks_type ON blocks(block_type);
+CREATE INDEX IF NOT EXISTS blocks_file ON blocks(file_id);
+CREATE INDEX IF NOT EXISTS shapes_file ON shapes(file_id);
+CREATE INDEX IF NOT EXISTS textures_path ON textures(path COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS textures_file ON textures(file_id);
+CREATE INDEX IF NOT EXISTS bones_bone ON bones(bone);
+CREATE INDEX IF NOT EXISTS bones_file ON bones(file_id);
+"""
+
+# Number of files to write between commits during an update.
+COMMIT_INTERVAL = 500
+
+
+def is_collision_shape(block_type):
+    """Determine whether the block type is a collision shape."""
+    return block_type.startswith('bhk') and block_type.endswith('Shape')
+
+
+def nif_metadata(nif):
+    """Extract the metadata the catalog records from a NifFile. Runs in the scanner's
+    worker processes, so it returns plain data.
+    """
+    counts = {}
+    for bn in nif.blocknames:
+        if bn: counts[bn] = counts.get(bn, 0) + 1
+
+    shapes = []
+    for s in nif.shapes:
+        textures = {}
+        try:
+            textures = s.textures
+        except:
+            log.debug(f"Could not read textures for {s.name}")
+        shapes.append({
+            "name": s.name,
+            "block_type": s.blockname,
+            "shader_name": s.shader_name,
+            "textures": dict(textures),
+            "bones": list(s.bone_names)})
+
+    return {"game": nif.game, "blocks": counts, "shapes": shapes}
+
+
+class NifCatalog:
+    """SQLite catalog of nif metadata, keyed by file path, modification time, and size."""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.db = sqlite3.connect(db_path)
+        self.db.execute("PRAGMA foreign_keys = ON")
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @staticmethod
+    def _key(filepath):
+        return os.path.normcase(os.path.abspath(filepath))
+
+    def stale_files(self, files):
+        """Return the files from the list that are new or have changed since they were
+        cataloged, as (path, mtime, size) tuples.
+        """
+        known = {p: (m, s) for p, m, s in self.db.execute(
+            "SELECT path, mtime, size FROM files")}
+        stale = []
+        for f in files:
+            st = os.stat(f)
+            if known.get(self._key(f)) != (st.st_mtime, st.st_size):
+                stale.append((f, st.st_mtime, st.st_size))
+        return stale
+
+    def update(self, folder_path, excludes=(), prune=True, **kwargs):
+        """
+        Bring the catalog up to date with the nifs in the directory tree. Only new and
+        changed files are opened.
+
+        * excludes = folder exclusion rules, as for nifbatch.scan.
+        * prune = remove files under folder_path that no longer exist.
+        * Other arguments are passed to nifbatch.scan_files.
+
+        Returns the number of files scanned.
+        """
+        files = list(nifbatch.walk_nifs(folder_path, excludes))
+
+        if prune:
+            root = self._key(folder_path).rstrip(os.sep) + os.sep
+            present = set(self._key(f) for f in files)
+            gone = [(p,) for (p,) in self.db.execute(
+                        "SELECT path FROM files WHERE substr(path, 1, ?) = ?",
+                        (len(root), root))
+                    if p not in present]
+            self.db.executemany("DELETE FROM files WHERE path = ?", gone)
+            self.db.commit()
+
+        stale = {f: (m, s) for f, m, s in self.stale_files(files)}
+        count = 0
+        for r in nifbatch.scan_files(list(stale.keys()), nif_metadata, **kwargs):
+            mtime, size = stale[r.filepath]
+            self._record(r.filepath, mtime, size, r.value, r.error)
+            count += 1
+            if count % COMMIT_INTERVAL == 0:
+                self.db.commit()
+        self.db.commit()
+        return count
+
+    def _record(self, filepath, mtime, size, data, error):
+        """Replace the catalog entry for one file."""
+        key = self._key(filepath)
+        self.db.execute("DELETE FROM files WHERE path = ?", (key,))
+        game = data["game"] if data else None
+        file_id = self.db.execute(
+            "INSERT INTO files (path, mtime, size, game, error) VALUES (?, ?, ?, ?, ?)",
+            (key, mtime, size, game, error)).lastrowid
+        if error:
+            log.debug(f"{filepath}: {error}")
+            return
+
+        self.db.executemany(
+            "INSERT INTO blocks (file_id, block_type, count) VALUES (?, ?, ?)",
+            [(file_id, bt, n) for bt, n in data["blocks"].items()])
+        for s in data["shapes"]:
+            self.db.execute(
+                "INSERT INTO shapes (file_id, name, block_type, shader_name) VALUES (?, ?, ?, ?)",
+                (file_id, s["name"], s["block_type"], s["shader_name"]))
+            self.db.executemany(
+                "INSERT INTO textures (file_id, shape, slot, path) VALUES (?, ?, ?, ?)",
+                [(file_id, s["name"], slot, p) for slot, p in s["textures"].items() if p])
+            if s["shader_name"] and os.path.splitext(s["shader_name"])[1].upper() in ('.BGSM', '.BGEM'):
+                self.db.execute(
+                    "INSERT INTO textures (file_id, shape, slot, path) VALUES (?, ?, ?, ?)",
+                    (file_id, s["name"], "Material", s["shader_name"]))
+            self.db.executemany(
+                "INSERT INTO bones (file_id, shape, bone) VALUES (?, ?, ?)",
+                [(file_id, s["name"], b) for b in s["bones"]])
+
+    # ------------- Queries ------------- #
+
+    def _column(self, sql, args=()):
+        return [p for (p,) in self.db.execute(sql, args)]
+
+    @property
+    def files(self):
+        """All cataloged files."""
+        return self._column("SELECT path FROM files ORDER BY path")
+
+    @property
+    def errors(self):
+        """Files that could not be read, as (path, error) tuples."""
+        return list(self.db.execute(
+            "SELECT path, error FROM files WHERE error IS NOT NULL ORDER BY path"))
+
+    def files_with_block(self, block_type):
+        """Files containing a block of the given type."""
+        return self._column(
+            """SELECT DISTINCT f.path FROM files f JOIN blocks b ON b.file_id = f.id
+               WHERE b.block_type = ? ORDER BY f.path""", (block_type,))
+
+    def files_using_texture(self, fragment):
+        """Files with a texture or material path containing the given string. Case doesn't
+        matter.
+        """
+        # Texture paths are full of underscores, which LIKE would take as wildcards.
+        pattern = fragment.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        return list(self.db.execute(
+            """SELECT DISTINCT f.path, t.shape, t.slot, t.path
+               FROM files f JOIN textures t ON t.file_id = f.id
+               WHERE t.path LIKE ? ESCAPE '\\' ORDER BY f.path""", (f"%{pattern}%",)))
+
+    def files_with_bone(self, bone):
+        """Files with a shape skinned to the given bone."""
+        return self._column(
+            """SELECT DISTINCT f.path FROM files f JOIN bones b ON b.file_id = f.id
+               WHERE b.bone = ? ORDER BY f.path""", (bone,))
+
+    def block_types(self, filepath):
+        """Block types in the file, as a dictionary of type -> count."""
+        return dict(self.db.execute(
+            """SELECT b.block_type, b.count FROM files f JOIN blocks b ON b.file_id = f.id
+               WHERE f.path = ?""", (self._key(filepath),)))
+
+    def collision_types(self, filepath):
+        """Collision shape types used in the file."""
+        return sorted(bt for bt in self.block_types(filepath) if is_collision_shape(bt))
+
+    def shapes(self, filepath):
+        """Shapes in the file, as (name, block type, shader name) tuples."""
+        return list(self.db.execute(
+            """SELECT s.name, s.block_type, s.shader_name
+               FROM files f JOIN shapes s ON s.file_id = f.id WHERE f.path = ?""",
+            (self._key(filepath),)))
+
+    def bones(self, filepath):
+        """Bones used by shapes in the file."""
+        return sorted(set(self._column(
+            """SELECT b.bone FROM files f JOIN bones b ON b.file_id = f.id
+               WHERE f.path = ?""", (self._key(filepath),))))
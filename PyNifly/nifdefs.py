@@ -4,6 +4,7 @@
 """
 
 import sys
+import ast
 from enum import Enum, IntFlag, IntEnum
 import math
 import logging
@@ -170,78 +171,109 @@ pynBufferDefaults = {
 
 
 
+def _parse_literal(v):
+    """Parse a vector property stored as a string, e.g. "(0.0, 1.0, 0.0)". Values that
+    aren't strings are used as they are."""
+    if isinstance(v, str):
+        return ast.literal_eval(v)
+    return v
+
+def _load_raw(v):
+    return v
+
+def _load_shader_type(v):
+    if type(v) == BSLSPShaderType:
+        return v.value
+    elif type(v) == str:
+        return BSLSPShaderType[v].value
+    else:
+        return int(v)
+
+def _load_material(v):
+    if type(v) == int:
+        return v
+    else:
+        return SkyrimHavokMaterial[v].value
+
+# Converters from property values to buffer values, by field name. Enum fields accept
+# the enum name.
+FIELD_LOADERS = {
+    'Shader_Flags_1': lambda v: ShaderFlags1.parse(v).value,
+    'Shader_Flags_2': lambda v: ShaderFlags2.parse(v).value,
+    'Shader_Type': _load_shader_type,
+    'collisionFilter_layer': lambda v: SkyrimCollisionLayer[v].value,
+    'collisionFilterCopy_layer': lambda v: SkyrimCollisionLayer[v].value,
+    'broadPhaseType': lambda v: BroadPhaseType[v].value,
+    'collisionResponse': lambda v: hkResponseType[v].value,
+    'collisionResponse2': lambda v: hkResponseType[v].value,
+    'motionSystem': lambda v: hkMotionType[v].value,
+    'deactivatorType': lambda v: hkDeactivatorType[v].value,
+    'solverDeactivation': lambda v: hkSolverDeactivation[v].value,
+    'qualityType': lambda v: hkQualityType[v].value,
+    'bhkMaterial': _load_material,
+    }
+
+# Converters by ctypes type name, for fields not in FIELD_LOADERS.
+TYPE_LOADERS = {
+    'c_float_Array_2': lambda v: VECTOR2(*_parse_literal(v)),
+    'c_float_Array_3': lambda v: VECTOR3(*_parse_literal(v)),
+    'c_float_Array_4': lambda v: VECTOR4(*_parse_literal(v)),
+    'c_float_Array_12': lambda v: VECTOR12(*_parse_literal(v)),
+    'c_ushort_Array_6': lambda v: VECTOR6_SHORT(*_parse_literal(v)),
+    'c_float': float,
+    }
+for _tn in ['c_ubyte', 'c_ulong', 'c_uint8', 'c_uint16', 'c_uint32', 'c_ulonglong']:
+    TYPE_LOADERS[_tn] = int
+
+
 class pynStructure(Structure):
     nifly = None
     logger = None
 
+    # Per-class caches, see _default_image, _defaults, _load_table, and _extract_table
+    _default_images = {}
+    _default_instances = {}
+    _load_tables = {}
+    _extract_tables = {}
+
     def warn(self, msg):
         if pynStructure.logger: pynStructure.logger.warning(msg)
         self.warnings.append(msg)
 
+    @classmethod
+    def _load_table(cls):
+        """Return (field name, converter) for each field of the class. Built once per
+        class."""
+        table = pynStructure._load_tables.get(cls)
+        if table is None:
+            table = [(f, FIELD_LOADERS.get(f) or TYPE_LOADERS.get(t.__name__, _load_raw))
+                     for f, t in cls._fields_]
+            pynStructure._load_tables[cls] = table
+        return table
+
+    @classmethod
+    def _extract_table(cls):
+        """Return (field name, field type, is array) for each field extract() should
+        consider. Built once per class."""
+        table = pynStructure._extract_tables.get(cls)
+        if table is None:
+            table = [(f, t, issubclass(t, Array)) for f, t in cls._fields_
+                     if f != 'bufType' and f != 'bufSize' and f[-2:] != 'ID']
+            pynStructure._extract_tables[cls] = table
+        return table
+
     def load(self, shape, ignore=[]):
         """
         Load fields from the dictionary-like object 'shape'. 
         Return list of warnings if any fields can't be set. 
         """
         self.warnings = []
-        for f, t in self._fields_:
-            v = None
+        keys = shape.keys()
+        for f, convert in self._load_table():
+            if f in ignore or not (f in keys):
+                continue
             try:
-                if f in ignore:
-                    pass
-                elif not (f in shape.keys()):
-                    pass
-                elif f == 'Shader_Flags_1':
-                    v = ShaderFlags1.parse(shape[f]).value
-                elif f == 'Shader_Flags_2':
-                    v = ShaderFlags2.parse(shape[f]).value
-                elif f == 'Shader_Type':
-                    if type(shape[f]) == BSLSPShaderType:
-                        v = shape[f].value
-                    elif type(shape[f]) == str:
-                        mykey = str(shape[f])
-                        myenum = BSLSPShaderType[mykey]
-                        myval = myenum.value
-                        v = myval
-                    else:
-                        v = int(shape[f])
-                elif f == 'collisionFilter_layer' or f == 'collisionFilterCopy_layer':
-                    v = SkyrimCollisionLayer[shape[f]].value
-                elif f == 'broadPhaseType':
-                    v = BroadPhaseType[shape[f]].value
-                elif f == 'collisionResponse':
-                    v = hkResponseType[shape[f]].value
-                elif f == 'collisionResponse2':
-                    v = hkResponseType[shape[f]].value
-                elif f == 'motionSystem':
-                    v = hkMotionType[shape[f]].value
-                elif f == 'deactivatorType':
-                    v = hkDeactivatorType[shape[f]].value
-                elif f == 'solverDeactivation': 
-                    v = hkSolverDeactivation[shape[f]].value
-                elif f == 'qualityType':
-                    v = hkQualityType[shape[f]].value
-                elif f == 'bhkMaterial':
-                    if type(shape[f]) == int:
-                        v = shape[f] 
-                    else:
-                        v = SkyrimHavokMaterial[shape[f]].value
-                elif t.__name__ == 'c_float_Array_2':
-                    v = VECTOR2(*eval(shape[f]))
-                elif t.__name__ == 'c_float_Array_3':
-                    v = VECTOR3(*eval(shape[f]))
-                elif t.__name__ == 'c_float_Array_4':
-                    v = VECTOR4(*eval(shape[f]))
-                elif t.__name__ == 'c_float_Array_12':
-                    v = VECTOR12(*eval(shape[f]))
-                elif t.__name__ == 'c_ushort_Array_6':
-                    v = VECTOR6_SHORT(*eval(shape[f]))
-                elif t.__name__ == 'c_float':
-                    v = float(shape[f])
-                elif t.__name__ in ['c_ubyte', 'c_ulong', 'c_uint8', 'c_uint16', 'c_uint32', 'c_ulong', 'c_ulonglong']:
-                    v = int(shape[f])
-                else:
-                    v = shape[f]
+                v = convert(shape[f])
                 if v is not None:
                     self.__setattr__(f, v)
             except KeyError as e:
@@ -252,15 +284,65 @@ class pynStructure(Structure):
             except Exception as e:
                 self.warn(f"Error setting property {f} <- {shape[f]}")
 
+    @classmethod
+    def _default_image(cls):
+        """
+        Return the class's default values as (runs, warnings). Runs are (offset, bytes)
+        pairs covering bufSize and the fields set from pynBufferDefaults, so they can be
+        copied into a new instance with memmove. Fields the subclass sets for itself are
+        left alone. Built once per class.
+        """
+        img = pynStructure._default_images.get(cls)
+        if img is None:
+            proto = cls.__new__(cls)
+            names = [f for f, t in cls._fields_]
+            fields = []
+            if "bufSize" in names:
+                proto.bufSize = sizeof(proto)
+                fields.append("bufSize")
+            warnings = []
+            for f in names:
+                if f in pynBufferDefaults:
+                    proto.load({f: pynBufferDefaults[f]})
+                    if proto.warnings:
+                        warnings.extend(proto.warnings)
+                    else:
+                        fields.append(f)
+
+            raw = string_at(addressof(proto), sizeof(proto))
+            runs = []
+            for f in sorted(fields, key=lambda f: getattr(cls, f).offset):
+                d = getattr(cls, f)
+                if runs and runs[-1][1] == d.offset:
+                    runs[-1][1] = d.offset + d.size
+                else:
+                    runs.append([d.offset, d.offset + d.size])
+            img = ([(start, raw[start:end]) for start, end in runs], warnings)
+            pynStructure._default_images[cls] = img
+        return img
+
+    @classmethod
+    def _defaults(cls):
+        """
+        Return an instance of the class with default values, for comparison. Don't
+        change it. Built once per class and nifly DLL, because some buffers get their
+        defaults from the DLL.
+        """
+        d = pynStructure._default_instances.get(cls)
+        if d is None or d[0] is not pynStructure.nifly:
+            d = (pynStructure.nifly, cls())
+            pynStructure._default_instances[cls] = d
+        return d[1]
+
     def __init__(self, values=None):
         """Initialize structure from 'values'."""
         super().__init__()
-        if "bufSize" in [n for n, t in self._fields_]:
-            self.__setattr__("bufSize", sizeof(self))
-                
-        self.warnings = []
+        runs, warnings = self._default_image()
+        base = addressof(self)
+        for offset, data in runs:
+            memmove(base + offset, data, len(data))
+        self.warnings = list(warnings)
 
-        self.load(pynBufferDefaults)
         if values:
             self.load(values)
 
@@ -338,7 +420,7 @@ class pynStructure(Structure):
         dictionary-like "shape". Subclasses can override this for special handling
         on fields that are interpreted for the user.
         """
-        if '_Array_' in fieldtype.__name__:
+        if issubclass(fieldtype, Array):
             v = [x for x in self.__getattribute__(fieldname)]
         else:
             v = self.__getattribute__(fieldname)
@@ -357,10 +439,10 @@ class pynStructure(Structure):
         Extract fields to the dictionary-like object 'shape'. Do not extract any ID
         fields. Do not extract fields that match their default values.
         """
-        defaults = self.__class__()
-        for fn, t in self._fields_:
-            if fn != 'bufType' and fn != 'bufSize' and fn[-2:] != 'ID' and fn not in ignore:
-                if '_Array_' in t.__name__:
+        defaults = self._defaults()
+        for fn, t, is_array in self._extract_table():
+            if fn not in ignore:
+                if is_array:
                     v1 = [x for x in self.__getattribute__(fn)]
                     v2 = [x for x in defaults.__getattribute__(fn)]
                 else:
@@ -2223,6 +2305,24 @@ class VERTEX_WEIGHT_PAIR(Structure):
     _fields_ = [("vertex", c_uint16),
                 ("weight", c_float)]
 
+class GeometryBuf(Structure):
+    """Pointers to caller-allocated arrays for getShapeGeometry. Null pointers are
+    skipped."""
+    _fields_ = [("bufSize", c_uint16),
+                ("vertexCount", c_int),
+                ("triangleCount", c_int),
+                ("verts", c_void_p),
+                ("normals", c_void_p),
+                ("uvs", c_void_p),
+                ("tris", c_void_p),
+                ("colors", c_void_p),
+                ("weightBones", c_void_p),
+                ("weights", c_void_p)]
+
+    def __init__(self):
+        super().__init__()
+        self.bufSize = sizeof(self)
+
 #class MAT_TRANSFORM(Structure):
 #    _fields_ = [("translation", VECTOR3),
 #                ("rotation", MATRIX3),
@@ -2349,6 +2449,26 @@ class ModuleTest:
         assert SkyrimHavokMaterial.get_name(3049421844) == "MATERIAL_BONE", f"Material correct: {SkyrimHavokMaterial.get_name(3049421844)}"
         assert SkyrimHavokMaterial.get_name(53) == "53", f"Material correct: {SkyrimHavokMaterial.get_name(53)}"
 
+        print("---Testing that cached defaults leave subclass settings alone")
+        p = AlphaPropertyBuf()
+        assert p.flags == 4844, f"Subclass default kept: {p.flags}"
+        assert p.bufSize == sizeof(AlphaPropertyBuf), f"bufSize set: {p.bufSize}"
+        p.flags = 1
+        assert AlphaPropertyBuf().flags == 4844, f"New instance not affected"
+        p = bhkRigidBodyProps()
+        p.maxLinearVelocity = 10
+        assert round(bhkRigidBodyProps().maxLinearVelocity, 4) == 104.4, f"Defaults not affected"
+
+        print("---Testing that vector properties round-trip")
+        p = bhkBoxShapeProps({"bhkDimensions": "(0.5, 1.5, 2.5)"})
+        assert list(p.bhkDimensions) == [0.5, 1.5, 2.5], f"Dimensions loaded: {list(p.bhkDimensions)}"
+        d = {}
+        p.extract(d)
+        assert eval(d["bhkDimensions"]) == [0.5, 1.5, 2.5], f"Dimensions extracted: {d}"
+        assert list(bhkBoxShapeProps(d).bhkDimensions) == [0.5, 1.5, 2.5]
+        p = bhkBoxShapeProps({"bhkDimensions": "__import__('os').getcwd()"})
+        assert len(p.warnings) == 1, f"Expressions are not evaluated: {p.warnings}"
+
 
 if __name__ == "__main__":
     pynStructure.logger = logging.getLogger("pynifly")
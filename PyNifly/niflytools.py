@@ -12,6 +12,11 @@ import re
 import tempfile
 import shutil
 from pathlib import Path
+try:
+    import numpy as np
+except ImportError:
+    # numpy ships with Blender but may be missing in a bare python install.
+    np = None
 
 
 logging.basicConfig(encoding='utf-8', level=logging.DEBUG)
@@ -247,6 +252,45 @@ def vert_uv_key(vert_index, uv):
     return str(vert_index) + "_" + str(uv)
 
 
+def uv_split_indices(loops, uvmap, vert_count):
+    """Array version of the split done by mesh_split_by_uv.
+        loops = [int, ...] indices into verts
+        uvmap = [(u, v), ...] 1:1 with loops
+        vert_count = number of verts before splitting
+    Returns (new_loops, gather)
+        new_loops = loops remapped to the split verts
+        gather = indices of the verts to duplicate. Vert vert_count+i is a copy of
+            gather[i], so any per-vert list can be extended with list[gather].
+    Each (vert, UV location) pair becomes one integer key, so the splits come out of a
+    single np.unique. A vert keeps its index for the first UV location it is used with;
+    copies are numbered in order of first use, same as the loop walk.
+    """
+    loops = np.asarray(loops, dtype=np.int64).reshape(-1)
+    if len(loops) == 0:
+        return loops, loops
+    quv = np.rint(np.asarray(uvmap, dtype=np.float64).reshape(-1, 2) * 10000).astype(np.int64)
+    quv -= quv.min(axis=0)
+    span_u, span_v = (int(n) + 1 for n in quv.max(axis=0))
+    if vert_count * span_u * span_v < 2**62:
+        keys = (loops * span_u + quv[:,0]) * span_v + quv[:,1]
+        _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    else:
+        _, first, inverse = np.unique(np.column_stack((loops, quv)), axis=0,
+                                      return_index=True, return_inverse=True)
+    inverse = inverse.reshape(-1)
+
+    # The key a vert is first used with keeps the vert's index
+    key_vert = loops[first]
+    vert_first = np.full(vert_count, len(loops), dtype=np.int64)
+    np.minimum.at(vert_first, key_vert, first)
+    key_index = key_vert.copy()
+    extra = np.flatnonzero(first != vert_first[key_vert])
+    extra = extra[np.argsort(first[extra], kind='stable')]
+    key_index[extra] = vert_count + np.arange(len(extra))
+
+    return key_index[inverse], key_vert[extra]
+
+
 def mesh_split_by_uv(verts, loops, norms, uvmap, weights, morphdict):
     """Split a mesh represented by parameters and split verts if necessary because it
         (1) maps to 2 UV locations or (2) has split normals.
@@ -264,6 +308,22 @@ def mesh_split_by_uv(verts, loops, norms, uvmap, weights, morphdict):
         uvmap = not changed
         weights = extended to match verts
     """
+    if np is not None:
+        new_loops, gather = uv_split_indices(loops, uvmap, len(verts))
+        loops[:] = new_loops.tolist()
+        if len(gather) == 0:
+            return
+        gather = gather.tolist()
+        verts.extend([verts[i] for i in gather])
+        if weights:
+            weights.extend([weights[i] for i in gather])
+        for k, vlist in morphdict.items():
+            if isinstance(vlist, np.ndarray):
+                morphdict[k] = np.concatenate((vlist, vlist[gather]))
+            else:
+                vlist.extend([vlist[i] for i in gather])
+        return
+
     # Walk the loops. If the associated UV puts the vert in a new location, dup the vert
     vert_uvs = [None] * len(verts) # found UV locations of verts
     #vert_norms = [(0.0, 0.0, 0.0)] * len(verts) # found normals of verts
@@ -292,6 +352,98 @@ def mesh_split_by_uv(verts, loops, norms, uvmap, weights, morphdict):
                 change_table[vert_key] = new_index
 
 
+class VertexWeights:
+    """Vertex group weights for a mesh as a sparse (CSR) table. Requires numpy.
+        indptr = (n+1,) array. Vert i's entries are indptr[i]:indptr[i+1]
+        groups = group index of each entry
+        weights = weight of each entry
+        names = group names, indexed by group index
+    Indexing gives a vert's weights as {group-name: weight}, so the table can stand in for
+    a list of weight dictionaries.
+    """
+    def __init__(self, indptr, groups, weights, names):
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.groups = np.asarray(groups, dtype=np.int32)
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.names = list(names)
+
+    @classmethod
+    def from_counts(cls, counts, groups, weights, names):
+        """Build the table from the number of entries for each vert and the flat entry 
+        lists. Entries whose group index isn't in names are dropped with an error.
+        """
+        counts = np.asarray(counts, dtype=np.int64)
+        groups = np.asarray(groups, dtype=np.int32)
+        weights = np.asarray(weights, dtype=np.float32)
+        valid = (groups >= 0) & (groups < len(names))
+        if not valid.all():
+            rows = np.repeat(np.arange(len(counts)), counts)
+            for v, g in zip(rows[~valid].tolist(), groups[~valid].tolist()):
+                log.error(f"ERROR: Vertex #{v} references invalid group #{g}")
+            counts = np.bincount(rows[valid], minlength=len(counts))
+            groups = groups[valid]
+            weights = weights[valid]
+        return cls(np.concatenate(([0], np.cumsum(counts))), groups, weights, names)
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    def __getitem__(self, vert_index):
+        s, e = self.indptr[vert_index], self.indptr[vert_index+1]
+        return {self.names[g]: w for g, w in 
+                zip(self.groups[s:e].tolist(), self.weights[s:e].tolist())}
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def take(self, vert_indices):
+        """Return a new table with the rows for the given verts, in order."""
+        vert_indices = np.asarray(vert_indices, dtype=np.int64)
+        starts = self.indptr[vert_indices]
+        counts = self.indptr[vert_indices+1] - starts
+        indptr = np.concatenate(([0], np.cumsum(counts)))
+        entries = np.arange(indptr[-1]) + np.repeat(starts - indptr[:-1], counts)
+        return VertexWeights(indptr, self.groups[entries], self.weights[entries], self.names)
+
+    def group_names(self, group_indices):
+        """Return the names of the distinct groups in the index array."""
+        return [self.names[g] for g in np.unique(group_indices).tolist()]
+
+    def top_four(self, group_names, min_weight=0.00005):
+        """Return each vert's 4 heaviest weights among the given groups, normalized to add
+        up to 1. Weights at or below min_weight are ignored.
+        Returns (groups, weights), both (n, 4) arrays. Unused slots have 0 weight.
+        """
+        n = len(self)
+        counts = np.diff(self.indptr)
+        rows = np.repeat(np.arange(n), counts)
+        cols = np.arange(len(self.groups)) - np.repeat(self.indptr[:-1], counts)
+        wanted = set(group_names)
+        in_set = np.array([nm in wanted for nm in self.names], dtype=bool)
+        keep = (self.weights > min_weight)
+        if len(in_set) > 0:
+            keep &= in_set[self.groups]
+
+        width = max(4, int(counts.max()) if n > 0 else 0)
+        dense_w = np.zeros((n, width), dtype=np.float32)
+        dense_g = np.zeros((n, width), dtype=np.int32)
+        dense_w[rows[keep], cols[keep]] = self.weights[keep]
+        dense_g[rows[keep], cols[keep]] = self.groups[keep]
+
+        if width > 4:
+            top = np.argpartition(-dense_w, 3, axis=1)[:, :4]
+            dense_w = np.take_along_axis(dense_w, top, axis=1)
+            dense_g = np.take_along_axis(dense_g, top, axis=1)
+        order = np.argsort(-dense_w, axis=1, kind='stable')
+        dense_w = np.take_along_axis(dense_w, order, axis=1)
+        dense_g = np.take_along_axis(dense_g, order, axis=1)
+
+        total = dense_w.sum(axis=1, keepdims=True)
+        np.divide(dense_w, total, out=dense_w, where=(total > 0))
+        return dense_g, dense_w
+
+
 # ----------------------- Game-specific Skeleton Dictionaries ---------------------------
 
 def blender_basename(n):
@@ -1899,6 +2051,32 @@ if __name__ == "__main__":
     # # Any loop entry referencing vert 5 should have same UV location as one referencing 7
     # assert loops[1] == 5 and loops[10] == 7 and uvs[1] != uvs[10], "Error: Duplicating UV locations correctly"
 
+    if np is not None:
+        print("--Array split numbers new verts in order of first use")
+        # Vert 1 is used at 3 UV locations, vert 0 at 2.
+        loops = [1, 0, 1, 0, 1, 2, 1, 0, 2]
+        uvs = [(0.1, 0.1), (0.5, 0.5), (0.2, 0.2),
+               (0.6, 0.6), (0.1, 0.10000001), (0.0, 0.0),
+               (0.3, 0.3), (0.5, 0.5), (0.0, 0.0)]
+        new_loops, gather = uv_split_indices(loops, uvs, 3)
+        assert new_loops.tolist() == [1, 0, 3, 4, 1, 2, 5, 0, 2], f"Error: Loops remapped: {new_loops}"
+        assert gather.tolist() == [1, 0, 1], f"Error: Gather indices: {gather}"
+
+        print("--Weight table picks the 4 heaviest bones and normalizes them")
+        # Group 6 doesn't exist and is dropped
+        vw = VertexWeights.from_counts(
+            [6, 2, 0],
+            [0, 1, 2, 3, 4, 5, 1, 6],
+            [0.1, 0.5, 0.2, 0.3, 0.4, 1.0, 0.00001, 1.0],
+            ['A', 'B', 'C', 'D', 'E', 'SBP_32'])
+        assert len(vw) == 3 and vw[1] == {'B': vw.weights[6]}, f"Error: Rows read correctly: {vw[1]}"
+        groups, weights = vw.top_four(['A', 'B', 'C', 'D', 'E'])
+        assert groups[0].tolist() == [1, 4, 3, 2], f"Error: Heaviest bones first: {groups[0]}"
+        assert NearEqual(weights[0].sum(), 1.0), f"Error: Weights normalized: {weights[0]}"
+        assert weights[1].sum() == 0 and weights[2].sum() == 0, f"Error: Tiny weights ignored"
+        vw2 = vw.take([2, 0, 0])
+        assert len(vw2) == 3 and vw2[2] == vw[0] and vw2[0] == {}, f"Error: Rows gathered"
+
 
     print("""####################################################################################
     Game skeletons translate to and from blender conventions. This allows blender mirror operations
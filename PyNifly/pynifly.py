@@ -10,9 +10,17 @@ from enum import Enum, IntFlag, IntEnum
 from math import asin, atan2, pi, sin, cos
 import re
 import logging
+from collections import namedtuple
+from functools import lru_cache
 from ctypes import *
 from typing import ValuesView # c_void_p, c_int, c_bool, c_char_p, c_wchar_p, c_float, c_uint8, c_uint16, c_uint32, create_string_buffer, Structure, cdll, pointer, addressof
 import xml.etree.ElementTree as xml
+try:
+    import numpy as np
+except ImportError:
+    # numpy ships with Blender but may be missing in a bare python install. Only the
+    # *_array accessors need it.
+    np = None
 from niflytools import *
 from nifdefs import *
 import xmltools
@@ -244,6 +252,52 @@ def load_nifly(nifly_path):
     nifly.skinShape.argtypes = [c_void_p, c_void_p]
     nifly.skinShape.restype = None
 
+    # Bulk calls added in later versions of the DLL. NiShape falls back to the 
+    # per-element calls if they aren't there.
+    try:
+        nifly.getShapeGeometry.argtypes = [c_void_p, c_void_p, POINTER(GeometryBuf)]
+        nifly.getShapeGeometry.restype = c_int
+    except AttributeError:
+        pass
+    try:
+        nifly.setShapeWeightsBulk.argtypes = [c_void_p, c_void_p, c_int, c_void_p, c_void_p]
+        nifly.setShapeWeightsBulk.restype = None
+    except AttributeError:
+        pass
+    try:
+        nifly.getBlockNames.argtypes = [c_void_p, c_char_p, c_int]
+        nifly.getBlockNames.restype = c_int
+    except AttributeError:
+        pass
+    try:
+        nifly.getAnimKeysLinearQuat.argtypes = [c_void_p, c_int, c_int, c_int, POINTER(NiAnimKeyLinearQuatBuf)]
+        nifly.getAnimKeysLinearQuat.restype = c_int
+        nifly.getAnimKeysLinearTrans.argtypes = [c_void_p, c_int, c_int, c_int, POINTER(NiAnimKeyLinearTransBuf)]
+        nifly.getAnimKeysLinearTrans.restype = c_int
+        nifly.getAnimKeysLinearXYZ.argtypes = [c_void_p, c_int, c_char, c_int, c_int, POINTER(NiAnimKeyLinearXYZBuf)]
+        nifly.getAnimKeysLinearXYZ.restype = c_int
+        nifly.getAnimKeysQuadFloat.argtypes = [c_void_p, c_int, c_int, c_int, POINTER(NiAnimKeyFloatBuf)]
+        nifly.getAnimKeysQuadFloat.restype = c_int
+        nifly.getAnimKeysQuadTrans.argtypes = [c_void_p, c_int, c_int, c_int, POINTER(NiAnimKeyQuadTransBuf)]
+        nifly.getAnimKeysQuadTrans.restype = c_int
+        nifly.getAnimKeysQuadXYZ.argtypes = [c_void_p, c_int, c_char, c_int, c_int, POINTER(NiAnimKeyFloatBuf)]
+        nifly.getAnimKeysQuadXYZ.restype = c_int
+    except AttributeError:
+        pass
+    try:
+        nifly.addAnimKeysLinearQuat.argtypes = [c_void_p, c_int, c_int, POINTER(NiAnimKeyLinearQuatBuf)]
+        nifly.addAnimKeysLinearQuat.restype = c_int
+        nifly.addAnimKeysLinearTrans.argtypes = [c_void_p, c_int, c_int, POINTER(NiAnimKeyLinearTransBuf)]
+        nifly.addAnimKeysLinearTrans.restype = c_int
+        nifly.addAnimKeysQuadFloat.argtypes = [c_void_p, c_int, c_int, POINTER(NiAnimKeyFloatBuf)]
+        nifly.addAnimKeysQuadFloat.restype = c_int
+        nifly.addAnimKeysQuadTrans.argtypes = [c_void_p, c_int, c_int, POINTER(NiAnimKeyQuadTransBuf)]
+        nifly.addAnimKeysQuadTrans.restype = c_int
+        nifly.addAnimKeysQuadXYZ.argtypes = [c_void_p, c_int, c_char, c_int, POINTER(NiAnimKeyFloatBuf)]
+        nifly.addAnimKeysQuadXYZ.restype = c_int
+    except AttributeError:
+        pass
+
     pynStructure.nifly = nifly
     pynStructure.logger = logging.getLogger("pynifly")
 
@@ -252,6 +306,22 @@ def load_nifly(nifly_path):
 
 # --- Helper Routines --- #
 
+def _ctypes_buffer(values, ctype, width):
+    """
+    Return a pointer to a contiguous buffer of ctype holding values, width elements per
+    item. values may be a sequence of tuples or anything numpy can treat as an array.
+    numpy arrays that already have the right type and layout are used without copying.
+    """
+    if np is not None:
+        arr = np.ascontiguousarray(values, dtype=np.dtype(ctype))
+        return arr.ctypes.data_as(POINTER(ctype))
+    
+    buf = (ctype * width * len(values))()
+    for i, v in enumerate(values):
+        buf[i] = tuple(v)
+    return cast(buf, POINTER(ctype))
+
+
 def get_weights_by_bone(weights_by_vert, used_groups):
     """Given a list of weights 1-1 with vertices, return weights organized by bone. 
         weights_by_vert = [dict[group-name: weight], ...] 1-1 with verts
@@ -335,6 +405,12 @@ class SkyPartition(Partition):
 
     @classmethod
     def name_match(cls, name):
+        """Return the partition ID if name is a Skyrim partition name, otherwise -1."""
+        info = partition_name_info(name)
+        return info.id if info.kind == 'SkyPartition' else -1
+
+    @classmethod
+    def _parse_name(cls, name):
         m = SkyPartition.skymatch.match(name)
         if m:
             return int(m.group(1))
@@ -362,6 +438,12 @@ class FO4Segment(Partition):
 
     @classmethod
     def name_match(cls, name):
+        """Return the segment index if name is an FO4 segment name, otherwise -1."""
+        info = partition_name_info(name)
+        return info.id if info.kind == 'FO4Segment' else -1
+
+    @classmethod
+    def _parse_name(cls, name):
         m = FO4Segment.fo4segmatch1.match(name)
         if m:
             return int(m.group(1))
@@ -420,7 +502,15 @@ class FO4Subsegment(FO4Segment):
     def name_match(cls, name):
         """ Determine whether given string is a valid FO4Subsegment name. Ignore any numeral after a hash. Returned parent name comes from built-in name structure.
             Returns: name of parent, ID (body part # or dismember hash), dismember hash of parent
+            Names that aren't subsegments return ("", -1, 0).
         """
+        info = partition_name_info(name)
+        if info.kind == 'FO4Subsegment':
+            return (info.parent, info.id, info.material)
+        return ("", -1, 0)
+
+    @classmethod
+    def _parse_name(cls, name):
         mat = 0
         m = FO4Subsegment.fo4subsegm1.match(name)
         if m:
@@ -454,6 +544,32 @@ class FO4Subsegment(FO4Segment):
         else:
             return ("", -1, mat)
 
+
+PartitionName = namedtuple("PartitionName", ["kind", "id", "parent", "material"])
+
+@lru_cache(maxsize=4096)
+def partition_name_info(name):
+    """ Classify a vertex group name as a partition name. Returns a PartitionName:
+        kind = 'SkyPartition', 'FO4Segment', 'FO4Subsegment', or None if it isn't one
+        id = partition ID, segment index, or subsegment ID
+        parent = parent segment name, for subsegments
+        material = dismember hash, for subsegments
+        Export checks the same few group names over and over, so results are cached.
+    """
+    skyid = SkyPartition._parse_name(name)
+    if skyid >= 0:
+        return PartitionName('SkyPartition', skyid, '', 0)
+
+    segid = FO4Segment._parse_name(name)
+    if segid >= 0:
+        return PartitionName('FO4Segment', segid, '', 0)
+
+    parent_name, subseg_id, material = FO4Subsegment._parse_name(name)
+    if parent_name:
+        return PartitionName('FO4Subsegment', subseg_id, parent_name, material)
+
+    return PartitionName(None, -1, '', 0)
+
 class ExtraDataType(Enum):
     BehaviorGraph = 1
     String = 2
@@ -561,9 +677,7 @@ class NiObject:
             if self.id == NODEID_NONE:
                 self._blockname = self.__class__.__name__
             else:
-                buf = create_string_buffer(128)
-                NifFile.nifly.getBlockname(self.file._handle, self.id, buf, 128)
-                self._blockname = buf.value.decode('utf-8')
+                self._blockname = self.file.get_blockname(self.id)
         return self._blockname
     
     @property
@@ -705,9 +819,7 @@ class bhkShape(NiObject):
         if properties:
             collisiontype = cls.buffer_types[properties.bufType].__name__
         elif not collisiontype:
-            buf = create_string_buffer(128)
-            NifFile.nifly.getBlockname(file._handle, id, buf, 128)
-            collisiontype = buf.value.decode('utf-8')
+            collisiontype = file.get_blockname(id)
         try:
             if id == NODEID_NONE:
                 id = NifFile.nifly.addBlock(
@@ -912,9 +1024,7 @@ class bhkWorldObject(NiObject):
         if properties:
             objtype = cls._buftype_name(properties.bufType)
         elif not objtype:
-            buf = create_string_buffer(128)
-            NifFile.nifly.getBlockname(file._handle, id, buf, 128)
-            objtype = buf.value.decode('utf-8')
+            objtype = file.get_blockname(id)
         # try:
         if id == NODEID_NONE:
             id = NifFile.nifly.addBlock(
@@ -999,9 +1109,7 @@ class NiCollisionObject(NiObject):
         if properties:
             collisiontype = cls._buftype_name(properties.bufType)
         elif not collisiontype:
-            buf = create_string_buffer(128)
-            NifFile.nifly.getBlockname(file._handle, id, buf, 128)
-            collisiontype = buf.value.decode('utf-8')
+            collisiontype = file.get_blockname(id)
         try:
             if id == NODEID_NONE:
                 id = NifFile.nifly.addBlock(
@@ -1148,9 +1256,7 @@ class NiNode(NiAVObject):
         if self._parent is None and self.file._handle is not None:
             parent_handle = NifFile.nifly.getNodeParent(self.file._handle, self._handle)
             if parent_handle is not None:
-                for n in self.file.nodes.values():
-                    if n._handle == parent_handle:
-                        self._parent = n
+                self._parent = self.file.nodeByHandle(parent_handle)
         return self._parent
 
     @property
@@ -1265,6 +1371,88 @@ class NiKeyFrameData(NiObject):
     pass
 
 
+def read_anim_keys(block, keytype, buftype, count, dimension=None):
+    """
+    Read all of a data block's keys of one type into a ctypes array of buftype.
+    keytype names the DLL calls, e.g. "LinearQuat" for getAnimKeysLinearQuat. Older DLLs
+    without the bulk calls are read one key at a time.
+    """
+    keys = (buftype * count)()
+    if count == 0: return keys
+    args = [block.file._handle, block.id]
+    if dimension: args.append(dimension.encode('utf-8'))
+
+    NifFile.clear_log()
+    if hasattr(NifFile.nifly, 'getAnimKeys' + keytype):
+        n = getattr(NifFile.nifly, 'getAnimKeys' + keytype)(*args, 0, count, keys)
+        if n != count:
+            raise Exception(f"Error reading {keytype} keys from block {block.id}: {NifFile.message_log()}")
+    else:
+        getkey = getattr(NifFile.nifly, 'getAnimKey' + keytype)
+        for i in range(count):
+            if getkey(*args, i, byref(keys[i])):
+                raise Exception(f"Error reading {keytype} keys from block {block.id}: {NifFile.message_log()}")
+    return keys
+
+
+def anim_key_arrays(keys):
+    """
+    Return (times, values) for an array of key buffers. These are numpy arrays viewing
+    the buffers if numpy is available, lists otherwise.
+    """
+    if np is not None:
+        a = np.frombuffer(keys, dtype=np.dtype(keys._type_))
+        return a['time'], a['value']
+    return [k.time for k in keys], [k.value if type(k.value) == float else k.value[:] 
+                                    for k in keys]
+
+
+def anim_key_buffers(buftype, times, values, forward=None, backward=None):
+    """
+    Return a ctypes array of buftype holding the given keys. values, forward, and
+    backward may be sequences of scalars or of vectors, to match buftype, or anything
+    numpy can treat as an array.
+    """
+    keys = (buftype * len(times))()
+    if np is not None:
+        a = np.frombuffer(keys, dtype=np.dtype(buftype))
+        a['time'] = times
+        a['value'] = values
+        if forward is not None: a['forward'] = forward
+        if backward is not None: a['backward'] = backward
+    else:
+        for i, k in enumerate(keys):
+            k.time = times[i]
+            k.value = values[i] if type(k.value) == float else tuple(values[i])
+            if forward is not None: 
+                k.forward = forward[i] if type(k.forward) == float else tuple(forward[i])
+            if backward is not None: 
+                k.backward = backward[i] if type(k.backward) == float else tuple(backward[i])
+    return keys
+
+
+def write_anim_keys(block, keytype, keys, dimension=None):
+    """
+    Add keys to a data block. keys is a ctypes array of key buffers or a list of them.
+    keytype names the DLL calls, e.g. "LinearQuat" for addAnimKeysLinearQuat. Older DLLs
+    without the bulk calls are written one key at a time.
+    """
+    if len(keys) == 0: return
+    args = [block.file._handle, block.id]
+    if dimension: args.append(dimension.encode('utf-8'))
+
+    if hasattr(NifFile.nifly, 'addAnimKeys' + keytype):
+        if not isinstance(keys, Array):
+            keys = (type(keys[0]) * len(keys))(*keys)
+        NifFile.clear_log()
+        if getattr(NifFile.nifly, 'addAnimKeys' + keytype)(*args, len(keys), keys) != len(keys):
+            raise Exception(f"Error writing {keytype} keys to block {block.id}: {NifFile.message_log()}")
+    else:
+        addkey = getattr(NifFile.nifly, 'addAnimKey' + keytype)
+        for k in keys:
+            addkey(*args, byref(k))
+
+
 class LinearScalarKey:
     def __init__(self, buf:NiAnimKeyLinearXYZBuf):
         self.time = buf.time
@@ -1365,13 +1553,13 @@ class NiFloatData(NiObject):
         Write quadratic float keys.
         keys = list of QuadScalarKey 
         """
-        buf = NiAnimKeyFloatBuf();
-        for k in keys:
-            buf.time = k.time
-            buf.value = k.value
-            buf.forward = k.forward
-            buf.backward = k.backward
-            NifFile.nifly.addAnimKeyQuadFloat(self.file._handle, self.id, buf)
+        if keys and not isinstance(keys[0], NiAnimKeyFloatBuf):
+            keys = anim_key_buffers(NiAnimKeyFloatBuf, 
+                                    [k.time for k in keys], 
+                                    [k.value for k in keys],
+                                    [k.forward for k in keys],
+                                    [k.backward for k in keys])
+        write_anim_keys(self, 'QuadFloat', keys)
 
     @property
     def keys(self):
@@ -1379,14 +1567,13 @@ class NiFloatData(NiObject):
         if self.id == NODEID_NONE: return None
         if self.properties.keys.interpolation != NiKeyType.QUADRATIC_KEY:
             return None
-        keys = []
-        for frame in range(0, self.properties.keys.numKeys):
-            buf = NiAnimKeyFloatBuf()
-            if NifFile.nifly.getAnimKeyQuadFloat(self.file._handle, self.id, frame, buf) != 0:
-                raise Exception(f"Error reading NiFloatDataKey: {NifFile.message_log()}")            
-            k = QuadScalarKey(buf)
-            keys.append(k)
-        return keys
+        return [QuadScalarKey(buf) for buf in self.key_buffers]
+
+    @property
+    def key_buffers(self):
+        """Keys as a ctypes array of NiAnimKeyFloatBuf, read in one call."""
+        return read_anim_keys(self, 'QuadFloat', NiAnimKeyFloatBuf, 
+                              self.properties.keys.numKeys)
 
     def keys_add(self, k):
         """
@@ -1399,6 +1586,11 @@ class NiFloatData(NiObject):
         buf.backward = k.backward
         NifFile.nifly.addAnimKeyQuadFloat(self.file._handle, self.id, buf)
 
+    def add_keys(self, times, values, forward, backward):
+        """Write quadratic float keys, given as parallel sequences."""
+        write_anim_keys(self, 'QuadFloat', 
+                        anim_key_buffers(NiAnimKeyFloatBuf, times, values, forward, backward))
+
     @classmethod
     def getbuf(cls, values=None):
         return NiFloatDataBuf(values)
@@ -1417,8 +1609,7 @@ class NiPosData(NiObject):
         Write quadratic float keys.
         keys = list of NiAnimKeyQuadTransBuf 
         """
-        for k in keys:
-            NifFile.nifly.addAnimKeyQuadTrans(self.file._handle, self.id, k)
+        write_anim_keys(self, 'QuadTrans', keys)
 
     @property
     def keys(self):
@@ -1426,11 +1617,8 @@ class NiPosData(NiObject):
             NifFile.clear_log()
             if self.properties.keys.interpolation != NiKeyType.QUADRATIC_KEY:
                 raise Exception(f"Unknown controller key type: {self.properties.keys.interpolation}")
-            self._keys = []
-            for frame in range(0, self.properties.keys.numKeys):
-                buf = NiAnimKeyQuadTransBuf()
-                NifFile.nifly.getAnimKeyQuadTrans(self.file._handle, self.id, frame, buf) 
-                self._keys.append(buf)
+            self._keys = list(read_anim_keys(
+                self, 'QuadTrans', NiAnimKeyQuadTransBuf, self.properties.keys.numKeys))
         return self._keys
 
     def add_key(self, key):
@@ -1444,6 +1632,11 @@ class NiPosData(NiObject):
         buf.backward = key.backward
         NifFile.nifly.addAnimKeyQuadTrans(self.file._handle, self.id, buf)
 
+    def add_keys(self, times, values, forward, backward):
+        """Write quadratic keys, given as parallel sequences of times and 3-vectors."""
+        write_anim_keys(self, 'QuadTrans', 
+                        anim_key_buffers(NiAnimKeyQuadTransBuf, times, values, forward, backward))
+
     @classmethod
     def New(cls, file, interpolation, parent=None):
         p = NiPosDataBuf()
@@ -1466,32 +1659,81 @@ class NiTransformData(NiKeyFrameData):
 
     def __init__(self, handle=None, file=None, id=NODEID_NONE, properties=None, parent=None):
         super().__init__(handle=handle, file=file, id=id, properties=properties, parent=parent)
-        
-        self.xrotations = []
-        self.yrotations = []
-        self.zrotations = []
-        self.qrotations = []
-        self.translations = []
         self.scales = []
 
-        if self.properties.rotationType == NiKeyType.XYZ_ROTATION_KEY:
-            self._readxyzrot()
-        elif self.properties.rotationType in [NiKeyType.LINEAR_KEY, NiKeyType.QUADRATIC_KEY]:
-            self._readlinrot()
-
-        for frame in range(0, self.properties.translations.numKeys):
-            k = None
-            if self.properties.translations.interpolation == NiKeyType.LINEAR_KEY:
-                buf = NiAnimKeyLinearTransBuf()
-                NifFile.nifly.getAnimKeyLinearTrans(self.file._handle, self.id, frame, buf)
-                k = LinearVectorKey(buf)
-            elif self.properties.translations.interpolation == NiKeyType.QUADRATIC_KEY:
-                buf = NiAnimKeyQuadTransBuf()
-                NifFile.nifly.getAnimKeyQuadTrans(self.file._handle, self.id, frame, buf)
-                k = QuadVectorKey(buf)
-            else:
-                NifFile.log.warning(f"Found unknown key type: {self.properties.translations.interpolation}")
-            if k: self.translations.append(k)
+        # Keys are read from the nif only when a track is used, and key objects are 
+        # only created if they are asked for. {track: [key buffers, key class, keys]}
+        self._tracks = {}
+
+    def _read_track(self, track):
+        """Read the keys for a track. Return (key buffers, key class)."""
+        p = self.properties
+        if track == 'Q':
+            if p.rotationType in [NiKeyType.LINEAR_KEY, NiKeyType.QUADRATIC_KEY]:
+                return (read_anim_keys(self, 'LinearQuat', NiAnimKeyLinearQuatBuf, p.rotationKeyCount), 
+                        LinearQuatKey)
+        elif track in 'XYZ':
+            rots = getattr(p, track.lower() + 'Rotations')
+            if p.rotationType != NiKeyType.XYZ_ROTATION_KEY:
+                pass
+            elif rots.interpolation == NiKeyType.QUADRATIC_KEY:
+                return (read_anim_keys(self, 'QuadXYZ', NiAnimKeyFloatBuf, rots.numKeys, track), 
+                        QuadScalarKey)
+            elif rots.interpolation == NiKeyType.LINEAR_KEY:
+                return (read_anim_keys(self, 'LinearXYZ', NiAnimKeyLinearXYZBuf, rots.numKeys, track), 
+                        LinearScalarKey)
+            elif rots.numKeys > 0:
+                NifFile.log.warning(f"Found unknown key type: {rots.interpolation}")
+        elif track == 'T':
+            if p.translations.interpolation == NiKeyType.LINEAR_KEY:
+                return (read_anim_keys(self, 'LinearTrans', NiAnimKeyLinearTransBuf, p.translations.numKeys), 
+                        LinearVectorKey)
+            elif p.translations.interpolation == NiKeyType.QUADRATIC_KEY:
+                return (read_anim_keys(self, 'QuadTrans', NiAnimKeyQuadTransBuf, p.translations.numKeys), 
+                        QuadVectorKey)
+            elif p.translations.numKeys > 0:
+                NifFile.log.warning(f"Found unknown key type: {p.translations.interpolation}")
+        return (NiAnimKeyLinearXYZBuf * 0)(), LinearScalarKey
+
+    def key_buffers(self, track):
+        """
+        Return a track's keys as a ctypes array of key buffers. track is 'X', 'Y', or
+        'Z' for XYZ rotations, 'Q' for quaternion rotations, 'T' for translations.
+        """
+        if track not in self._tracks:
+            self._tracks[track] = [*self._read_track(track), None]
+        return self._tracks[track][0]
+
+    def key_arrays(self, track):
+        """Return a track's keys as (times, values). See anim_key_arrays."""
+        return anim_key_arrays(self.key_buffers(track))
+
+    def _keys(self, track):
+        bufs = self.key_buffers(track)
+        t = self._tracks[track]
+        if t[2] is None:
+            t[2] = [t[1](b) for b in bufs]
+        return t[2]
+
+    @property
+    def xrotations(self):
+        return self._keys('X')
+
+    @property
+    def yrotations(self):
+        return self._keys('Y')
+
+    @property
+    def zrotations(self):
+        return self._keys('Z')
+
+    @property
+    def qrotations(self):
+        return self._keys('Q')
+
+    @property
+    def translations(self):
+        return self._keys('T')
 
     @classmethod
     def getbuf(cls, values=None):
@@ -1523,39 +1765,6 @@ class NiTransformData(NiKeyFrameData):
         # td = NiTransformData(file=file, id=id, properties=p, parent=parent)
         return td
     
-    def _readlinrot(self):
-        """Read keys when the type is LINEAR_KEY or QUADRATIC_KEY. These are time, value
-        pairs where the value is a quaternion. 
-        """
-        for frame in range(0, self.properties.rotationKeyCount):
-            buf = NiAnimKeyLinearQuatBuf()
-            NifFile.nifly.getAnimKeyLinearQuat(self.file._handle, self.id, frame, buf)
-            k = LinearQuatKey(buf)
-            self.qrotations.append(k)
-
-    def _readxyzrot(self):
-        """Read keys when the type is XYZ_ROTATION_KEY. X, Y, and Z values are in separate
-        lists and each can have a different key type. """
-        for d, p, v in [('X', self.properties.xRotations, self.xrotations), 
-                        ('Y', self.properties.yRotations, self.yrotations), 
-                        ('Z', self.properties.zRotations, self.zrotations)]:
-            for f in range(0, p.numKeys):
-                k = self._readrotkey(d, f, p)
-                v.append(k)
-
-    def _readrotkey(self, d, frame, rots):
-        dimension = c_char()
-        dimension.value = d.encode('utf-8')
-        if rots.interpolation == NiKeyType.QUADRATIC_KEY:
-            buf = NiAnimKeyFloatBuf()
-            NifFile.nifly.getAnimKeyQuadXYZ(self.file._handle, self.id, dimension, frame, buf)
-            k = QuadScalarKey(buf)
-        elif rots.interpolation == NiKeyType.LINEAR_KEY:
-            buf = NiAnimKeyLinearXYZBuf()
-            NifFile.nifly.getAnimKeyLinearXYZ(self.file._handle, self.id, dimension, frame, buf)
-            k = LinearScalarKey(buf)
-        return k
-
     def add_translation_key(self, time, loc):
         """Add a key that does a translation. Keys must be added in time order."""
         buf = NiAnimKeyLinearTransBuf()
@@ -1563,13 +1772,24 @@ class NiTransformData(NiKeyFrameData):
         buf.value = loc[:]
         NifFile.nifly.addAnimKeyLinearTrans(self.file._handle, self.id, buf)
 
+    def add_translation_keys(self, times, values, forward=None, backward=None):
+        """
+        Add translation keys, given as parallel sequences of times and 3-vectors. Keys
+        are linear unless forward and backward tangents are given.
+        """
+        if forward is None:
+            write_anim_keys(self, 'LinearTrans',
+                            anim_key_buffers(NiAnimKeyLinearTransBuf, times, values))
+        else:
+            write_anim_keys(self, 'QuadTrans', 
+                            anim_key_buffers(NiAnimKeyQuadTransBuf, times, values, forward, backward))
+
     def add_quad_translation_keys(self, keys):
         """
         Add tranlation keys with quadratic interpolation.
         keys = [NiAnimKeyQuadTransBuf, ...]
         """
-        for k in keys:
-            NifFile.nifly.addAnimKeyQuadTrans(self.file._handle, self.id, k)
+        write_anim_keys(self, 'QuadTrans', keys)
 
     def add_qrotation_key(self, time, q):
         """
@@ -1581,6 +1801,14 @@ class NiTransformData(NiKeyFrameData):
         buf.value = q[:]
         NifFile.nifly.addAnimKeyLinearQuat(self.file._handle, self.id, buf)
 
+    def add_qrotation_keys(self, times, values):
+        """
+        Add rotation keys given as parallel sequences of times and quaternions (w, x, y,
+        z), linear interpolation.
+        """
+        write_anim_keys(self, 'LinearQuat', 
+                        anim_key_buffers(NiAnimKeyLinearQuatBuf, times, values))
+
     def add_xyz_rotation_keys(self, dimension, key_list):
         """
         Add XYZ rotation keys.
@@ -1597,11 +1825,7 @@ class NiTransformData(NiKeyFrameData):
             keytype = self.properties.scales.interpolation
         
         if keytype == NiKeyType.QUADRATIC_KEY:
-            d = c_char()
-            d.value = dimension.encode('utf-8')
-            for q in key_list:
-                NifFile.nifly.addAnimKeyQuadXYZ(
-                    self.file._handle, self.id, d, byref(q))
+            write_anim_keys(self, 'QuadXYZ', key_list, dimension)
 
 
 class NiInterpolator(NiObject):
@@ -2861,9 +3085,7 @@ class NiShape(NiNode):
         if not shapetype:
             if id == NODEID_NONE:
                 id = NifFile.nifly.getBlockID(file._handle, handle)
-            buf = create_string_buffer(128)
-            NifFile.nifly.getBlockname(file._handle, id, buf, 128)
-            shapetype = buf.value.decode('utf-8')
+            shapetype = file.get_blockname(id)
         try:
             if not handle and id == NODEID_NONE:
                 id = NifFile.nifly.addBlock(
@@ -2900,6 +3122,7 @@ class NiShape(NiNode):
         self._is_skinned = False
         self._verts = None
         self._weights = None
+        self._geom_bufs = {}
         self._partitions = None
         self._partition_tris = None
         self._segment_file = ''
@@ -2911,49 +3134,169 @@ class NiShape(NiNode):
     def _setShapeXform(self):
         NifFile.nifly.setTransform(self._handle, self.transform)
 
+    def _read_geometry(self):
+        """
+        Read all the shape's geometry into the geometry buffers with a single call to
+        nifly. Bone weights are not read; see _read_weight_matrix.
+        """
+        vertcount = self.properties.vertexCount
+        tricount = self.properties.triangleCount
+        bufs = {'verts': (c_float * 3 * vertcount)(),
+                'normals': (c_float * 3 * vertcount)(),
+                'uvs': (c_float * 2 * vertcount)(),
+                'tris': (c_uint16 * 3 * tricount)(), }
+        if self.properties.hasVertexColors:
+            bufs['colors'] = (c_float * 4 * vertcount)()
+
+        geom = GeometryBuf()
+        geom.vertexCount = vertcount
+        geom.triangleCount = tricount
+        geom.verts = addressof(bufs['verts'])
+        geom.normals = addressof(bufs['normals'])
+        geom.uvs = addressof(bufs['uvs'])
+        geom.tris = addressof(bufs['tris'])
+        if 'colors' in bufs:
+            geom.colors = addressof(bufs['colors'])
+        if NifFile.nifly.getShapeGeometry(self.file._handle, self._handle, geom) < 0:
+            raise Exception(NifFile.message_log())
+        self._geom_bufs.update(bufs)
+
+    def _read_weight_matrix(self):
+        """
+        Read the 4 heaviest weights for each vertex into the 'weight_bones' and 'weights'
+        buffers with a single call to nifly.
+        """
+        vertcount = self.properties.vertexCount
+        bufs = {'weight_bones': (c_uint16 * 4 * vertcount)(),
+                'weights': (c_float * 4 * vertcount)(), }
+        geom = GeometryBuf()
+        geom.vertexCount = vertcount
+        geom.weightBones = addressof(bufs['weight_bones'])
+        geom.weights = addressof(bufs['weights'])
+        if NifFile.nifly.getShapeGeometry(self.file._handle, self._handle, geom) < 0:
+            raise Exception(NifFile.message_log())
+        self._geom_bufs.update(bufs)
+
+    def _geometry_buf(self, attr):
+        """
+        Return the ctypes buffer holding the named geometry attribute (verts, normals,
+        uvs, tris, colors), reading it from nifly the first time it's needed. The list
+        and array accessors both work from this buffer.
+        """
+        if attr not in self._geom_bufs and hasattr(NifFile.nifly, 'getShapeGeometry'):
+            if attr in ['weight_bones', 'weights']:
+                self._read_weight_matrix()
+            elif 'verts' not in self._geom_bufs:
+                self._read_geometry()
+        if attr not in self._geom_bufs:
+            vertcount = self.properties.vertexCount
+            if attr == 'verts':
+                buf = (c_float * 3 * vertcount)()
+                NifFile.nifly.getVertsForShape(
+                    self.file._handle, self._handle, buf, vertcount * 3, 0)
+            elif attr == 'normals':
+                buf = (c_float * 3 * vertcount)()
+                NifFile.nifly.getNormalsForShape(
+                    self.file._handle, self._handle, buf, vertcount * 3, 0)
+            elif attr == 'uvs':
+                buf = (c_float * 2 * vertcount)()
+                NifFile.nifly.getUVs(
+                    self.file._handle, self._handle, buf, vertcount * 2, 0)
+            elif attr == 'tris':
+                triCount = self.properties.triangleCount
+                buf = (c_uint16 * 3 * triCount)()
+                NifFile.nifly.getTriangles(
+                    self.file._handle, self._handle, buf, triCount * 3, 0)
+            elif attr == 'colors':
+                buf = (c_float * 4 * vertcount)()
+                NifFile.nifly.getColorsForShape(
+                    self.file._handle, self._handle, buf, vertcount * 4)
+            elif attr in ['weight_bones', 'weights']:
+                self._read_weights_by_bone()
+                buf = self._geom_bufs[attr]
+            self._geom_bufs[attr] = buf
+        return self._geom_bufs[attr]
+
+    def _read_weights_by_bone(self):
+        """
+        Fill the per-vertex weight buffers from the per-bone weight lists, keeping the 4
+        heaviest weights on each vertex. Used when the DLL can't provide them directly.
+        """
+        vertcount = self.properties.vertexCount
+        weight_bones = (c_uint16 * 4 * vertcount)()
+        weights = (c_float * 4 * vertcount)()
+        for bone_idx in range(len(self.bone_names)):
+            for vert, wgt in self._bone_weights(bone_idx):
+                if vert >= vertcount: continue
+                vw = weights[vert]
+                j = min(range(4), key=vw.__getitem__)
+                if wgt > vw[j]:
+                    vw[j] = wgt
+                    weight_bones[vert][j] = bone_idx
+        self._geom_bufs['weight_bones'] = weight_bones
+        self._geom_bufs['weights'] = weights
+
+    def _geometry_array(self, attr):
+        """Return a numpy view over the named geometry buffer. No data is copied."""
+        if np is None:
+            raise ImportError("numpy is required for array access to shape geometry")
+        return np.ctypeslib.as_array(self._geometry_buf(attr))
+
     @property
     def verts(self):
         if not self._verts:
-            verts = (c_float * 3 * self.properties.vertexCount)()
-            NifFile.nifly.getVertsForShape(
-                self.file._handle, self._handle, verts, self.properties.vertexCount * 3, 0)
-            self._verts = [(v[0], v[1], v[2]) for v in verts]
+            self._verts = [(v[0], v[1], v[2]) for v in self._geometry_buf('verts')]
         return self._verts
 
+    @property
+    def verts_array(self):
+        """Vertex locations as an Nx3 float32 numpy array."""
+        return self._geometry_array('verts')
+
     @property
     def colors(self):
         """Returns colors as a list of 4-tuples representing color values, 1:1 with vertices."""
         if self._colors is None:
             if self.properties.hasVertexColors:
-                buflen = self.properties.vertexCount
-                buf = (c_float * 4 * buflen)()
-                NifFile.nifly.getColorsForShape(self.file._handle, self._handle, buf, buflen*4)
-                self._colors = [(c[0], c[1], c[2], c[3]) for c in buf]
+                self._colors = [(c[0], c[1], c[2], c[3]) for c in self._geometry_buf('colors')]
             else:
                 self._colors = []
         return self._colors
     
+    @property
+    def colors_array(self):
+        """Vertex colors as an Nx4 float32 numpy array, or None if the shape has no
+        vertex colors."""
+        if not self.properties.hasVertexColors:
+            return None
+        return self._geometry_array('colors')
+
     @property
     def normals(self):
         if not self._normals:
-            buflen = self.properties.vertexCount 
-            if buflen > 0:
-                norms = (c_float * 3 * buflen)()
-                NifFile.nifly.getNormalsForShape(
-                        self.file._handle, self._handle, norms, buflen * 3, 0)
-                self._normals = [(n[0], n[1], n[2]) for n in norms]
+            if self.properties.vertexCount > 0:
+                self._normals = [(n[0], n[1], n[2]) for n in self._geometry_buf('normals')]
         return self._normals
 
+    @property
+    def normals_array(self):
+        """Vertex normals as an Nx3 float32 numpy array, or None if the shape has no
+        vertices."""
+        if self.properties.vertexCount == 0:
+            return None
+        return self._geometry_array('normals')
+
     @property
     def tris(self):
         if self._tris is None:
-            triCount = self.properties.triangleCount
-            buf = (c_uint16 * 3 * triCount)()
-            NifFile.nifly.getTriangles(
-                    self.file._handle, self._handle, buf, triCount * 3, 0)
-            self._tris = [(t[0], t[1], t[2]) for t in buf]
+            self._tris = [(t[0], t[1], t[2]) for t in self._geometry_buf('tris')]
         return self._tris
 
+    @property
+    def tris_array(self):
+        """Triangles as an Mx3 uint16 numpy array of vertex indices."""
+        return self._geometry_array('tris')
+
     def _read_partitions(self):
         self._partitions = []
         buf = (c_uint16 * 2)()
@@ -3016,18 +3359,18 @@ class NiShape(NiNode):
     @property
     def uvs(self):
         if self._uvs is None:
-            uvCount = self.properties.vertexCount
-            buf = (c_float * 2 * uvCount)()
-            NifFile.nifly.getUVs(
-                    self.file._handle, self._handle, buf, uvCount * 2, 0)
-            self._uvs = [(uv[0], uv[1]) for uv in buf]
+            self._uvs = [(uv[0], uv[1]) for uv in self._geometry_buf('uvs')]
         return self._uvs
 
+    @property
+    def uvs_array(self):
+        """UV coordinates as an Nx2 float32 numpy array, 1:1 with vertices. Values are
+        as stored in the nif (V is not flipped)."""
+        return self._geometry_array('uvs')
+
     @property
     def shader_block_name(self):
-        buf = create_string_buffer(128)
-        NifFile.nifly.getBlockname(self.file._handle, self.properties.shaderPropertyID, buf, 128)
-        return buf.value.decode('utf-8')
+        return self.file.get_blockname(self.properties.shaderPropertyID)
 
     @property
     def shader_name(self):
@@ -3161,6 +3504,17 @@ class NiShape(NiNode):
                 self._weights[name] = self._bone_weights(bone_idx)
         return self._weights
 
+    def weight_matrix(self):
+        """
+        Return bone weights as arrays 1:1 with the vertices: (indices, weights, bone_names)
+            indices = Nx4 uint16 array of indices into bone_names
+            weights = Nx4 float32 array of weights matching indices
+        Each vertex has its 4 heaviest weights. Unused slots have weight 0.
+        """
+        return (self._geometry_array('weight_bones'), 
+                self._geometry_array('weights'), 
+                self.bone_names)
+
     def get_used_bones(self):
         """
         Return bones that have non-zero weights
@@ -3254,6 +3608,8 @@ class NiShape(NiNode):
         h = NifFile.nifly.addBoneToNifShape(self.file._handle, self._handle, 
                                             bone_name.encode('utf-8'), buf,
                                             par)
+        self._bone_names = None
+        self._bone_ids = None
         NiNode(handle=h, file=self.file, name=bone_name)
 
         
@@ -3271,6 +3627,31 @@ class NiShape(NiNode):
                                       bone_name.encode('utf-8'),
                                       vert_buf, len(vert_weights))
        
+    def set_weight_matrix(self, indices, weights):
+        """
+        Set the weights for all vertices at once. All bones must have been added to the
+        shape first, and indices refer to them in the order they were added.
+            indices = [(b1, b2, b3, b4), ...] bone indices, 1:1 with verts
+            weights = [(w1, w2, w3, w4), ...] weights matching indices. Slots with 0
+                weight are ignored.
+        Both may be Nx4 numpy arrays.
+        """
+        if hasattr(NifFile.nifly, 'setShapeWeightsBulk'):
+            NifFile.nifly.setShapeWeightsBulk(self.file._handle, self._handle, 
+                                              len(indices),
+                                              _ctypes_buffer(indices, c_uint16, 4),
+                                              _ctypes_buffer(weights, c_float, 4))
+        else:
+            names = self.bone_names
+            weights_by_bone = {}
+            for vert_index, (vb, vw) in enumerate(zip(indices, weights)):
+                for bone_idx, wgt in zip(vb, vw):
+                    if wgt > 0:
+                        weights_by_bone.setdefault(names[bone_idx], []).append(
+                            (vert_index, float(wgt)))
+            for bone_name, vert_weights in weights_by_bone.items():
+                self.setShapeWeights(bone_name, vert_weights)
+
     def set_partitions(self, partitionlist, trilist):
         """ Set the partitions for a shape
             partitionlist = list of Partition objects, either Skyrim or FO. Any Subsegments in the
@@ -3339,12 +3720,8 @@ class NiShape(NiNode):
                                       self._segment_file.encode('utf-8'))
 
     def set_colors(self, colors):
-        buf = (c_float * 4 * len(colors))()
-        for i, c in enumerate(colors):
-            buf[i][0] = c[0]
-            buf[i][1] = c[1]
-            buf[i][2] = c[2]
-            buf[i][3] = c[3]
+        """Set vertex colors from a list of (r, g, b, a), or an (n, 4) array."""
+        buf = _ctypes_buffer(colors, c_float, 4)
         NifFile.nifly.setColorsForShape(self.file._handle, self._handle, 
                                         buf, len(colors))
 
@@ -3436,11 +3813,14 @@ class NifFile:
         NifFile.nifly = load_nifly(nifly_path)
         NifFile.nifly_path = nifly_path
     
-    def __init__(self, filepath=None, materialsRoot=None):
+    def __init__(self, filepath=None, materialsRoot=None, lazy=False, header_only=False):
         """
         Initialize the nif file object.
         For ease of testing, materialsRoot indicates where to find the materials files. If
         not provided, the nif's own path will be used.
+        lazy = don't read the shapes until they are first accessed. Nodes and extra data
+            are always read on first access.
+        header_only = read only the game name, root node, and block list. Implies lazy.
         """
         self.filepath = filepath
         self._handle = None
@@ -3468,9 +3848,16 @@ class NifFile:
             self.materialsRoot = extend_filenames(filepath, 'meshes')
         self._shape_dict = {}
         self.node_ids = {}
+        self._node_handles = {}
+        self._block_types = None
         self._nodes = None
         self._shapes = None
-        self._load_shapes()
+        if header_only:
+            if self._handle:
+                self._block_types = self._read_block_types()
+                self.root
+        elif not lazy:
+            self._load_shapes()
 
     def __del__(self):
         if self._handle:
@@ -3509,6 +3896,7 @@ class NifFile:
         self._handle = NifFile.nifly.createNif(target_game.encode('utf-8'),
                                                root_type.encode('utf-8'),
                                                root_name.encode('utf-8'))
+        self._block_types = None
         self.dict = gameSkeletons[target_game]
         # Get the root node into the nodes list so it can be found.
         self.read_node(0)
@@ -3524,6 +3912,55 @@ class NifFile:
             NifFile.nifly.saveNif(self._handle, self.filepath.encode('utf-8'))
 
 
+    def _read_block_types(self):
+        """Read the block type names for all blocks in the nif with a single call.
+        Returns a dictionary of block id -> block type name.
+        """
+        if not hasattr(NifFile.nifly, 'getBlockNames'):
+            return {}
+        buflen = NifFile.nifly.getBlockNames(self._handle, None, 0) + 1
+        if buflen <= 1:
+            return {}
+        buf = create_string_buffer(buflen)
+        NifFile.nifly.getBlockNames(self._handle, buf, buflen)
+        return dict(enumerate(buf.value.decode('utf-8').split('\n')))
+
+
+    def get_blockname(self, id):
+        """Return the block type name (e.g. "NiNode") of the block with the given id.
+        The type names are read once per file and cached. Blocks added since then are
+        looked up individually.
+        """
+        if self._block_types is None:
+            self._block_types = self._read_block_types()
+        bn = self._block_types.get(id)
+        if not bn:
+            buf = create_string_buffer(128)
+            NifFile.nifly.getBlockname(self._handle, id, buf, 128)
+            bn = buf.value.decode('utf-8')
+            if bn: self._block_types[id] = bn
+        return bn
+
+
+    @property
+    def blocknames(self):
+        """List of the block type names of all blocks in the nif, in block ID order. 
+        Missing blocks have empty names. 
+        """
+        if not self._handle:
+            return []
+        if hasattr(NifFile.nifly, 'getBlockNames'):
+            self._block_types = self._read_block_types()
+            return [self._block_types[i] for i in range(len(self._block_types))]
+        # Older DLLs don't give a block count, so stop at the first missing block.
+        names = []
+        while True:
+            bn = self.get_blockname(len(names))
+            if not bn: break
+            names.append(bn)
+        return names
+
+
     def get_string(self, string_id):
         buflen = self.max_string_len
         buf = (c_char * buflen)()
@@ -3558,7 +3995,9 @@ class NifFile:
             else:
                 phandle = parent._handle
         nodeh = NifFile.nifly.addNode(self._handle, name.encode('utf-8'), xform, phandle)
-        return NiNode(handle=nodeh, file=self, parent=parent)
+        node = NiNode(handle=nodeh, file=self, parent=parent)
+        self._index_node(node)
+        return node
 
 
     def createShapeFromData(self, shape_name, verts, tris, uvs, normals, 
@@ -3574,6 +4013,9 @@ class NifFile:
             props = Properties for the new shape; use defaults if omitted
             use_tyep = Block type for the new shape; only used if props omitted
             parent = Parent object or root
+            Geometry may also be passed as numpy arrays (Nx3 verts and normals, Mx3 tris,
+            Nx2 uvs). Arrays of the right type (float32, uint16) are passed to nifly 
+            without copying.
             """
         if props:
             shapebuf = props
@@ -3587,26 +4029,22 @@ class NifFile:
         if parent:
             parenthandle = parent._handle
 
-        VERTBUFDEF = c_float * 3 * len(verts)
-        vertbuf = VERTBUFDEF()
+        vertbuf = _ctypes_buffer(verts, c_float, 3)
         normbuf = None
-        norm_len = 0
-        for i in range(0, len(verts)):
-            vertbuf[i] = verts[i]
-        if normals:
-            normbuf = VERTBUFDEF()
-            norm_len = len(normals)
-            for i in range(norm_len):
-                normbuf[i] = normals[i]
-        
-        TRIBUFDEF = c_uint16 * 3 * len(tris)
-        tribuf = TRIBUFDEF()
-        for i, t in enumerate(tris): tribuf[i] = t
-
-        UVBUFDEF = c_float * 2 * len(uvs)
-        uvbuf = UVBUFDEF()
-        for i, u in enumerate(uvs): uvbuf[i] = (u[0], 1-u[1])
+        if normals is not None and len(normals) > 0:
+            normbuf = _ctypes_buffer(normals, c_float, 3)
+        tribuf = _ctypes_buffer(tris, c_uint16, 3)
+
+        # nifly's V runs the other way
+        if np is not None:
+            uvflip = np.array(uvs, dtype=np.float32).reshape(-1, 2)
+            uvflip[:, 1] = 1 - uvflip[:, 1]
+        else:
+            uvflip = [(u[0], 1-u[1]) for u in uvs]
+        uvbuf = _ctypes_buffer(uvflip, c_float, 2)
 
+        # Make sure the existing shapes are loaded before adding the new one.
+        shapes = self.shapes
         shape_handle = NifFile.nifly.createNifShapeFromData(
             self._handle, 
             shape_name.encode('utf-8'), 
@@ -3615,11 +4053,9 @@ class NifFile:
             tribuf, 
             parenthandle)
         
-        if self._shapes is None:
-            self._shapes = []
         sh = NiShape(handle=shape_handle, file=self, parent=parent)
         sh.name = shape_name
-        self._shapes.append(sh)
+        shapes.append(sh)
         sh._handle = shape_handle
 
         return sh
@@ -3688,6 +4124,8 @@ class NifFile:
 
     @property
     def shapes(self):
+        if self._shapes is None:
+            self._load_shapes()
         return self._shapes
     
     def shape_by_root(self, rootname):
@@ -3697,9 +4135,16 @@ class NifFile:
                 return s
         return None
 
+    def _index_node(self, n):
+        """Record the node by id and by handle so it can be found again cheaply."""
+        if n.id != NODEID_NONE: self.node_ids[n.id] = n
+        if n._handle: self._node_handles[n._handle] = n
+
+
     def register_node(self, n):
         if n.name: self.nodes[n.name] = n
         if n.id == 0: self._root = n
+        if n._handle: self._node_handles[n._handle] = n
 
     @property
     def nodes(self):
@@ -3720,10 +4165,28 @@ class NifFile:
         Returns the node with the given handle. If not found assumes it's a node that
         doesn't appear in the nodes list and makes a NiNode for it. 
         """
-        for n in self.node_ids.values():
-            if n._handle == desired_handle:
-                return n
-        return self.read_node(handle=desired_handle)
+        n = self._node_handles.get(desired_handle)
+        if n is not None:
+            return n
+        n = self.read_node(handle=desired_handle)
+        if n is not None: self._node_handles[desired_handle] = n
+        return n
+
+
+    def id_for_handle(self, handle):
+        """Return the block ID of the block with the given handle."""
+        n = self._node_handles.get(handle)
+        if n is not None and n.id != NODEID_NONE:
+            return n.id
+        return NifFile.nifly.getBlockID(self._handle, handle)
+
+
+    def handle_for_id(self, id):
+        """Return the handle of the block with the given block ID."""
+        n = self.node_ids.get(id)
+        if n is not None and n._handle:
+            return n._handle
+        return NifFile.nifly.getNodeByID(self._handle, id)
 
 
     def get_node_xform_to_global(self, name):
@@ -3886,13 +4349,11 @@ class NifFile:
         if id in self.node_ids:
             return self.node_ids[id]
 
-        buf = (c_char * (128))()
-        NifFile.nifly.getBlockname(self._handle, id, buf, 128)
-        bn = buf.value.decode('utf-8')
+        bn = self.get_blockname(id)
         if bn in NiObject.block_types:
             node = NiObject.block_types[bn](
                 id=id, file=self, handle=handle, properties=properties, parent=parent)
-            self.node_ids[id] = node
+            self._index_node(node)
             try:
                 if node.name and isinstance(node, NiNode): 
                     self._nodes[node.name] = node
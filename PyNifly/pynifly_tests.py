@@ -18,6 +18,11 @@ import os
 # import xmltools
 import codecs
 import ctypes 
+try:
+    import numpy as np
+except ImportError:
+    # The array accessors need numpy; the tests that use them skip without it.
+    np = None
 from niflytools import *
 from nifdefs import *
 from pynifly import *
@@ -295,6 +300,237 @@ def TEST_SHAPE_QUERY():
     assert len(body.bone_weights['NPC L Foot [Lft ]']) == 13, "ERRROR: Wrong number of bone weights"
 
 
+def TEST_LAZY_LOAD():
+    """Can open a nif without reading all its shapes"""
+    testfile = "tests/skyrim/test.nif"
+
+    # A lazy nif reads the shapes when they are first needed.
+    nif = NifFile(testfile, lazy=True)
+    assert nif._shapes is None, f"Shapes not loaded yet"
+    assert nif.game == "SKYRIM", f"Have game: {nif.game}"
+    assert nif.rootName == "Scene Root", f"Have root: {nif.rootName}"
+    assert set(nif.shape_dict.keys()) == set(["Armor", 'MaleBody']), \
+        f"Have shapes: {nif.shape_dict.keys()}"
+    assert len(nif.shapes) == 2, f"Have shapes: {nif.shapes}"
+
+    # A header-only nif has the game, root, and block types but nothing else.
+    nif = NifFile(testfile, header_only=True)
+    assert nif._shapes is None, f"Shapes not loaded"
+    assert nif._nodes is None, f"Nodes not loaded"
+    assert nif._root is not None, f"Have root"
+    assert nif.game == "SKYRIM", f"Have game: {nif.game}"
+    assert nif.get_blockname(0) == "NiNode", f"Have block types"
+
+    # Everything is still available on demand.
+    assert nif.nodes["Scene Root"] is nif.root, f"Found root in nodes"
+    assert nif.shape_dict["Armor"].blockname == "NiTriShape", f"Found shape"
+
+
+def _batch_root_name(nif):
+    """Extractor for TEST_BATCH_SCAN. Must be at top level so it can be pickled."""
+    return nif.rootName
+
+
+def TEST_BATCH_SCAN():
+    """Can scan a tree of nifs and get results back"""
+    import nifbatch
+
+    files = list(nifbatch.walk_nifs("tests/Skyrim", excludes=[r"tests/Skyrim/meshes"]))
+    assert "tests/Skyrim/test.nif" in [f.replace('\\', '/') for f in files], f"Found test nif"
+    assert not [f for f in files if 'meshes' in f.lower()], f"Excluded folder skipped"
+
+    # Scan in-process. A process pool would re-import this test file in every worker.
+    results = list(nifbatch.scan("tests/Skyrim", _batch_root_name, max_workers=0))
+    assert len(results) == len(files), f"Have result for every file"
+    r = [r for r in results if r.filepath.replace('\\', '/') == "tests/Skyrim/test.nif"][0]
+    assert r.value == "Scene Root" and r.error is None, f"Have result: {r}"
+
+
+BATCH_POOL_FUNC = '''
+import os
+def root_name(nif):
+    if nif.filepath.endswith("crash.nif"):
+        os._exit(1)
+    return nif.rootName
+'''
+
+BATCH_POOL_SCRIPT = '''
+import sys
+sys.path[0:0] = [{addon!r}, {folder!r}]
+import nifbatch, batch_pool_func
+for r in nifbatch.scan({folder!r}, batch_pool_func.root_name,
+                       nifly_path={dll!r}, max_workers=2):
+    print(repr(tuple(r)))
+'''
+
+def TEST_BATCH_POOL():
+    """Scanning in a process pool reports nifs that fail or crash their worker"""
+    import nifbatch
+    import ast
+    import shutil
+    import subprocess
+
+    folder = os.path.abspath("tests/out/TEST_BATCH_POOL")
+    if os.path.exists(folder): shutil.rmtree(folder)
+    os.makedirs(folder)
+    for n in ["good1.nif", "good2.nif", "good3.nif", "crash.nif"]:
+        shutil.copy("tests/Skyrim/test.nif", os.path.join(folder, n))
+    with open(os.path.join(folder, "bad.nif"), 'wb') as f:
+        f.write(b"This is not a nif file")
+
+    # Workers import the main module, and importing this file runs the tests. So run
+    # the scan from a separate process, with the scan function in its own module.
+    with open(os.path.join(folder, "batch_pool_func.py"), 'w') as f:
+        f.write(BATCH_POOL_FUNC)
+    script = BATCH_POOL_SCRIPT.format(addon=py_addon_path, folder=folder,
+                                      dll=NifFile.nifly_path)
+    out = subprocess.run([sys.executable, "-c", script],
+                         capture_output=True, text=True, timeout=300)
+    assert out.returncode == 0, f"Scan completed: {out.stderr}"
+
+    results = {os.path.basename(r[0]): r for r in
+               (ast.literal_eval(line) for line in out.stdout.splitlines())}
+    assert set(results.keys()) == set(["good1.nif", "good2.nif", "good3.nif",
+                                       "crash.nif", "bad.nif"]), \
+        f"Have a result for every file: {results.keys()}"
+    for n in ["good1.nif", "good2.nif", "good3.nif"]:
+        assert results[n][1:] == ("Scene Root", None), f"Have result for {n}: {results[n]}"
+    assert results["bad.nif"][2], f"Have error for bad nif: {results['bad.nif']}"
+    assert "BrokenProcessPool" in results["crash.nif"][2], \
+        f"Have error for nif that crashed its worker: {results['crash.nif']}"
+
+
+def TEST_NIF_CATALOG():
+    """Can catalog nif metadata and query it without opening the nifs"""
+    import nifcatalog
+    dbfile = _test_file("tests/out/TEST_NIF_CATALOG.db")
+    if os.path.exists(dbfile): os.remove(dbfile)
+
+    with nifcatalog.NifCatalog(dbfile) as cat:
+        n = cat.update("tests/Skyrim", max_workers=0)
+        assert n == len(cat.files) and n > 0, f"Cataloged all files: {n}"
+
+        testnif = "tests/Skyrim/test.nif"
+        assert "NiTriShape" in cat.block_types(testnif), f"Have block types"
+        assert set(s[0] for s in cat.shapes(testnif)) == set(["Armor", "MaleBody"]), \
+            f"Have shapes: {cat.shapes(testnif)}"
+        assert "NPC Spine1 [Spn1]" in cat.bones(testnif), f"Have bones"
+        assert cat.files_with_bone("NPC Spine1 [Spn1]"), f"Can find files by bone"
+        assert cat.files_with_block("bhkRigidBody"), f"Can find files by block type"
+        assert cat.files_using_texture(".dds"), f"Can find files by texture"
+
+        # Unchanged files aren't scanned again.
+        assert cat.update("tests/Skyrim", max_workers=0) == 0, f"Nothing rescanned"
+
+    # The catalog persists.
+    with nifcatalog.NifCatalog(dbfile) as cat:
+        assert cat.block_types("tests/Skyrim/test.nif"), f"Catalog persisted"
+
+        # Texture searches match the fragment literally. "_" and "%" aren't wildcards.
+        for fn, tx in [("under.nif", r"textures\armor\iron_a\body_d.dds"),
+                       ("nearmiss.nif", r"textures\armor\ironXa\body_d.dds"),
+                       ("percent.nif", r"textures\armor\iron%a\body_d.dds")]:
+            cat._record(fn, 0, 0, {"game": "SKYRIM", "blocks": {},
+                                   "shapes": [{"name": "Body", "block_type": "BSTriShape",
+                                               "shader_name": "",
+                                               "textures": {"Diffuse": tx},
+                                               "bones": []}]}, None)
+        found = [os.path.basename(r[0]) for r in cat.files_using_texture(r"IRON_A\body")]
+        assert found == ["under.nif"], f"Underscore matches only itself: {found}"
+        found = [os.path.basename(r[0]) for r in cat.files_using_texture("iron%a")]
+        assert found == ["percent.nif"], f"Percent matches only itself: {found}"
+
+
+def TEST_BLOCKNAMES():
+    """Block type names are read once per file and cached"""
+    nif = NifFile("tests/skyrim/test.nif")
+    armor = nif.shape_dict["Armor"]
+
+    # The block type table covers every block in the file.
+    if hasattr(NifFile.nifly, 'getBlockNames'):
+        assert len(nif._block_types) > armor.id, f"Have types for all blocks"
+    assert nif.get_blockname(armor.id) == "NiTriShape", f"Found shape type"
+    assert nif.get_blockname(0) == "NiNode", f"Found root type"
+    assert armor.shader_block_name == "BSLightingShaderProperty", \
+        f"Found shader type: {armor.shader_block_name}"
+
+    # Blocks added after the table was read are still found.
+    nifout = NifFile()
+    nifout.initialize("SKYRIM", _test_file("tests/out/TEST_BLOCKNAMES.nif"))
+    assert nifout.get_blockname(0) == "NiNode", f"Found root type"
+    n = nifout.add_node("TestNode", TransformBuf())
+    assert nifout.get_blockname(n.id) == "NiNode", f"Found new node type"
+    assert n.blockname == "NiNode", f"New node has type"
+
+
+def TEST_SHAPE_ARRAYS():
+    """Shape geometry is available as numpy arrays"""
+    if np is None:
+        print("numpy is not available, skipping")
+        return
+
+    nif = NifFile("tests/skyrim/noblecrate01.nif")
+    crate = nif.shapes[0]
+
+    # The *_array properties return numpy arrays over the buffers nifly fills, without
+    # building python tuples for every element.
+    va = crate.verts_array
+    assert va.shape == (686, 3), f"Have verts array: {va.shape}"
+    assert va.dtype == np.float32, f"Verts are floats: {va.dtype}"
+    assert VNearEqual(va[0], [-67.6339, -24.8498, 0.2476]), f"First vert correct: {va[0]}"
+    assert VNearEqual(va[685], [-64.4469, -16.3246, 26.4362]), f"Last vert correct: {va[685]}"
+
+    na = crate.normals_array
+    assert na.shape == (686, 3), f"Have normals array: {na.shape}"
+    assert VNearEqual(na[0], [0.0, -0.9776, 0.2104]), f"First normal correct: {na[0]}"
+
+    ta = crate.tris_array
+    assert ta.shape == (258, 3), f"Have tris array: {ta.shape}"
+    assert ta.dtype == np.uint16, f"Tris are shorts: {ta.dtype}"
+    assert tuple(ta[1]) == (2, 3, 0), f"Second tri correct: {ta[1]}"
+
+    uva = crate.uvs_array
+    assert uva.shape == (686, 2), f"Have UV array: {uva.shape}"
+    assert VNearEqual(uva[685], [0.4621, 0.4327]), f"Last UV correct: {uva[685]}"
+
+    # The list properties are still available and agree with the arrays.
+    assert VNearEqual(crate.verts[10], va[10]), f"Verts list matches array"
+    assert crate.tris[1] == tuple(ta[1]), f"Tris list matches array"
+
+    # Colors are only present if the shape has them.
+    assert crate.colors_array is None, f"Crate has no vertex colors"
+    cnif = NifFile("tests/FO4/HeadGear1.nif")
+    cshape = cnif.shapes[0]
+    assert cshape.colors_array.shape == (len(cshape.verts), 4), f"Have colors array"
+    assert VNearEqual(cshape.colors_array[0], cshape.colors[0]), f"Colors match"
+
+
+def TEST_BULK_GEOMETRY():
+    """Shape geometry and weights can be read in a single call"""
+    if not hasattr(NifFile.nifly, 'getShapeGeometry'):
+        print("DLL does not provide getShapeGeometry, skipping")
+        return
+    
+    nif = NifFile("tests/skyrim/test.nif")
+    body = nif.shape_dict["MaleBody"]
+
+    # Geometry read in bulk matches what the separate calls return.
+    verts = (c_float * 3 * body.properties.vertexCount)()
+    NifFile.nifly.getVertsForShape(
+        nif._handle, body._handle, verts, body.properties.vertexCount * 3, 0)
+    assert VNearEqual(body.verts[2023], verts[2023]), f"Last vert correct: {body.verts[2023]}"
+    assert len(body.tris) == 3680, f"Have all tris: {len(body.tris)}"
+
+    # Weights read in bulk match the per-bone weights.
+    for bone_idx, name in enumerate(body.bone_names):
+        expected = sorted(body._bone_weights(bone_idx))
+        actual = sorted(body.bone_weights[name])
+        assert len(expected) == len(actual), f"Same number of weights for {name}"
+        assert all(v1 == v2 and NearEqual(w1, w2) for (v1, w1), (v2, w2) in zip(expected, actual)), \
+            f"Same weights for {name}"
+    assert len(body.bone_weights['NPC L Foot [Lft ]']) == 13, "Have right number of bone weights"
+
+
 def TEST_CREATE_TETRA():
     """Can create new files with content: tetrahedron"""
     # Vertices are a list of triples defining the coordinates of each vertex
@@ -435,6 +671,85 @@ def TEST_CREATE_WEIGHTS():
     assert not VNearEqual(xform.translation, [0.0, 0.0, 0.0]), "Error: Translation should not be null"
 
 
+def TEST_WEIGHT_MATRIX():
+    """Can read and write bone weights as per-vertex arrays"""
+    if np is None:
+        print("numpy is not available, skipping")
+        return
+
+    testfile = "tests/FO4/BaseMaleHead.nif"
+    outfile = _test_file("tests/out/TEST_WEIGHT_MATRIX.nif")
+
+    nif = NifFile(testfile)
+    head = nif.shapes[0]
+
+    # weight_matrix gives the 4 heaviest weights for every vertex, as indices into
+    # the shape's bone list.
+    indices, weights, bone_names = head.weight_matrix()
+    assert indices.shape == (len(head.verts), 4), f"Have bone indices for all verts"
+    assert weights.shape == (len(head.verts), 4), f"Have weights for all verts"
+    assert bone_names == head.bone_names, f"Have bone names"
+    assert NearEqual(sum(weights[100]), 1.0), f"Weights are normalized: {weights[100]}"
+    
+    # The matrix agrees with the weights by bone.
+    for bone_name, bone_weights in head.bone_weights.items():
+        bone_idx = bone_names.index(bone_name)
+        for v, w in bone_weights[0:10]:
+            assert NearEqual(weights[v][list(indices[v]).index(bone_idx)], w), \
+                f"Weight matches for vertex {v} on bone {bone_name}"
+
+    # Can write weights back in a single call.
+    nifout = NifFile()
+    nifout.initialize("FO4", outfile)
+    new_head = nifout.createShapeFromData(head.name, head.verts, head.tris, 
+                                          [(u, 1-v) for u, v in head.uvs], head.normals,
+                                          props=head.properties.copy())
+    new_head.skin()
+    for bone_name in bone_names:
+        new_head.add_bone(bone_name, nif.nodes[bone_name].global_transform)
+    for bone_name in bone_names:
+        new_head.set_skin_to_bone_xform(bone_name, head.get_shape_skin_to_bone(bone_name))
+    new_head.set_weight_matrix(indices, weights)
+    nifout.save()
+
+    nifcheck = NifFile(outfile)
+    headcheck = nifcheck.shapes[0]
+    assert set(headcheck.bone_names) == set(bone_names), f"Have all bones"
+    for bone_name in bone_names:
+        assert len(headcheck.bone_weights[bone_name]) == len(head.bone_weights[bone_name]), \
+            f"Have all weights for {bone_name}"
+
+
+def TEST_CREATE_FROM_ARRAYS():
+    """Can create shapes from numpy arrays"""
+    if np is None:
+        print("numpy is not available, skipping")
+        return
+
+    outfile = _test_file("tests/out/TEST_CREATE_FROM_ARRAYS.nif")
+    nif = NifFile("tests/skyrim/noblecrate01.nif")
+    crate = nif.shapes[0]
+
+    # Geometry arrays can be passed straight in. UVs get flipped the same as lists.
+    uvs = crate.uvs_array.copy()
+    uvs[:, 1] = 1 - uvs[:, 1]
+    nifout = NifFile()
+    nifout.initialize("SKYRIM", outfile)
+    nifout.createShapeFromData("Crate", 
+                               crate.verts_array, crate.tris_array, uvs, 
+                               crate.normals_array,
+                               props=crate.properties.copy())
+    nifout.save()
+
+    nifcheck = NifFile(outfile)
+    cratecheck = nifcheck.shapes[0]
+    assert len(cratecheck.verts) == 686, f"Have all verts: {len(cratecheck.verts)}"
+    assert VNearEqual(cratecheck.verts[685], crate.verts[685]), f"Last vert correct"
+    assert cratecheck.tris[1] == crate.tris[1], f"Tris correct"
+    assert VNearEqual(cratecheck.uvs[685], crate.uvs[685]), f"UVs correct"
+    assert VNearEqual(cratecheck.normals[0], crate.normals[0]), f"Normals correct"
+
+
 def TEST_READ_WRITE():
     """Basic load-and-store for Skyrim--Can read the armor nif and spit out armor and body separately"""
     testfile = "tests/Skyrim/test.nif"
@@ -584,6 +899,43 @@ def TEST_PARENT():
     # System accurately parents bones to each other bsaed on nif or reference skeleton
     assert n.parent.name == 'RArm_ForeArm3', "Error: Parent node should be forearm"
 
+def TEST_NODE_HANDLES():
+    """Can find nodes by handle in a big nif"""
+    testfile = _test_file("tests/out/TEST_NODE_HANDLES.nif")
+
+    nifout = NifFile()
+    nifout.initialize("SKYRIM", testfile)
+    parent = None
+    for i in range(0, 1000):
+        n = nifout.add_node(f"Node{i:04}", TransformBuf(), parent)
+        if i % 10 == 0: parent = n
+    assert nifout._node_handles.get(n._handle) is n, f"New nodes are indexed by handle"
+    nifout.save()
+
+    nif = NifFile(testfile)
+    assert len(nif.nodes) == 1001, f"Have all nodes: {len(nif.nodes)}"
+    handles = [n._handle for n in nif.nodes.values()]
+
+    # Handles and IDs map to each other.
+    n = nif.nodes["Node0500"]
+    assert nif.id_for_handle(n._handle) == n.id, f"Found id for handle"
+    assert nif.handle_for_id(n.id) == n._handle, f"Found handle for id"
+    assert nif.nodeByHandle(n._handle) is n, f"Found node by handle"
+    assert n.parent.name == "Node0490", f"Found parent: {n.parent.name}"
+
+    # Every node read is in the handle index, so lookups don't depend on the number of
+    # nodes. They must not fall back to scanning the nodes by id.
+    for n in nif.nodes.values():
+        assert nif._node_handles.get(n._handle) is n, f"Node {n.name} indexed by handle"
+    node_ids = nif.node_ids
+    nif.node_ids = None
+    try:
+        for h in handles:
+            assert nif.nodeByHandle(h) is nif._node_handles[h], f"Found node by handle"
+    finally:
+        nif.node_ids = node_ids
+
+
 def TEST_PYBABY():
     print('### TEST_PYBABY: Can export multiple parts')
 
@@ -875,6 +1227,19 @@ def TEST_PARTITION_NAMES():
     assert FO4Subsegment.name_match("FO4 Seg 001 | Hair Top | 0x1234") == ("FO4 Seg 001", 30, 0x1234), \
         "FO4Subsegment.name_match matches subsegments with material as number"
 
+    assert partition_name_info("SBP_42_CIRCLET") == ('SkyPartition', 42, '', 0), \
+        "partition_name_info classifies skyrim parts"
+    assert partition_name_info("FO4 Seg 003").kind == 'FO4Segment', \
+        "partition_name_info classifies FO4 segments"
+    assert partition_name_info("FO4 Seg 001 | Hair Top") == ('FO4Subsegment', 30, "FO4 Seg 001", -1), \
+        "partition_name_info classifies FO4 subsegments"
+    assert partition_name_info("NPC Spine1").kind is None, \
+        "partition_name_info rejects bone names"
+    hits = partition_name_info.cache_info().hits
+    assert FO4Segment.name_match("FO4 Seg 003") == 3 \
+        and partition_name_info.cache_info().hits > hits, \
+        "name_match reuses the cached classification"
+
 
 def TEST_COLORS():
     """Can load and save colors"""
@@ -2020,6 +2385,15 @@ def TEST_ANIMATION_ALDUIN():
     assert len(tdthighl.qrotations) == 161, f"Have quat rotations"
     assert NearEqual(tdthighl.qrotations[0].value[0], 0.2911), f"Have correct angle: {tdthighl.qrotations[0].value}"
 
+    # Tracks can be read as arrays of times and values.
+    times, values = tdthighl.key_arrays('Q')
+    assert len(times) == 161, f"Have quat times: {len(times)}"
+    assert NearEqual(times[160], tdthighl.qrotations[160].time), f"Have correct time: {times[160]}"
+    assert VNearEqual(values[0], tdthighl.qrotations[0].value), f"Have correct value: {values[0]}"
+    times, values = tdtail2.key_arrays('T')
+    assert VNearEqual(values[15], [94.485031, 0, 0]), f"Have correct location: {values[15]}"
+    assert len(tdthighl.key_arrays('X')[0]) == 0, f"Have no xrotations"
+
 
 def TEST_ANIMATION_SHADER():
     """Embedded animations on shaders"""
@@ -2211,6 +2585,23 @@ def TEST_KF():
         node_name = "NPC Root [Root]",
         controller_type = "NPC Pelvis [Pelv]")
 
+    # Third: whole curves written at once.
+    ti3 = NiTransformInterpolator.New(file=nifout, parent=nifout.rootNode)
+    td3 = NiTransformData.New(
+        file=nifout,
+        rotation_type=NiKeyType.LINEAR_KEY,
+        translate_type=NiKeyType.LINEAR_KEY,
+        parent=ti3)
+    times = [i/30 for i in range(100)]
+    td3.add_qrotation_keys(times, [(1, 0, 0, i/100) for i in range(100)])
+    td3.add_translation_keys(times, [(i, 0, -i) for i in range(100)])
+
+    rootout.add_controlled_block(
+        name="NPC Spine [Spn0]",
+        interpolator=ti3,
+        node_name = "NPC Spine [Spn0]",
+        controller_type = "NiTransformController")
+
     nifout.save()
 
     nifcheck = NifFile(r"tests/Out/TEST_KF.kf")
@@ -2236,6 +2627,14 @@ def TEST_KF():
     td2 = ti2.data
     assert len(td2.qrotations) > 0, "Have rotations"
 
+    # Check curves written in bulk
+    td3 = nifcheck.rootNode.controlled_blocks[2].interpolator.data
+    assert len(td3.qrotations) == 100, f"Have rotations: {len(td3.qrotations)}"
+    assert NearEqual(td3.qrotations[50].time, 50/30), f"Have correct time: {td3.qrotations[50].time}"
+    assert VNearEqual(td3.qrotations[50].value, (1, 0, 0, 0.5)), f"Have correct rotation: {td3.qrotations[50].value}"
+    assert len(td3.translations) == 100, f"Have translations: {len(td3.translations)}"
+    assert VNearEqual(td3.translations[99].value, (99, 0, -99)), f"Have correct translation: {td3.translations[99].value}"
+
 
 def TEST_SKEL():
     """Import of skeleton file with collisions"""
@@ -60,9 +60,19 @@ updated by anon (me) to work with newer blender ( version 2.63+), I hope
 #   mod vert index * block length -- index of vertex affected; this list is 1:1 with mod vertices (maybe?) 
 
 
+import io
 import os
+import mmap
 import logging
-from struct import (unpack, pack)
+from collections.abc import MutableMapping
+from itertools import chain
+from struct import (unpack, pack, iter_unpack)
+try:
+    import numpy as np
+except ImportError:
+    # numpy ships with Blender but may be missing in a bare python install. Morph
+    # packing falls back to plain python without it.
+    np = None
 
 VERSION_STRING = 'FRTRI003'
 INT_LEN = 4
@@ -70,6 +80,18 @@ FLOAT_LEN = 4
 SHORT_LEN = 2
 ROTATE_X90 = 0
 
+def _reorder(items, mapping):
+    """ Put items, which are 1:1 with verts, into the order given by mapping. Mapping
+        gives the new index for each vertex. If mapping is None, items are returned as is.
+    """
+    if mapping is None:
+        return items
+    out = [None] * len(items)
+    for i, it in enumerate(items):
+        out[mapping[i]] = it
+    return out
+
+
 # Header
 class TRIHeader:
     def __init__(self):
@@ -126,6 +148,98 @@ class TRIHeader:
         self.errlog.error(str(self))
 
 
+class TriMorphOffsets():
+    """ A morph as stored in a tri file: a scale factor and one (dx, dy, dz) triple of 
+        shorts per vertex, still packed. For lazily opened files the data is a view into 
+        the memory-mapped file, so it isn't read until it's used.
+        """
+    def __init__(self, scale, data):
+        self.scale = scale
+        self.data = data
+
+    def offsets(self, base_verts=None):
+        """ Return [(dx, dy, dz), ...] offsets, scaled """
+        s = self.scale
+        return [(x*s, y*s, z*s) for x, y, z in iter_unpack('<3h', self.data)]
+
+    def absolute(self, base_verts):
+        """ Return [(x, y, z), ...] vertex positions with the offsets applied to base_verts """
+        s = self.scale
+        return [(v[0] + x*s, v[1] + y*s, v[2] + z*s) 
+                for v, (x, y, z) in zip(base_verts, iter_unpack('<3h', self.data))]
+
+
+class TriModMorph():
+    """ A mod morph as stored in a tri file: the indices of the verts it moves and their
+        new positions. 
+        """
+    def __init__(self, indices, verts):
+        self.indices = indices  # [vert-index, ...]
+        self.verts = verts      # [(x,y,z), ...] 1:1 with indices
+
+    def offsets(self, base_verts):
+        """ Return [(dx, dy, dz), ...] offsets for all verts """
+        offs = [(0.0, 0.0, 0.0)] * len(base_verts)
+        for i, v in zip(self.indices, self.verts):
+            b = base_verts[i]
+            offs[i] = (v[0] - b[0], v[1] - b[1], v[2] - b[2])
+        return offs
+
+    def absolute(self, base_verts):
+        """ Return [(x, y, z), ...] positions for all verts """
+        new_verts = list(base_verts)
+        for i, v in zip(self.indices, self.verts):
+            new_verts[i] = v
+        return new_verts
+
+
+class TriMorphs(MutableMapping):
+    """ Dictionary of morphs: {morph-name: [(x,y,z), ...]} where the verts are absolute 
+        positions. Morphs read from a file are kept as the offsets stored in the file and
+        are only turned into absolute positions when they are asked for.
+        """
+    def __init__(self, tri):
+        self._tri = tri
+        self._morphs = {}
+
+    def __getitem__(self, name):
+        m = self._morphs[name]
+        if isinstance(m, (TriMorphOffsets, TriModMorph)):
+            return m.absolute(self._tri._vertices)
+        return m
+
+    def __setitem__(self, name, verts):
+        self._morphs[name] = verts
+
+    def __delitem__(self, name):
+        del self._morphs[name]
+
+    def __iter__(self):
+        return iter(self._morphs)
+
+    def __len__(self):
+        return len(self._morphs)
+
+    def offsets(self, name):
+        """ Return the morph as [(dx, dy, dz), ...] offsets from the base vertices """
+        m = self._morphs[name]
+        if isinstance(m, (TriMorphOffsets, TriModMorph)):
+            return m.offsets(self._tri._vertices)
+        return [(nv[0] - bv[0], nv[1] - bv[1], nv[2] - bv[2]) 
+                for nv, bv in zip(m, self._tri._vertices)]
+
+    def sparse(self, name):
+        """ Return the morph as ([vert-index, ...], [(x,y,z), ...]) for only the verts
+            that are different enough from the base vertices. 
+        """
+        m = self._morphs[name]
+        if isinstance(m, TriModMorph):
+            return m.indices, m.verts
+        added = [(i, nv) for i, (nv, mv) in enumerate(zip(self[name], self._tri._vertices))
+                 if abs(nv[0] - mv[0]) + abs(nv[1] - mv[1]) + abs(nv[2] - mv[2]) / 3 > 0.00033]
+        return [i for i, nv in added], [nv for i, nv in added]
+
+
 class TriFile():
     def __init__(self):
         self.type = 'TRI'
@@ -133,12 +247,33 @@ class TriFile():
         self._vertices = None    # [(x,y,z), ...]
         self._faces = None       # [(p1, p2, p3), ...] where p# is an index into vertices
         self.reorder_verts = False
-        self.morphs = {}        # Dictionary of morphs. Verts are absolute values.
-        self.modmorphs = {}
+        self.morphs = TriMorphs(self) # Dictionary of morphs. Verts are absolute values.
+        self.modmorphs = TriMorphs(self) # Dictionary of mod morphs. Verts are absolute values.
         self.uv_pos = None      # [(u,v), ...] 1:1 with vertex list
         self.face_uvs = None    # [(i1,i2,i3), ...]  1:1 with faces list; indices into UV_pos list
         self.import_uv = True   # Import UV along with verts
         self.log = logging.getLogger("pynifly")
+        self.filepath = None
+        self._mmap = None       # Memory-mapped file, if opened lazily
+
+    def close(self):
+        """ Release the file mapping of a lazily opened tri file. Morphs that are still 
+            only in the mapping are copied into memory first, so they remain usable.
+        """
+        if self._mmap is not None:
+            for m in self.morphs._morphs.values():
+                if isinstance(m, TriMorphOffsets) and isinstance(m.data, memoryview):
+                    mv = m.data
+                    m.data = mv.tobytes()
+                    mv.release()
+            self._mmap.close()
+            self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
     def error_write(self, text):
         self.error_write(text)
@@ -147,8 +282,8 @@ class TriFile():
     def read_morph(self, file):
         """ Reads a single morph from a tri file
             file = file object positioned at start of morph
-            returns = (morph-name, [(x,y,z), ...]) list of new vert positions defined by the 
-                morph
+            returns = (morph-name, TriMorphOffsets) offsets defined by the morph, still
+                packed
             """
         morph_index = len(self.morphs) 
         tmp_data = file.read(INT_LEN)
@@ -174,25 +309,30 @@ class TriFile():
         data = unpack('<f', tmp_data)
         baseDiff = data[0]
         
-        tmp_buffer = file.read(SHORT_LEN * 3 * self.header.vertexNum)
-        if len(tmp_buffer) < SHORT_LEN * 3 * self.header.vertexNum:
+        datalen = SHORT_LEN * 3 * self.header.vertexNum
+        if self._mmap is not None:
+            # Lazy: just remember where the morph is. It's decoded when it's used.
+            pos = file.tell()
+            if pos + datalen > len(self._mmap):
+                self.error_write("EOF reading morph data vertices\nError on morph number " + str(morph_index) + "\n  \"" + morphSubName + "\"\nMorph has valid header, but appears to be corrupt\nFile appears to be corrupt")
+                raise ValueError("Error reading TRI file")		
+            file.seek(pos + datalen)
+            return morphSubName, TriMorphOffsets(baseDiff, memoryview(self._mmap)[pos:pos+datalen])
+
+        tmp_buffer = file.read(datalen)
+        if len(tmp_buffer) < datalen:
             self.error_write("EOF reading morph data vertices\nError on morph number " + str(morph_index) + "\n  \"" + morphSubName + "\"\nMorph has valid header, but appears to be corrupt\nFile appears to be corrupt")
             raise ValueError("Error reading TRI file")		
 
-        morph_verts = [] 
-        for lidx in range(self.header.vertexNum):
-            data = unpack('<3h', tmp_buffer[SHORT_LEN * 3 * lidx : (SHORT_LEN*3*lidx) + (SHORT_LEN*3)]  )
-            morph_verts.append((self._vertices[lidx][0] + data[0] * baseDiff,
-                                self._vertices[lidx][1] + data[1] * baseDiff,
-                                self._vertices[lidx][2] + data[2] * baseDiff) )
-
-        return morphSubName, morph_verts
+        return morphSubName, TriMorphOffsets(baseDiff, tmp_buffer)
 
 
-    def read_modmorph(self, file, i, vertsAdd_Index, vertsAdd_list, vertsAdd_listLength, verts_list):
-        """ Reads a single mod morph from a tri file. Mod morphs only morph some of the vertices
+    def read_modmorph(self, file):
+        """ Reads a single mod morph header from a tri file. Mod morphs only morph some of 
+            the vertices. Their new positions are in the mod vertex list, in the same order
+            as the indices here.
             file = file object positioned at start of morph
-            returns = (morph-name, [(x,y,z), ...]) list of new vert positions defined by the morph
+            returns = (morph-name, [vert-index, ...]) indices of the verts changed by the morph
             """
         morph_index = len(self.modmorphs) 
 
@@ -217,35 +357,12 @@ class TriFile():
         data = unpack('<I', tmp_data)
         blockLength = data[0]
         
-        if blockLength > 0:
-            nextMorphVertIdx = 0
-            tmp_buffer = file.read(INT_LEN*blockLength)
-            if len(tmp_buffer) < INT_LEN*blockLength:
-                self.error_write("EOF reading MOD-morph data verticies\nError on MOD-morph number " + str(i+1) + "\n  \"" + morphSubName + "\"\nMorph has valid header, but appears to be corrupt\nFile appears to be corrupt")
-                raise ValueError("Error reading TRI file")	
-            data = unpack('<I', tmp_buffer[INT_LEN*nextMorphVertIdx:(INT_LEN*nextMorphVertIdx)+INT_LEN])
-            
-            nextMorphVertIdx += 1
-            
-            new_verts = []
-            for ii, nv in enumerate(self._vertices):
-                if (data[0] == ii) and (blockLength >= 0) and (vertsAdd_Index < vertsAdd_listLength):
-                    blockLength = blockLength - 1
-                    new_verts.append((vertsAdd_list[vertsAdd_Index][0],
-                                      vertsAdd_list[vertsAdd_Index][1],
-                                      vertsAdd_list[vertsAdd_Index][2] ))
-                    vertsAdd_Index += 1
-                    if blockLength > 0:
-                        data = unpack('<I', tmp_buffer[INT_LEN*nextMorphVertIdx:(INT_LEN*nextMorphVertIdx)+INT_LEN])
-                        nextMorphVertIdx += 1
-                else:
-                    new_verts.append(self._vertices[ii])
-        
-        #Else, the morph is the same as the base mesh? I think.
-        else:
-            for ii, nv in enumerate(mesh_key_verts):
-                new_verts.append((verts_list[ii][0], verts_list[ii][1], verts_list[ii][2]))
-        return morphName, new_verts
+        tmp_buffer = file.read(INT_LEN*blockLength)
+        if len(tmp_buffer) < INT_LEN*blockLength:
+            self.error_write("EOF reading MOD-morph data verticies\nError on MOD-morph number " + str(morph_index) + "\n  \"" + morphSubName + "\"\nMorph has valid header, but appears to be corrupt\nFile appears to be corrupt")
+            raise ValueError("Error reading TRI file")	
+
+        return morphSubName, list(unpack(f'<{blockLength}I', tmp_buffer))
 
 
     def read(self, file):
@@ -267,10 +384,7 @@ class TriFile():
                 + str(len(tmp_buffer)) + "\nTRI file has valid header, but file appears to be corrupt")
             raise ValueError("Error reading TRI file")
         
-        for i in range(self.header.vertexNum):
-            data = unpack('<3f', tmp_buffer[FLOAT_LEN * 3 * i : (FLOAT_LEN*3*i) + (FLOAT_LEN*3)])
-            verts_list.append((data[0], data[1], data[2]))
-
+        verts_list = list(iter_unpack('<3f', tmp_buffer))
         self._vertices = verts_list
 
         # "modvertice" = morph data sets, where each set need not contain data for every vertex in the mesh
@@ -281,9 +395,7 @@ class TriFile():
             errlog.error("\n----=| Tri Import Error |=----\nEOF reading mod-morph vertices\nShould read " + str(self.header.addVertexNum) + " mod verticies with\n" + str(FLOAT_LEN*3*header.addVertexNum) + " bytes but only read " + str(len(tmp_buffer)) + "\nTRI file has valid header, but file appears to be corrupt")
             raise ValueError("Error reading TRI file")
         
-        for i in range(self.header.addVertexNum):
-            data = unpack('<3f', tmp_buffer[FLOAT_LEN*3*i:(FLOAT_LEN*3*i)+(FLOAT_LEN*3)])
-            vertsAdd_list.append((data[0], data[1], data[2]))
+        vertsAdd_list = list(iter_unpack('<3f', tmp_buffer))
 
         # loading faces
         self._faces = []
@@ -292,9 +404,7 @@ class TriFile():
             errlog.error("\n----=| Tri Import Error |=----\nEOF reading model faces\nShould read " + str(self.header.faceNum) + " faces with\n" + str(INT_LEN*3*self.header.faceNum) + " bytes but only read " + str(len(tmp_buffer)) + "\nTRI file has valid header, but file appears to be corrupt")
             raise ValueError("Error reading TRI file")
 
-        for i in range(self.header.faceNum):
-            data = unpack('<3I', tmp_buffer[INT_LEN*3*i:(INT_LEN*3*i)+(INT_LEN*3)])
-            self.faces.append((data[0], data[1], data[2]))
+        self._faces = list(iter_unpack('<3I', tmp_buffer))
 
         numFaces = len(self._faces)
 
@@ -304,9 +414,7 @@ class TriFile():
             errlog.error("\n----=| Tri Import Error |=----\nEOF reading UV Coordinates\nShould read " + str(self.header.uvNum) + " UVs with \n" + str(FLOAT_LEN*2*self.header.uvNum) + " bytes but only read " + str(len(tmp_buffer)) + "\nTRI file has valid header, but file appears to be corrupt")
             raise ValueError("Error reading TRI file")
 
-        for i in range(self.header.uvNum):
-            data = unpack('<2f', tmp_buffer[FLOAT_LEN*2*i:(FLOAT_LEN*2*i)+(FLOAT_LEN*2)])
-            self.uv_pos.append((data[0], data[1])) # Inverting "V" to match what we get from nifs
+        self.uv_pos = list(iter_unpack('<2f', tmp_buffer))
 
         numUV = len(self.uv_pos)
 
@@ -334,14 +442,11 @@ class TriFile():
         ### Not currently using this, but Blender can do it. Since nifs have 1:1 relationship between vert and UV, skipping it.
         self.face_uvs = []
         if self.import_uv:
-            for lidx in range(numFaces):
-                data = unpack('<3I', tmp_buffer[INT_LEN*3*lidx:(INT_LEN*3*lidx)+(INT_LEN*3)])
-                self.face_uvs.append((data[0], data[1], data[2]))
-                #self.face_uvs.append([(self.uv_pos[data[0]][0], self.uv_pos[data[0]][1]),
-                #                      (self.uv_pos[data[1]][0], self.uv_pos[data[1]][1]),
-                #                      (self.uv_pos[data[2]][0], self.uv_pos[data[2]][1]) ])
+            self.face_uvs = list(iter_unpack('<3I', tmp_buffer))
+            #self.face_uvs = [[(self.uv_pos[i][0], self.uv_pos[i][1]) for i in f] 
+            #                 for f in self.face_uvs]
             
-        self.morphs = {}
+        self.morphs = TriMorphs(self)
         self.morphs['Basis'] = self._vertices
 
         # read morph data
@@ -350,21 +455,25 @@ class TriFile():
                 name, verts = self.read_morph(file)
                 self.morphs[name] = verts
 
-        self.modmorphs = {}
+        self.modmorphs = TriMorphs(self)
                 
-        # read additional morph data
-        if self.header.addMorphNum > 0:
-            vertsAdd_Index = 0
-            vertsAdd_listLength = len(vertsAdd_list)
-
-            for i in range(self.header.addMorphNum):
-                name, verts = self.read_modmorph(file)
-                self.modmorphs[name] = verts
+        # read additional morph data. Each mod morph uses the next block of mod vertices.
+        vertsAdd_Index = 0
+        for i in range(self.header.addMorphNum):
+            name, indices = self.read_modmorph(file)
+            if vertsAdd_Index + len(indices) > len(vertsAdd_list):
+                errlog.error(f"Not enough mod vertices for MOD-morph {name}: need {vertsAdd_Index + len(indices)}, have {len(vertsAdd_list)}\nFile appears to be corrupt")
+                raise ValueError("Error reading TRI file")
+            self.modmorphs[name] = TriModMorph(
+                indices, vertsAdd_list[vertsAdd_Index:vertsAdd_Index+len(indices)])
+            vertsAdd_Index += len(indices)
 
 
     @classmethod
-    def from_file(cls, filepath):
+    def from_file(cls, filepath, lazy=False):
         """ Read tris from the given file.
+            lazy = map the file into memory and only decode morphs when they are used.
+                The file stays mapped until close() is called.
             Returns a new TriFile with the file conents.
         """
         log = logging.getLogger("pynifly")
@@ -374,12 +483,19 @@ class TriFile():
         filename = os.path.basename(filepath)
         file = open(filepath,'rb')
         tri = TriFile()
+        tri.filepath = filepath
+        if lazy and os.path.getsize(filepath) > 0:
+            # The mapping reads like a file. It outlives the file handle.
+            tri._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            file.close()
+            file = tri._mmap
 
         # read header
         try:
             tri.header.read(file)
         except ValueError:
             file.close()
+            tri._mmap = None
             log.error("Cannot read header from file")
             return {'CANCELLED'}
 
@@ -394,11 +510,13 @@ class TriFile():
         try:
             tri.read(file)
         except ValueError:
+            tri.close()
             file.close()
             log.exception("Error importing Tri File")
             return {'CANCELLED'}		
 
-        file.close()
+        if tri._mmap is None:
+            file.close()
 
         return tri
 
@@ -435,6 +553,11 @@ class TriFile():
        
         self.header.str = VERSION_STRING
 
+        # Can't overwrite a file while it's mapped.
+        if self._mmap is not None and os.path.exists(filepath) \
+                and os.path.samefile(filepath, self.filepath):
+            self.close()
+
         ### NOT WORKING because I have to pass in loops ###
         #Mapping for re-order of verts to  match a 'sequential face list' index = vertex index, value = index to remap to
         #verts_reorder_mapping will be referenced everwhere in the script, just that only if re-rdering is selcted is the mapping not v#:v#
@@ -456,20 +579,12 @@ class TriFile():
         else:
             verts_reorder_mapping = range(len(self._vertices)) # [v_idx for v_idx, v in enumerate(verts)]
 
-        #Not a good idea to pack long strings repeatedly
-        modHeaderArrayToPack = []
-        modVerticeArrayToPack = []
-        morphKeysArrayToPack = []
-        morphKeysDiffValuesArrayToPack = []
-
-        modHeaderPacked		= b''	#string to collect the header data
-        modVerticePacked	= b''	#string to collect the vertice data
-        morphKeysPacked		= b''	#string to collect the morph key data to write
+        # Mapping is only needed if we're actually reordering
+        reorder_mapping = verts_reorder_mapping if self.reorder_verts else None
 
-        morphNameList =[] #Holds a list of previously processed morph names to check for duplicates
-        fullMorphNameList =[] #Only full morph names
-        modMorphNameList =[] #Only mod-morph names
-        
+        # Pack each section once, into a list of chunks. Concatenating bytes in a loop
+        # is quadratic in mesh size.
+        morphKeysPacked = []
         morphlist = set(self.morphs.keys())
         if export_morphs is not None:
             morphlist = morphlist.intersection(export_morphs)
@@ -477,140 +592,66 @@ class TriFile():
         self.header.morphNum = len(morphlist)
         for morphName in morphlist:
             #self.log.debug(f"..exporting morph {morphName}")
-            verts_diff = [[]] * len(self.vertices)		#list to save vertices to
-            max_diff = 0
-            fullMorphNameList.append(morphName)
-
-            #The TRI format saves the offset data in a 'normalized' form.  The largets
-            #difference is used as a factor to apply to all the offset values So, the
-            #largest difference needs to be found self.log.debug(f"Writing shape verts
-            #for {morphName} value is {type(self.morphs[morphName])}")
-            shape_verts = self.morphs[morphName]
-            vert_idx = 0
-
-            for nv, bv in zip(shape_verts, self.vertices):
-                data = (nv[0] - bv[0], nv[1] - bv[1], nv[2] - bv[2])
-                max_diff = max(abs(data[0]), abs(data[1]), abs(data[2]), max_diff)
-                verts_diff[verts_reorder_mapping[vert_idx]] = data
-                vert_idx = vert_idx + 1
-
-            #7fff=max signed integer value for 16 bits = 32767.  I guess, dunno why it was like
-            #this, but I like hex.  Frogs everywhere.
-            diff_base = max_diff / 0x7fff
-                
-            #If the diff is 0, then the morph and the base are identical.  That's fine,
-            #but the normalization factor shouldn't be 0!  Another way to do this would
-            #be to just set all the diff values to 0 in the loop below.  They should,
-            #indeed, all be 0 since v[0-2] will all be 0 since the difference calculated
-            #above was all exactly 0 or below precision of float.  This effectively adds
-            #a built-in floor to the amount of offset the export will allow, but I don't
-            #think rendering programs will genreally allow that level of precision
-            #anyway, heh
-            if diff_base == 0: 
-                diff_base = 1
-            
-            morphKeysDiffValuesArrayToPack.append( float(diff_base) )
-
-            for i in range(len(verts_diff)):
-                verts_diff[i] = (int(verts_diff[i][0]/diff_base), 
-                                 int(verts_diff[i][1]/diff_base),
-                                 int(verts_diff[i][2]/diff_base))
-
-            morphKeysArrayToPack.append( verts_diff.copy() )
+            name = morphName.encode("iso-8859-15")
+            morphKeysPacked.append(pack(f'<I{len(name)}sx', len(name)+1, name))
+            m = self.morphs._morphs[morphName]
+            if reorder_mapping is None and isinstance(m, TriMorphOffsets) \
+                    and len(m.data) == SHORT_LEN * 3 * len(self._vertices):
+                # Unchanged morph read from a file. Write it back as it was.
+                diff_base, data = m.scale, m.data
+            else:
+                diff_base, data = self._quantize_morph(self.morphs[morphName], reorder_mapping)
+            morphKeysPacked.append(pack('<f', diff_base))
+            morphKeysPacked.append(data)
 
         morphlist = set(self.modmorphs.keys())
         if export_morphs is not None:
             morphlist = morphlist.intersection(export_morphs)
 
+        modHeaderPacked = []    # For each mod-morph: name, vertex count, vertex indices
+        modVerticePacked = []   # Mod-morph vertex locations, in mod-morph order
         self.header.addMorphNum = 0
         self.header.addVertexNum = 0
         for morphName in morphlist:
             self.header.addMorphNum += 1
-            morphNameList.append(morphName)
-            modMorphNameList.append(morphName)
-            verticeCount 	= 0	 #keeps track of the number of vertices
-            verticeAdded	= 0	 #keeps track of the number of vertices which were actually added to the additional vertex list
-            
-            shape_verts = self.modmorphs[morphName]
-            for nv, mv in zip(shape_verts, self.vertices):
-                div = abs(nv[0] - mv[0]) + abs(nv[1] - mv[1]) + abs(nv[2] - mv[2]) / 3
-                if div > 0.00033:		#filter out the vertices which are too similiar to the base mesh
-                    data = [nv[0], nv[1], nv[2], verts_reorder_mapping[verticeCount]]
-                    verts_diff[verts_reorder_mapping[verticeCount]] = data.copy()
-                    self.header.addVertexNum += 1
-                    verticeAdded += 1
-                verticeCount += 1
-
-            modHeaderArrayToPack.append( [] )
-            modVerticeArrayToPack.append( [] )
-
-            modHeaderArrayToPack[self.header.addMorphNum-1].append( int(verticeAdded) )
-
-            # modHeaderPacked is the list of vertex indices referencing the base model
-            # array.  The index into this list is the same as the index into the list of
-            # actual mod vertices (modVerticePacked).  It indicates to which vertex in the
-            # base model the offset given in the modVerticePacked applies
-            for v in verts_diff:
-                if v != []:
-                    modHeaderArrayToPack[self.header.addMorphNum-1].append( int(v[3]) )
-                    modVerticeArrayToPack[self.header.addMorphNum-1].append( [float(v[0]), float(v[1]), float(v[2])] )
-
-
-        #Pack Morph
-        for morphNum, diffValue in enumerate(morphKeysDiffValuesArrayToPack):
-            morphKeysPacked += pack('<I'+ str(len(fullMorphNameList[morphNum])) +'sx', len(fullMorphNameList[morphNum])+1, fullMorphNameList[morphNum].encode("iso-8859-15") )
-            morphKeysPacked += pack('<f', diffValue)
-            morphKeysPacked += pack('<' + str(len(morphKeysArrayToPack[morphNum])*3) + 'h', *[k for j in morphKeysArrayToPack[morphNum] for k in j] )
-
-        #Pack Mod-Morph
-        for morphNum, headerArray in enumerate(modHeaderArrayToPack):
-            modHeaderPacked += pack('<I'+ str(len(modMorphNameList[morphNum])) +'sx', len(modMorphNameList[morphNum])+1, modMorphNameList[morphNum].encode("iso-8859-15") )
-            modHeaderPacked += pack('<I', headerArray[0] )
-            modHeaderPacked += pack('<' + str( len(headerArray)-1 ) + 'I', *headerArray[1:]  )
-            modVerticePacked += pack('<' + str(len(modVerticeArrayToPack[morphNum])*3) + 'f', *[k for j in modVerticeArrayToPack[morphNum] for k in j] )
 
+            # Only record the vertices which are different enough from the base mesh
+            indices, positions = self.modmorphs.sparse(morphName)
+            added = sorted((verts_reorder_mapping[i], nv) for i, nv in zip(indices, positions))
+            self.header.addVertexNum += len(added)
+
+            # The mod-morph header has the list of vertex indices referencing the base model
+            # array. The index into this list is the same as the index into the list of
+            # actual mod vertices. It indicates to which vertex in the base model the
+            # position given in the mod vertices applies.
+            name = morphName.encode("iso-8859-15")
+            modHeaderPacked.append(pack(f'<I{len(name)}sxI', len(name)+1, name, len(added)))
+            modHeaderPacked.append(pack(f'<{len(added)}I', *[i for i, nv in added]))
+            modVerticePacked.append(pack(f'<{len(added)*3}f', 
+                                         *chain.from_iterable(nv[0:3] for i, nv in added)))
 
         # anon says: I think I understand what the original script was doing, but not
         # entirely.  As far as I know, the uv should just be in the same order as the
         # vertices, vertex 1 has uv at index 1, and so forth.  The data will be
         # constructed the same way here.  There will always be numuv = num verts..  I
         # hope.
-        uvDataPacked = b''
-        uv_face_mapping = [(0,0,0) for f in self._faces]
-        #uv_gather = [(0.0, 0.0) for v in self._vertices]
-        for f_index, f in enumerate(self._faces):
-            v0 = verts_reorder_mapping[f[0]]
-            v1 = verts_reorder_mapping[f[1]]
-            v2 = verts_reorder_mapping[f[2]]
-            uv_face_mapping[f_index] = (v0, v1, v2)
-
-        for uv in self.uv_pos:
-            uvDataPacked += pack('<2f', float(uv[0]), 1.0-uv[1])
-
         self.header.uvNum = len(self.uv_pos)
+        uvDataPacked = pack(f'<{2*len(self.uv_pos)}f', 
+                            *chain.from_iterable((uv[0], 1.0-uv[1]) for uv in self.uv_pos))
 
-        # vertex packing
-        vertexDataPacked = b''
-        verts_to_pack = [[]] * len(self._vertices)
-        
-        # Reorder verts per our mapping
-        for i, v in enumerate(self._vertices):
-            verts_to_pack[verts_reorder_mapping[i]] = (v[0], v[1], v[2])
-
-        # Pack them in the new order
-        for vco in verts_to_pack:
-            tmp_data = pack('<3f', vco[0], vco[1], vco[2])
-            vertexDataPacked += tmp_data
+        # vertex packing, reordered per our mapping
+        vertexDataPacked = pack(f'<{3*len(self._vertices)}f', 
+                                *chain.from_iterable(v[0:3] for v in _reorder(self._vertices, reorder_mapping)))
     
-        # face packing
-        faceDataPacked = b''
-        for f in self.faces:
-            faceDataPacked += pack('<3I', 
-                verts_reorder_mapping[f[0]], verts_reorder_mapping[f[1]], verts_reorder_mapping[f[2]])
-
-        faceNumDataPacked = b''
-        for uv in uv_face_mapping:
-            faceNumDataPacked +=  pack('<3I', uv[0], uv[1], uv[2])
+        # face packing. The face UVs are the same as the faces because UVs are 1:1 with
+        # verts.
+        if reorder_mapping is None:
+            faceDataPacked = pack(f'<{3*len(self._faces)}I', 
+                                  *chain.from_iterable(f[0:3] for f in self._faces))
+        else:
+            faceDataPacked = pack(f'<{3*len(self._faces)}I', 
+                                  *[verts_reorder_mapping[i] for f in self._faces for i in f[0:3]])
+        faceNumDataPacked = faceDataPacked
 
         # start writing...
         try:
@@ -618,15 +659,61 @@ class TriFile():
         except:
             self.error_write(f"Error opening '{filepath}' as output file")
             raise
-        file.write(self.header.write()
-                        + vertexDataPacked
-                        + modVerticePacked
-                        + faceDataPacked
-                        + uvDataPacked
-                        + faceNumDataPacked
-                        + morphKeysPacked
-                        + modHeaderPacked)
-        file.close()
+        try:
+            file.write(self.header.write())
+            file.write(vertexDataPacked)
+            file.write(b''.join(modVerticePacked))
+            file.write(faceDataPacked)
+            file.write(uvDataPacked)
+            file.write(faceNumDataPacked)
+            file.write(b''.join(morphKeysPacked))
+            file.write(b''.join(modHeaderPacked))
+        finally:
+            file.close()
+
+
+    def _quantize_morph(self, shape_verts, reorder_mapping=None):
+        """ Turn a morph into the form stored in the tri file. 
+            shape_verts = [(x,y,z), ...] absolute vertex positions, 1:1 with vertices
+            reorder_mapping = new index for each vertex, or None to keep the order
+            returns (scale factor, packed offsets)
+        """
+        #The TRI format saves the offset data in a 'normalized' form.  The largest
+        #difference is used as a factor to apply to all the offset values.
+        if np is not None:
+            diffs = np.asarray(shape_verts, dtype=np.float64).reshape(-1, 3) \
+                - np.asarray(self._vertices, dtype=np.float64).reshape(-1, 3)
+            max_diff = float(np.abs(diffs).max()) if diffs.size else 0.0
+        else:
+            diffs = [(nv[0] - bv[0], nv[1] - bv[1], nv[2] - bv[2]) 
+                     for nv, bv in zip(shape_verts, self._vertices)]
+            max_diff = max((abs(c) for d in diffs for c in d), default=0.0)
+
+        #7fff=max signed integer value for 16 bits = 32767.  I guess, dunno why it was like
+        #this, but I like hex.  Frogs everywhere.
+        diff_base = max_diff / 0x7fff
+            
+        #If the diff is 0, then the morph and the base are identical.  That's fine,
+        #but the normalization factor shouldn't be 0!  This effectively adds
+        #a built-in floor to the amount of offset the export will allow, but I don't
+        #think rendering programs will genreally allow that level of precision
+        #anyway, heh
+        if diff_base == 0: 
+            diff_base = 1
+
+        # Offsets are truncated toward zero, like int()
+        if np is not None:
+            q = np.trunc(diffs / diff_base).astype('<i2')
+            if reorder_mapping is not None:
+                qr = np.empty_like(q)
+                qr[np.asarray(reorder_mapping)] = q
+                q = qr
+            return float(diff_base), q.tobytes()
+        else:
+            q = _reorder([(int(d[0]/diff_base), int(d[1]/diff_base), int(d[2]/diff_base)) 
+                          for d in diffs], 
+                         reorder_mapping)
+            return float(diff_base), pack(f'<{len(q)*3}h', *chain.from_iterable(q))
 
 
 # ###################################################################################
@@ -652,6 +739,10 @@ class TriFile():
 #               x, y, z - vert offsets
 #
 
+# One vertex offset in a TRIP morph: vert id, (x, y, z) scaled offsets
+TRIP_VERT_LEN = 8
+TRIP_VERT_DTYPE = np.dtype([('id', '<u2'), ('offs', '<i2', (3,))]) if np is not None else None
+
 class TripFile():
     def __init__(self):
         self.is_valid = False
@@ -680,11 +771,40 @@ class TripFile():
     def _coord_nonzero(self, coords):
         return abs(coords[0]) > 0.0001 or abs(coords[1]) > 0.0001 or abs(coords[2]) > 0.0001 
 
-    def _calc_max_offset(self, offslist):
-        m = 0.0
-        for i, o in offslist:
-            m = max(m, abs(o[0]), abs(o[1]), abs(o[2]))
-        return m
+    def _offset_list(self, ids, offsets):
+        """ Return [[vert-index, (offs x, offs y, offs z)], ...] for the offsets that 
+            aren't zero.
+            ids = vertex indices, 1:1 with offsets
+            offsets = (n, 3) array of offsets, or list of triples if numpy isn't available
+        """
+        if np is not None:
+            offsets = np.asarray(offsets, dtype=np.float64).reshape(-1, 3)
+            keep = (np.abs(offsets) > 0.0001).any(axis=1)
+            return [[i, tuple(o)] for i, o in zip(np.asarray(ids)[keep].tolist(), 
+                                                  offsets[keep].tolist())]
+        return [[i, tuple(o)] for i, o in zip(ids, offsets) if self._coord_nonzero(o)]
+
+    def _pack_morph(self, offslist):
+        """ Return (multiplier, packed vert records) for a list of 
+            [vert-index, (offs x, offs y, offs z)] 
+        """
+        if np is not None:
+            offsets = np.array([o[0:3] for i, o in offslist], dtype=np.float64).reshape(-1, 3)
+            maxoffs = float(np.abs(offsets).max()) if len(offslist) > 0 else 0.0
+        else:
+            maxoffs = max((abs(c) for i, o in offslist for c in o[0:3]), default=0.0)
+
+        scalefactor = 0x7fff / maxoffs if maxoffs > 0 else 1
+        if scalefactor < 0.0001: scalefactor = 1
+
+        if np is not None:
+            recs = np.empty(len(offslist), dtype=TRIP_VERT_DTYPE)
+            recs['id'] = [i for i, o in offslist]
+            recs['offs'] = np.trunc(offsets * scalefactor)
+            return 1/scalefactor, recs.tobytes()
+        return 1/scalefactor, b''.join(
+            pack('<1H3h', i, int(o[0] * scalefactor), int(o[1] * scalefactor), int(o[2] * scalefactor))
+            for i, o in offslist)
 
     def read(self, file):
         """ Read TRIP file 
@@ -712,14 +832,16 @@ class TripFile():
                 self.log.debug(f"....found morph {morphname}")
                 morphmult = unpack('<1f', file.read(4))[0] 
                 vertcount = unpack('<1H', file.read(2))[0]
-                morphverts = []
+                block = file.read(TRIP_VERT_LEN * vertcount)
 
-                for k in range(vertcount):
-                    id, x, y, z = unpack('<1H3h', file.read(8))
-
-                    v = (x * morphmult, y * morphmult, z * morphmult)
-                    if self._coord_nonzero(v):
-                        morphverts.append([id, v]) 
+                if np is not None:
+                    recs = np.frombuffer(block, dtype=TRIP_VERT_DTYPE)
+                    morphverts = self._offset_list(recs['id'], recs['offs'] * morphmult)
+                else:
+                    recs = list(iter_unpack('<1H3h', block))
+                    morphverts = self._offset_list(
+                        [r[0] for r in recs], 
+                        [(x * morphmult, y * morphmult, z * morphmult) for id, x, y, z in recs])
 
                 if True: # len(morphverts) > 0:
                     offsetmorphs[morphname] = morphverts # keep them all, even null morphs
@@ -735,18 +857,21 @@ class TripFile():
         Set the morphs property from a morph dictionary.
         * shapename = name of the shape the morphs are for
         * morphdict = { morph-name: [(x,y,z), ...], ...} - xyz coordinates are 1:1 with
-          vertlist
-        * vertlist = [(x,y,z), ...] - shape vertices
+          vertlist. May be (n, 3) arrays.
+        * vertlist = [(x,y,z), ...] - shape vertices. May be an (n, 3) array.
         """
+        if np is not None:
+            vertlist = np.asarray(vertlist, dtype=np.float64).reshape(-1, 3)
         offsetmorphs = {}
         for name, coords in morphdict.items():
             #self.log.debug(f"[TRIP] Writing morph {name}")
-            offsetlist = []
-            for i, coordpair in enumerate(zip(coords, vertlist)):
-                co, v = coordpair
-                offsets = (co[0] - v[0], co[1] - v[1], co[2] - v[2])
-                if self._coord_nonzero(offsets):
-                    offsetlist.append([i, offsets])
+            if np is not None:
+                offsets = np.asarray(coords, dtype=np.float64).reshape(-1, 3) - vertlist
+                offsetlist = self._offset_list(np.arange(len(offsets)), offsets)
+            else:
+                offsetlist = self._offset_list(
+                    range(len(vertlist)),
+                    [(co[0] - v[0], co[1] - v[1], co[2] - v[2]) for co, v in zip(coords, vertlist)])
             if len(offsetlist) > 0:
                 offsetmorphs[name] = offsetlist
         
@@ -756,32 +881,23 @@ class TripFile():
     def write(self, filepath):
         """ Write out the TRIP file """
         self.log.info(f"[TRIP] Writing TRIP file {filepath}")
-        file = open(filepath, 'wb')
-        try:
-            file.write(pack("<4s", b'PIRT'))
+        buf = io.BytesIO()
+        buf.write(pack("<4s", b'PIRT'))
 
-            file.write(pack('<1H', len(self.shapes))) 
-            for shapename, offsetmorphs in self.shapes.items():
-                self._write_count_str(file, shapename)
+        buf.write(pack('<1H', len(self.shapes))) 
+        for shapename, offsetmorphs in self.shapes.items():
+            self._write_count_str(buf, shapename)
 
-                file.write(pack("<1H", len(offsetmorphs)))
-                for name, offslist in offsetmorphs.items():
-                    #self.log.debug(f"....Writing morph {name}")
-                    self._write_count_str(file, name)
-            
-                    scalefactor = 0x7fff / self._calc_max_offset(offslist) 
-                    if scalefactor < 0.0001: scalefactor = 1
+            buf.write(pack("<1H", len(offsetmorphs)))
+            for name, offslist in offsetmorphs.items():
+                #self.log.debug(f"....Writing morph {name}")
+                self._write_count_str(buf, name)
+                mult, data = self._pack_morph(offslist)
+                buf.write(pack('<1f1H', mult, len(offslist)))
+                buf.write(data)
 
-                    file.write(pack('<1f', 1/scalefactor))
-                    file.write(pack('<1H', len(offslist)))
-
-                    for vert_idx, offsets in offslist:
-                        file.write(pack('<1H', vert_idx))
-                        file.write(pack('<3h', int(offsets[0] * scalefactor), 
-                                        int(offsets[1] * scalefactor), 
-                                        int(offsets[2] * scalefactor)))
-        finally:
-            file.close()
+        with open(filepath, 'wb') as file:
+            file.write(buf.getbuffer())
 
     @classmethod
     def from_file(cls, filepath):
@@ -820,6 +936,22 @@ if __name__ == "__main__":
         assert len(t.face_uvs) == t.header.faceNum, "Error should have expected number of face UVs"
         assert len(t.morphs) > 0, "Error: Should have morphs"
 
+        log.info("Morph offsets match absolute morph positions")
+        mname = list(t.morphs.keys())[5]
+        offs = t.morphs.offsets(mname)
+        mverts = t.morphs[mname]
+        assert len(offs) == len(t.vertices), "Error: Should have offsets for all verts"
+        for i in [0, 100, 1000]:
+            for j in range(3):
+                assert round(t.vertices[i][j] + offs[i][j], 4) == round(mverts[i][j], 4), \
+                    f"Error: Offsets should match morph: {offs[i]} != {mverts[i]} - {t.vertices[i]}"
+
+        log.info("Lazy read gives the same morphs")
+        with TriFile.from_file(os.path.join(test_path, "FO4/CheetahMaleHead.tri"), lazy=True) as tlazy:
+            assert len(tlazy.morphs) == len(t.morphs), "Error: Should have same morphs"
+            assert tlazy.morphs[mname] == t.morphs[mname], "Error: Morph should not change"
+        assert tlazy.morphs[mname] == t.morphs[mname], "Error: Morph should survive close"
+
         log.info("Write tri back out again")
         t2 = TriFile()
         t2.vertices = t.vertices.copy()
@@ -840,6 +972,17 @@ if __name__ == "__main__":
         assert len(t3.morphs) == len(t.morphs), "Error: Morphs should not change"
         assert t3.vertices[5] == t.vertices[5], "Error: Vertices should not change"
 
+        log.info("Mod morphs round trip as sparse morphs")
+        modverts = list(t.vertices)
+        modverts[3] = (modverts[3][0] + 1, modverts[3][1], modverts[3][2])
+        modverts[10] = (modverts[10][0], modverts[10][1] + 1, modverts[10][2])
+        t2.modmorphs["ModTest"] = modverts
+        t2.write(os.path.join(test_path, "Out/CheetahMaleHeadMod.tri"))
+        t3mod = TriFile.from_file(os.path.join(test_path, "Out/CheetahMaleHeadMod.tri"))
+        assert t3mod.modmorphs.sparse("ModTest")[0] == [3, 10], "Error: Mod morph should move 2 verts"
+        assert t3mod.modmorphs["ModTest"][4] == t3mod.vertices[4], "Error: Other verts not moved"
+        assert round(t3mod.modmorphs.offsets("ModTest")[10][1], 4) == 1.0, "Error: Vert moved"
+
         log.debug("TODO: Tests of UV positions fail--not sure why, they seem to work")
         #assert uv_near_eq(t3.uv_pos[5], t.uv_pos[5]), f"Error, UVs should not change: expected {str(t.uv_pos[5])}, got {str(t3.uv_pos[5])}"
         #assert t3.uv_pos[50] == t.uv_pos[50], "Error, UVs should not change"
@@ -865,5 +1008,15 @@ if __name__ == "__main__":
         assert t4.shapes["BaseMaleBody:0"]['BTTHinCalf'][5][1] == t5.shapes["BaseMaleBody:0"]['BTTHinCalf'][5][1], \
             f"Error: Expected same offsets: expected { t4.offsetmorphs['BTTHinCalf'][5][1]}, found {t5.offsetmorphs['BTTHinCalf'][5][1]}"
 
+        log.info("Set TRIP morphs from vertex lists")
+        t6 = TripFile()
+        verts = [(float(i), 0.0, 0.0) for i in range(100)]
+        t6.set_morphs("Shape", {"Morph": [(x, y + (1.0 if i % 10 == 0 else 0.0), z) 
+                                          for i, (x, y, z) in enumerate(verts)],
+                                "Null": verts}, 
+                      verts)
+        assert len(t6.shapes["Shape"]["Morph"]) == 10, f"Error: Expected only moved verts"
+        assert t6.shapes["Shape"]["Morph"][1] == [10, (0.0, 1.0, 0.0)], f"Error: Expected offsets"
+        assert "Null" not in t6.shapes["Shape"], f"Error: Null morphs not kept"
 
         print("DONE")